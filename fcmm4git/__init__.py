@@ -4,5 +4,5 @@
 from fcmm4git import fcmm_git_cmd
 
 __all__ = [
-    'fcmm', 'fcmm_git_cmd'
+    'fcmm', 'fcmm_git_cmd', 'fcmm_api'
 ]
\ No newline at end of file
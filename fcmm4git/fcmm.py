@@ -17,7 +17,10 @@ import traceback
 from snakerlib.generic import FileTools, ExceptionTools, RunTools
 from snakerlib.prompt_plus import PromptPlus
 from fcmm_git_cmd import FCMMGitCmd
-import git
+from fcmm_prefetch import FCMMPrefetch
+from fcmm_ref_index import FCMMRefIndex, FCMMRefCompleter
+from fcmm_profiler import FCMMProfiler
+from fcmm_tools import FCMMTools
 
 
 __MOUDLE__ = 'fcmm'  # 模块名
@@ -46,11 +49,25 @@ def prompt_comm_fun(message='', cmd='', cmd_para='', with_returncode=False):
     try:
         config_cmd_para = RunTools.get_global_var('config_cmd_para')
         if cmd in config_cmd_para.keys():
-            # 执行FCMM命令
-            back_obj = FCMMGitCmd.main_cmd_fun(cmd=cmd, cmd_para=cmd_para)
+            # 执行FCMM命令（cd命令会修改会话的工作目录，执行后重新获取）
+            prefetch = RunTools.get_global_var('prefetch')
+            if prefetch is None:
+                back_obj = run_fcmm_cmd(
+                    cmd=cmd, cmd_para=cmd_para, work_dir=RunTools.get_global_var('work_dir'))
+            else:
+                # 等待正在生效的预获取完成，执行后（释放锁前）通知预获取线程当前目录
+                with prefetch.lock:
+                    back_obj = run_fcmm_cmd(
+                        cmd=cmd, cmd_para=cmd_para, work_dir=RunTools.get_global_var('work_dir'))
+                    prefetch.notify(RunTools.get_global_var('work_dir'))
+            if RunTools.get_global_var('interactive'):
+                # 更新参数自动完成的索引
+                RunTools.get_global_var('ref_index').update_from_repo(
+                    RunTools.get_global_var('work_dir'))
         else:
-            # 执行其他命令
-            res = subprocess.run(('%s %s' % (cmd, cmd_para)).rstrip(' '), shell=True)
+            # 执行其他命令（在会话的工作目录执行）
+            res = subprocess.run(('%s %s' % (cmd, cmd_para)).rstrip(' '), shell=True,
+                                 cwd=RunTools.get_global_var('work_dir'))
             back_obj = [res.returncode, '']
     except Exception as e:
         back_obj[0] = -1
@@ -63,6 +80,32 @@ def prompt_comm_fun(message='', cmd='', cmd_para='', with_returncode=False):
         return back_obj[1]
 
 
+def run_fcmm_cmd(cmd='', cmd_para='', work_dir=None):
+    """
+    执行FCMM命令，参数中带有--profile（或配置了profile.enable）时进行性能分析
+
+    @param {string} cmd='' - 要执行的命令
+    @param {string} cmd_para='' - 命令参数
+    @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
+
+    @returns {list} - 执行结果[returncode, msgstring]
+        returncode - 0代表成功，其他代表失败
+        msgstring - 要返回显示的内容
+    """
+    config = RunTools.get_global_var('config')
+    para_list = cmd_para.split(' ')
+    is_profile = (config['profile']['enable'] == 'true' or '--profile' in para_list)
+    if not is_profile:
+        return FCMMGitCmd.main_cmd_fun(cmd=cmd, cmd_para=cmd_para, work_dir=work_dir)
+
+    cmd_para = ' '.join([_para for _para in para_list if _para != '--profile'])
+    back_obj, file_prefix = FCMMProfiler.run(
+        config['profile']['path'], cmd, FCMMGitCmd.main_cmd_fun, cmd=cmd, cmd_para=cmd_para,
+        work_dir=work_dir)
+    FCMMTools.echo('profile saved: %s.pstats, %s.collapsed' % (file_prefix, file_prefix))
+    return back_obj
+
+
 def load_fcmm_config():
     """
     装载fcmm的程序启动参数，返回参数JSON对象
@@ -77,6 +120,7 @@ def load_fcmm_config():
 def cmd_para_init(config):
     """
     根据输入参数初始化命令交互参数(将一些非字符串对象初始化)
+    分支名、版本号参数的候选值不放入参数配置，由FCMMRefCompleter通过引用名索引按前缀补全
 
     @param {dict} config - 从配置文件获取到的json对象
 
@@ -104,16 +148,25 @@ def fcmm_init():
     # 获取启动参数
     config = load_fcmm_config()
 
-    # 处理真实路径（在其他路径被调用的情况不会找错位置）
+    # 处理真实路径（相对路径基于fcmm所在目录，在其他路径被调用的情况不会找错位置）
     fcmm_path = os.path.split(os.path.realpath(inspect.getfile(inspect.currentframe())))[0]
-    temp_str = os.getcwd()
-    os.chdir(fcmm_path)
     config['fcmm_path'] = fcmm_path
-    config['temp_path'] = os.path.realpath(config['temp_path'])
-    config['backup_path'] = os.path.realpath(config['backup_path'])
-    os.chdir(temp_str)
+    config['temp_path'] = os.path.realpath(os.path.join(fcmm_path, config['temp_path']))
+    config['backup_path'] = os.path.realpath(os.path.join(fcmm_path, config['backup_path']))
+    config['mirror_cache']['path'] = os.path.realpath(
+        os.path.join(fcmm_path, config['mirror_cache']['path']))
+    # 共享对象库被本机的本地仓库通过alternates引用，默认放在用户目录下（支持~），不随fcmm的临时目录清理
+    config['shared_store']['path'] = os.path.realpath(
+        os.path.join(fcmm_path, os.path.expanduser(config['shared_store']['path'])))
+    config['metrics']['file'] = os.path.realpath(os.path.join(fcmm_path, config['metrics']['file']))
+    config['profile']['path'] = os.path.realpath(os.path.join(fcmm_path, config['profile']['path']))
+    # 大文件存储保存以指针提交的文件内容，同样默认放在用户目录下，不随fcmm的临时目录清理
+    config['large_file']['store_path'] = os.path.realpath(
+        os.path.join(fcmm_path, os.path.expanduser(config['large_file']['store_path'])))
 
     RunTools.set_global_var('config', config)  # 设置到全局变量中
+    # 交互会话的工作目录（cd命令修改该目录，不改变进程的当前目录）
+    RunTools.set_global_var('work_dir', os.getcwd())
 
     # 创建临时目录
     with ExceptionTools.ignored((FileExistsError)):
@@ -127,9 +180,15 @@ def fcmm_init():
             RunTools.set_global_var('backup_path', config['backup_path'])
 
     # 初始化命令行参数
+    ref_index = FCMMRefIndex()
+    RunTools.set_global_var('ref_index', ref_index)
+    RunTools.set_global_var('interactive', False)
     config_cmd_para = cmd_para_init(config)
     RunTools.set_global_var('config_cmd_para', config_cmd_para)
 
+    # 后台预获取线程，只在命令交互模式启动
+    RunTools.set_global_var('prefetch', None)
+
 
 def fcmm_run():
     """
@@ -140,26 +199,41 @@ def fcmm_run():
     config = RunTools.get_global_var('config')
     config_cmd_para = RunTools.get_global_var('config_cmd_para')
 
-    # 处理命令行参数
-    argv_count = len(sys.argv)
-    if argv_count == 1:
+    # 处理命令行参数，--profile可以放在任意位置
+    argv = [_arg for _arg in sys.argv[1:] if _arg != '--profile']
+    if len(argv) < len(sys.argv) - 1:
+        config['profile']['enable'] = 'true'
+    if len(argv) == 0:
         # 没有带任何参数，直接进入命令行方式
+        RunTools.set_global_var('interactive', True)
+        ref_index = RunTools.get_global_var('ref_index')
+        ref_index.update_from_repo(RunTools.get_global_var('work_dir'))
+        prefetch = None
+        if config['prefetch']['enable'] == 'true':
+            prefetch = FCMMPrefetch(
+                RunTools.get_global_var('work_dir'), interval=float(config['prefetch']['interval']), ref_index=ref_index)
+            RunTools.set_global_var('prefetch', prefetch)
+            prefetch.start()
         _prompt = PromptPlus(
             message='FCMM>',
             default='',  # 默认输入值
             cmd_para=config_cmd_para,  # 命令定义参数
-            default_dealfun=prompt_comm_fun  # 默认处理函数
+            default_dealfun=prompt_comm_fun,  # 默认处理函数
+            completer=FCMMRefCompleter(
+                config['cmd_para'], FCMMRefCompleter.get_ref_para(config), ref_index)  # 自动完成
         )
         # 执行命令行
         _prompt.start_prompt_service(
             tips=config['tips'],
             is_async=False
         )
+        if prefetch is not None:
+            prefetch.stop()
     else:
         # 直接按参数执行
-        cmd_para_str = ' '.join(sys.argv[2:])
+        cmd_para_str = ' '.join(argv[1:])
         back_obj = prompt_comm_fun(
-            message='', cmd=sys.argv[1], cmd_para=cmd_para_str, with_returncode=True)
+            message='', cmd=argv[0], cmd_para=cmd_para_str, with_returncode=True)
         print(back_obj[1])
         exit(back_obj[0])
 
@@ -167,36 +241,4 @@ def fcmm_run():
 if __name__ == '__main__':
     # 当程序自己独立运行时执行的操作
     # 初始化命令行并启动
-    # fcmm_run()
-
-    # repo = git.Repo(r'C:/Users/hi.li/Desktop/opensource/fcmm4git')
-    # repo = git.Repo(r'D:/dev/github/test')
-    repo = git.Repo(r'C:\Users\hi.li\Desktop\opensource\fcmm4git')
-    # repo = git.Repo(r'C:/Users/hi.li/Desktop/opensource/fcmm4git-unittest')
-    print(repo.branches[0].name)
-    print(repo.branches[0].commit.tree[1])
-
-    """
-    print(repo.is_dirty())
-    print(repo.tags[0].name)
-    print(type(repo.tags[0].commit))
-    print(str(repo.tags[0].commit))
-    print(repo.branches[0].name)
-    print(repo.branches[0].commit)
-    print(repo.remotes[0].name)
-    print(repo.remotes[0].url)
-    print(repo.active_branch.name)
-    print(repo.config)
-    """
-
-    """
-    res = subprocess.run('hahha', shell=True)
-    print('returncode:%s\n%s\n%s' % (res.returncode, res.stdout, res.stderr))
-
-    res = subprocess.run("hahha1", shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    print('returncode:%s\nstdout: %s\nstderr: %s' %
-          (res.returncode, res.stdout.decode(sys.getfilesystemencoding()),
-           res.stderr.decode(encoding='GBK')))
-
-    print(u'测试')
-    """
+    fcmm_run()
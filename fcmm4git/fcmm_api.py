@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+FCMM的嵌入调用接口，供其他Python程序在进程内直接执行FCMM命令并获取结构化的执行结果
+@module fcmm_api
+@file fcmm_api.py
+"""
+
+import os
+from git.refs.reference import Reference
+from git.refs.symbolic import SymbolicReference
+from snakerlib.generic import RunTools
+import fcmm
+from fcmm_tools import FCMMTools
+from fcmm_git_cmd import FCMMGitCmd
+from fcmm_repo_session import RepoSession
+from fcmm_metrics import FCMMMetrics
+
+
+__MOUDLE__ = 'fcmm_api'  # 模块名
+__DESCRIPT__ = 'FCMM的嵌入调用接口'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = '黎慧剑'  # 作者
+__PUBLISH__ = '2018.07.19'  # 发布日期
+
+
+class FCMMResult(object):
+    """
+    FCMM命令的执行结果
+    """
+
+    __slots__ = ('cmd', 'work_dir', 'returncode', 'msg', 'refs_changed', 'backups', 'timings',
+                 'push_count')
+
+    def __init__(self, cmd, work_dir, returncode, msg):
+        """
+        构造函数
+
+        @param {string} cmd - 执行的命令
+        @param {string} work_dir - 仓库工作目录
+        @param {int} returncode - 返回码，0代表成功，其他代表失败
+        @param {string} msg - 命令返回的显示内容（失败时为错误信息）
+        """
+        self.cmd = cmd
+        self.work_dir = work_dir
+        self.returncode = returncode
+        self.msg = msg
+        # 本地仓库发生变化的引用，key为引用全名（例如refs/heads/master），
+        # value为(原对象id, 新对象id)，新增的引用原对象id为None，删除的引用新对象id为None
+        self.refs_changed = dict()
+        # 执行期间生成的备份，备份分支为分支名（tb-bak-*），备份文件为文件路径
+        self.backups = list()
+        # 耗时（秒），total为总耗时，其他为各阶段（sync/backup/branch/push/maintain）的耗时
+        self.timings = dict()
+        # 推送次数
+        self.push_count = 0
+
+    @property
+    def success(self):
+        """
+        是否执行成功
+
+        @property {bool}
+        """
+        return self.returncode == 0
+
+    def __repr__(self):
+        return 'FCMMResult(cmd=%r, returncode=%d, refs_changed=%d, backups=%d, total=%.3fs)' % (
+            self.cmd, self.returncode, len(self.refs_changed), len(self.backups),
+            self.timings.get('total', 0.0))
+
+
+class FCMMApi(object):
+    """
+    FCMM的嵌入调用接口类
+    每个命令对应一个函数，参数通过关键字传入，执行过程不打印任何信息（只影响调用线程），返回FCMMResult；
+    命令在work_dir指定的仓库执行，不改变进程的当前目录，不同仓库的命令可以在多个线程中同时执行
+    """
+
+    @staticmethod
+    def setup():
+        """
+        初始化FCMM运行环境（装载fcmm.json，已初始化时不重复处理），各命令函数会自动调用
+
+        @decorators staticmethod
+        """
+        if RunTools.get_global_var('config') is None:
+            fcmm.fcmm_init()
+
+    @staticmethod
+    def run(cmd, para=None, work_dir=None):
+        """
+        执行FCMM命令
+
+        @decorators staticmethod
+
+        @param {string} cmd - 命令，例如add-dev
+        @param {dict} para=None - 命令参数，key为长参数名（不带-），value为参数值，
+            True代表只有参数名的开关参数，None、False及''代表不传入该参数
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
+
+        @returns {FCMMResult} - 执行结果
+        """
+        FCMMApi.setup()
+        work_dir = os.path.realpath(os.getcwd() if work_dir is None else work_dir)
+        dict_cmd_para = dict()
+        if para is not None:
+            for _key, _value in para.items():
+                if _value is None or _value is False or _value == '':
+                    continue
+                dict_cmd_para['-' + _key] = '' if _value is True else str(_value)
+        cmd_para = ' '.join(
+            [('%s %s' % (_key, _value)).rstrip(' ') for _key, _value in dict_cmd_para.items()])
+
+        old_refs = FCMMApi._get_refs(work_dir)
+        is_quiet = FCMMTools.is_quiet()
+        FCMMTools.set_quiet(True)
+        try:
+            back_obj = FCMMGitCmd.main_cmd_fun(
+                cmd=cmd, cmd_para=cmd_para, work_dir=work_dir, dict_cmd_para=dict_cmd_para)
+        finally:
+            FCMMTools.set_quiet(is_quiet)
+        new_refs = FCMMApi._get_refs(work_dir)
+
+        result = FCMMResult(cmd, work_dir, back_obj[0], back_obj[1])
+        for _ref in sorted(set(old_refs.keys()) | set(new_refs.keys())):
+            _old = old_refs.get(_ref)
+            _new = new_refs.get(_ref)
+            if _old != _new:
+                result.refs_changed[_ref] = (_old, _new)
+                if _old is None and _ref.startswith('refs/heads/tb-bak-'):
+                    result.backups.append(_ref[len('refs/heads/'):])
+        record = FCMMMetrics.last_run()
+        if record is not None and record['cmd'] == cmd:
+            result.backups.extend(record['backups'])
+            result.timings = dict(record['phases'])
+            result.timings['total'] = record['duration']
+            result.push_count = record['push']
+        return result
+
+    @staticmethod
+    def _get_refs(work_dir):
+        """
+        获取本地仓库的全部引用（直接读取引用文件，不启动git进程）
+
+        @decorators staticmethod
+
+        @param {string} work_dir - 仓库工作目录
+
+        @returns {dict} - key为引用全名，value为引用指向的对象id，不是git仓库时返回空字典
+        """
+        refs = dict()
+        repo = RepoSession.get(work_dir).repo
+        if repo is None:
+            return refs
+        for _ref in Reference.iter_items(repo, common_path='refs'):
+            try:
+                refs[_ref.path] = SymbolicReference.dereference_recursive(repo, _ref.path)
+            except ValueError:
+                # 引用在读取过程中被删除，或是指向不存在引用的符号引用
+                continue
+        return refs
+
+    #############################
+    # 命令函数
+    #############################
+
+    @staticmethod
+    def init(url, base='local', version='', force=False, reset=False, nopkg=False,
+             shared=False, large='', work_dir=None):
+        """
+        初始化FCMM版本库，@see init命令
+
+        @decorators staticmethod
+
+        @param {string} url - 远程git服务的url
+        @param {string} base='local' - 初始化的原始版本基于本地（local）还是远程（remote）
+        @param {string} version='' - 当前版本库的版本
+        @param {bool} force=False - 是否强制初始化
+        @param {bool} reset=False - 仅针对local模式，是否用本地的git信息覆盖服务器
+        @param {bool} nopkg=False - 是否不建立lb-pkg分支
+        @param {bool} shared=False - 本地仓库是否加入本机的共享对象库
+        @param {string} large='' - 超过阈值的二进制文件的处理方式，lfs/reject/none，不传入代表使用fcmm.json的配置
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
+
+        @returns {FCMMResult} - 执行结果
+        """
+        return FCMMApi.run('init', {
+            'url': url, 'base': base, 'version': version, 'force': force, 'reset': reset,
+            'nopkg': nopkg, 'shared': shared, 'large': large
+        }, work_dir=work_dir)
+
+    @staticmethod
+    def add_pkg(version='', force=False, work_dir=None):
+        """
+        新增pkg分支，@see add-pkg命令
+
+        @decorators staticmethod
+
+        @param {string} version='' - 新增分支获取的master版本，不传入代表master最新的版本
+        @param {bool} force=False - 分支已存在时是否强制重建
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
+
+        @returns {FCMMResult} - 执行结果
+        """
+        return FCMMApi.run('add-pkg', {'version': version, 'force': force}, work_dir=work_dir)
+
+    @staticmethod
+    def release(version, tag='', force=False, work_dir=None):
+        """
+        定版发布，@see release命令
+
+        @decorators staticmethod
+
+        @param {string} version - 要发布的版本号
+        @param {string} tag='' - 发布master历史中指定的commit标签的版本，不传入代表master最新的提交
+        @param {bool} force=False - 版本号不大于已有的最新版本号时是否强制发布
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
+
+        @returns {FCMMResult} - 执行结果
+        """
+        return FCMMApi.run('release', {
+            'version': version, 'tag': tag, 'force': force
+        }, work_dir=work_dir)
+
+    @staticmethod
+    def add_cfg(name, bare=False, clone='', force=False, work_dir=None):
+        """
+        新增配置分支，@see add-cfg命令
+
+        @decorators staticmethod
+
+        @param {string} name - 配置分支的标识名
+        @param {bool} bare=False - 是否创建空白分支
+        @param {string} clone='' - 从其他配置分支复制，值为其他配置分支的标识名；与bare必须传入其中一个
+        @param {bool} force=False - 分支已存在时是否强制重建
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
+
+        @returns {FCMMResult} - 执行结果
+        """
+        return FCMMApi.run('add-cfg', {'name': name, 'bare': bare, 'clone': clone, 'force': force},
+                           work_dir=work_dir)
+
+    @staticmethod
+    def add_dev(name, dev_type, clone='', version='', tag='', force=False, work_dir=None):
+        """
+        新增开发分支，@see add-dev命令
+
+        @decorators staticmethod
+
+        @param {string} name - 开发分支的标识名
+        @param {string} dev_type - 分支类型，req/fix/feat
+        @param {string} clone='' - 从其他开发分支复制，值为其他开发分支的"类型-标识名"
+        @param {string} version='' - 从master/lb-pkg的指定版本创建
+        @param {string} tag='' - 从指定的commit标签创建
+        @param {bool} force=False - 分支已存在时是否强制重建
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
+
+        @returns {FCMMResult} - 执行结果
+        """
+        return FCMMApi.run('add-dev', {
+            'name': name, 'type': dev_type, 'clone': clone, 'version': version, 'tag': tag,
+            'force': force
+        }, work_dir=work_dir)
+
+    @staticmethod
+    def add_temp(name='', bare=False, force=False, work_dir=None):
+        """
+        新增开发者临时分支，@see add-temp命令
+
+        @decorators staticmethod
+
+        @param {string} name='' - 开发者名称，不传入从git config中获取
+        @param {bool} bare=False - 是否创建空白分支
+        @param {bool} force=False - 分支已存在时是否强制重建
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
+
+        @returns {FCMMResult} - 执行结果
+        """
+        return FCMMApi.run('add-temp', {'name': name, 'bare': bare, 'force': force},
+                           work_dir=work_dir)
+
+    @staticmethod
+    def rollback(name='', version='', tag='', force=False, work_dir=None):
+        """
+        将分支回退到指定版本，@see rollback命令
+
+        @decorators staticmethod
+
+        @param {string} name='' - 分支完整标识，不传入代表当前工作分支
+        @param {string} version='' - 要回退到的版本号
+        @param {string} tag='' - 要回退到的commit标签，与version互斥
+        @param {bool} force=False - 是否允许回退master和定版分支
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
+
+        @returns {FCMMResult} - 执行结果
+        """
+        return FCMMApi.run('rollback', {
+            'name': name, 'version': version, 'tag': tag, 'force': force
+        }, work_dir=work_dir)
+
+    @staticmethod
+    def check(name='', source='', version='', tag='', all_branch=False, work_dir=None):
+        """
+        检查分支的基础版本，@see check命令
+
+        @decorators staticmethod
+
+        @param {string} name='' - 检查分支完整标识，不传入代表当前工作分支
+        @param {string} source='' - 比较分支的完整标识，不传入代表master，lb-pkg分支
+        @param {string} version='' - 比较分支的指定版本号
+        @param {string} tag='' - 比较分支的指定commit标签，与version互斥
+        @param {bool} all_branch=False - 是否检查全部tb-*分支
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
+
+        @returns {FCMMResult} - 执行结果
+        """
+        return FCMMApi.run('check', {
+            'name': name, 'source': source, 'version': version, 'tag': tag, 'all': all_branch
+        }, work_dir=work_dir)
+
+    @staticmethod
+    def merge(dest='', source='', version='', tag='', force=False, work_dir=None):
+        """
+        合并分支，@see merge命令
+
+        @decorators staticmethod
+
+        @param {string} dest='' - 合并目标分支的完整标识，不传入代表当前工作分支
+        @param {string} source='' - 合并来源分支的完整标识，不传入代表master，lb-pkg分支
+        @param {string} version='' - 合并来源的指定版本号
+        @param {string} tag='' - 合并来源的指定commit标签，与version互斥
+        @param {bool} force=False - 是否允许合并到master和定版分支
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
+
+        @returns {FCMMResult} - 执行结果
+        """
+        return FCMMApi.run('merge', {
+            'dest': dest, 'source': source, 'version': version, 'tag': tag, 'force': force
+        }, work_dir=work_dir)
+
+    @staticmethod
+    def status(refresh=False, work_dir=None):
+        """
+        获取分支拓扑，@see status命令
+
+        @decorators staticmethod
+
+        @param {bool} refresh=False - 是否忽略已有索引重新生成
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
+
+        @returns {FCMMResult} - 执行结果
+        """
+        return FCMMApi.run('status', {'refresh': refresh}, work_dir=work_dir)
+
+    @staticmethod
+    def diff(from_version, to_version='', refresh=False, work_dir=None):
+        """
+        显示两个版本之间的差异，@see diff命令
+
+        @decorators staticmethod
+
+        @param {string} from_version - 比较的起始版本号
+        @param {string} to_version='' - 比较的结束版本号，不传入代表lb-pkg（没有lb-pkg时为master）的最新提交
+        @param {bool} refresh=False - 是否忽略已有缓存重新计算
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
+
+        @returns {FCMMResult} - 执行结果
+        """
+        return FCMMApi.run('diff', {
+            'from': from_version, 'to': to_version, 'refresh': refresh
+        }, work_dir=work_dir)
+
+    @staticmethod
+    def maintain(force=False, dry=False, store=False, work_dir=None):
+        """
+        按阈值维护仓库，@see maintain命令
+
+        @decorators staticmethod
+
+        @param {bool} force=False - 是否忽略阈值执行全部维护任务
+        @param {bool} dry=False - 是否只获取度量值及要执行的维护任务，不实际执行
+        @param {bool} store=False - 是否同时对本机的全部共享对象库进行gc
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
+
+        @returns {FCMMResult} - 执行结果
+        """
+        return FCMMApi.run('maintain', {'force': force, 'dry': dry, 'store': store},
+                           work_dir=work_dir)
+
+
+if __name__ == '__main__':
+    # 当程序自己独立运行时执行的操作
+    # 打印版本信息
+    print(('模块名：%s  -  %s\n'
+           '作者：%s\n'
+           '发布日期：%s\n'
+           '版本：%s' % (__MOUDLE__, __DESCRIPT__, __AUTHOR__, __PUBLISH__, __VERSION__)))
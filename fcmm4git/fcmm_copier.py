@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+FCMM并行文件复制模块，通过线程池及内核复制（copy_file_range/sendfile）复制目录
+@module fcmm_copier
+@file fcmm_copier.py
+"""
+
+import os
+import re
+import time
+import shutil
+import stat
+from concurrent.futures import ThreadPoolExecutor
+
+
+__MOUDLE__ = 'fcmm_copier'  # 模块名
+__DESCRIPT__ = 'FCMM并行文件复制'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = '黎慧剑'  # 作者
+__PUBLISH__ = '2018.07.19'  # 发布日期
+
+
+class FCMMCopier(object):
+    """
+    FCMM并行文件复制类
+    通过os.scandir遍历目录（目录在遍历时创建），文件提交到线程池复制，
+    复制优先使用copy_file_range，其次sendfile，都不支持时使用缓冲读写；复制后保留文件权限及修改时间
+    """
+
+    # 每次内核复制的最大字节数
+    _chunk_size = 64 * 1024 * 1024
+
+    @staticmethod
+    def copy_file(src_file, dest_file):
+        """
+        复制单个文件（保留权限及修改时间，符号链接复制为符号链接）
+
+        @decorators staticmethod
+
+        @param {string} src_file - 源文件
+        @param {string} dest_file - 目标文件
+
+        @returns {int} - 复制的字节数
+        """
+        src_stat = os.lstat(src_file)
+        if os.path.lexists(dest_file):
+            os.remove(dest_file)
+        if stat.S_ISLNK(src_stat.st_mode):
+            os.symlink(os.readlink(src_file), dest_file)
+            return 0
+
+        size = src_stat.st_size
+        with open(src_file, 'rb') as fsrc, open(dest_file, 'wb') as fdest:
+            copied = FCMMCopier._copy_by_kernel(fsrc.fileno(), fdest.fileno(), size)
+            if copied < size:
+                # 内核复制不可用（或中途失败），从失败位置开始缓冲复制
+                fsrc.seek(copied)
+                fdest.seek(copied)
+                fdest.truncate()
+                shutil.copyfileobj(fsrc, fdest, 1024 * 1024)
+        os.chmod(dest_file, stat.S_IMODE(src_stat.st_mode))
+        os.utime(dest_file, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+        return size
+
+    @staticmethod
+    def _copy_by_kernel(src_fd, dest_fd, size):
+        """
+        通过copy_file_range或sendfile在内核中复制文件内容
+
+        @decorators staticmethod
+
+        @param {int} src_fd - 源文件描述符
+        @param {int} dest_fd - 目标文件描述符
+        @param {int} size - 文件大小
+
+        @returns {int} - 已复制的字节数
+        """
+        copied = 0
+        for _fun_name in ('copy_file_range', 'sendfile'):
+            _fun = getattr(os, _fun_name, None)
+            if _fun is None:
+                continue
+            try:
+                while copied < size:
+                    if _fun_name == 'copy_file_range':
+                        _count = _fun(src_fd, dest_fd, min(FCMMCopier._chunk_size, size - copied))
+                    else:
+                        _count = _fun(dest_fd, src_fd, copied,
+                                      min(FCMMCopier._chunk_size, size - copied))
+                    if _count == 0:
+                        break
+                    copied = copied + _count
+                return copied
+            except OSError:
+                # 不支持（例如跨文件系统或平台不支持），尝试下一种方式
+                if copied > 0:
+                    return copied
+        return copied
+
+    @staticmethod
+    def copy_all_with_path(src_path, dest_path, regex_str='', workers=8):
+        """
+        并行复制目录下的所有文件及子目录（与FileTools.copy_all_with_path的参数含义一致）
+
+        @decorators staticmethod
+
+        @param {string} src_path - 源目录
+        @param {string} dest_path - 目标目录，不存在时创建
+        @param {string} regex_str='' - 源目录第一级文件及目录名的匹配正则表达式，只复制匹配的内容，
+            例如'^(?!\\.git$)'代表不复制.git目录，为空代表全部复制
+        @param {int} workers=8 - 复制线程数
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 复制的统计信息（文件数、字节数、耗时及吞吐量）
+        """
+        begin_time = time.time()
+        pattern = None
+        if regex_str != '':
+            pattern = re.compile(regex_str)
+        os.makedirs(dest_path, exist_ok=True)
+
+        # 遍历目录，目录在遍历时创建，文件提交到线程池复制
+        dir_list = list()
+        future_list = list()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            stack = [(src_path, dest_path, True)]
+            while len(stack) > 0:
+                _src_dir, _dest_dir, _is_top = stack.pop()
+                with os.scandir(_src_dir) as it:
+                    for _entry in it:
+                        if _is_top and pattern is not None and pattern.match(_entry.name) is None:
+                            continue
+                        _dest = os.path.join(_dest_dir, _entry.name)
+                        if _entry.is_dir(follow_symlinks=False):
+                            os.makedirs(_dest, exist_ok=True)
+                            dir_list.append((_entry.path, _dest))
+                            stack.append((_entry.path, _dest, False))
+                        else:
+                            future_list.append(
+                                executor.submit(FCMMCopier.copy_file, _entry.path, _dest))
+
+        total_size = 0
+        for _future in future_list:
+            # 有复制失败的情况抛出异常
+            total_size = total_size + _future.result()
+
+        # 子目录的权限及修改时间在文件复制完成后处理（从最深的目录开始）
+        for _src_dir, _dest_dir in reversed(dir_list):
+            _stat = os.stat(_src_dir)
+            os.chmod(_dest_dir, stat.S_IMODE(_stat.st_mode))
+            os.utime(_dest_dir, ns=(_stat.st_atime_ns, _stat.st_mtime_ns))
+
+        use_time = max(time.time() - begin_time, 0.000001)
+        return [0, 'copy %d files (%.1f MB) in %.3fs: %.1f MB/s' % (
+            len(future_list), total_size / 1048576, use_time, total_size / 1048576 / use_time)]
+
+
+if __name__ == '__main__':
+    # 当程序自己独立运行时执行的操作
+    # 打印版本信息
+    print(('模块名：%s  -  %s\n'
+           '作者：%s\n'
+           '发布日期：%s\n'
+           '版本：%s' % (__MOUDLE__, __DESCRIPT__, __AUTHOR__, __PUBLISH__, __VERSION__)))
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+FCMM版本差异缓存模块，计算两个提交之间的文件差异统计及提交摘要，并按提交对缓存
+@module fcmm_diff_cache
+@file fcmm_diff_cache.py
+"""
+
+import os
+import glob
+import json
+from fcmm_tools import FCMMTools
+
+
+__MOUDLE__ = 'fcmm_diff_cache'  # 模块名
+__DESCRIPT__ = 'FCMM版本差异缓存'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = '黎慧剑'  # 作者
+__PUBLISH__ = '2018.07.19'  # 发布日期
+
+
+class FCMMDiffCache(object):
+    """
+    FCMM版本差异缓存类
+    差异直接比较两个提交的目录树（不检出），每个(起始提交, 结束提交)对的结果保存为缓存目录下的一个json文件，
+    文件名为"起始提交_结束提交_提交数.json"，查找可复用的范围时只需列出文件名，无需装载缓存内容；
+    计算较大的范围A..C时，如果存在已缓存的相邻范围A..B或B..C（B在A和C之间），只计算剩余的范围后合并：
+        提交摘要 - A..C的提交为A..B与B..C的提交之和，直接拼接
+        文件差异 - 只在一个范围中修改的文件，其差异与A..C一致直接使用；两个范围都修改的文件才重新比较
+    """
+
+    # 重新比较指定文件时每个git命令传入的文件数
+    PATH_BATCH_SIZE = 200
+
+    @staticmethod
+    def get_cache_file(cache_path, from_commit, to_commit, commit_count):
+        """
+        获取提交对的缓存文件路径
+
+        @decorators staticmethod
+
+        @param {string} cache_path - 缓存目录
+        @param {string} from_commit - 起始提交
+        @param {string} to_commit - 结束提交
+        @param {int} commit_count - 范围内的提交数
+
+        @returns {string} - 缓存文件路径
+        """
+        return os.path.join(cache_path, '%s_%s_%d.json' % (from_commit, to_commit, commit_count))
+
+    @staticmethod
+    def load(cache_path, from_commit, to_commit):
+        """
+        装载已缓存的差异
+
+        @decorators staticmethod
+
+        @param {string} cache_path - 缓存目录
+        @param {string} from_commit - 起始提交
+        @param {string} to_commit - 结束提交
+
+        @returns {dict} - 差异信息，@see FCMMDiffCache.compute，没有缓存（或缓存文件损坏）返回None
+        """
+        file_list = glob.glob(os.path.join(cache_path, '%s_%s_*.json' % (from_commit, to_commit)))
+        if len(file_list) == 0:
+            return None
+        cache_file = file_list[0]
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                return json.loads(f.read())
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def save(cache_path, diff_info):
+        """
+        保存差异到缓存（先写临时文件再替换，只读命令并行执行时不会读到写了一半的文件）
+
+        @decorators staticmethod
+
+        @param {string} cache_path - 缓存目录
+        @param {dict} diff_info - 差异信息，@see FCMMDiffCache.compute
+        """
+        if not os.path.exists(cache_path):
+            os.makedirs(cache_path, exist_ok=True)
+        cache_file = FCMMDiffCache.get_cache_file(
+            cache_path, diff_info['from'], diff_info['to'], len(diff_info['commits']))
+        FCMMTools.save_to_json_file(cache_file, diff_info, atomic=True)
+
+    @staticmethod
+    def cached_pairs(cache_path):
+        """
+        获取已缓存的全部提交对
+
+        @decorators staticmethod
+
+        @param {string} cache_path - 缓存目录
+
+        @returns {list} - 提交对清单[(from_commit, to_commit, commit_count), ...]
+        """
+        pair_list = list()
+        if not os.path.exists(cache_path):
+            return pair_list
+        for _name in os.listdir(cache_path):
+            if not _name.endswith('.json'):
+                continue
+            _items = _name[0:-5].split('_')
+            if len(_items) == 3 and _items[2].isdigit():
+                pair_list.append((_items[0], _items[1], int(_items[2])))
+        return pair_list
+
+    @staticmethod
+    def diff_files(work_dir, from_commit, to_commit, path_list=None):
+        """
+        比较两个提交的目录树，获取文件差异统计（不检测重命名，重命名按删除及新增统计）
+
+        @decorators staticmethod
+
+        @param {string} work_dir - 仓库工作目录
+        @param {string} from_commit - 起始提交
+        @param {string} to_commit - 结束提交
+        @param {string[]} path_list=None - 只比较指定的文件，不传入代表比较全部文件
+
+        @returns {dict} - 文件差异，获取失败返回None，格式为
+            {'文件路径': ['修改类型A/M/D/T', 新增行数, 删除行数], ...}，二进制文件的行数为-1
+        """
+        cmd_args = ['git', 'diff', '--no-renames', '--no-ext-diff', '--raw', '--numstat', '-z',
+                    from_commit, to_commit]
+        if path_list is None:
+            cmd_list = [cmd_args]
+        else:
+            # 按批次通过参数列表传入文件（不经过shell，文件名无需转义），避免超过命令行长度限制
+            cmd_list = list()
+            for _pos in range(0, len(path_list), FCMMDiffCache.PATH_BATCH_SIZE):
+                cmd_list.append(cmd_args + ['--'] + [
+                    ':(literal)%s' % (_path)
+                    for _path in path_list[_pos: _pos + FCMMDiffCache.PATH_BATCH_SIZE]
+                ])
+        items = list()
+        for _cmd in cmd_list:
+            res = FCMMTools.run_sys_cmd_with_output(_cmd, cwd=work_dir)
+            if res[0] != 0:
+                return None
+            items.extend(res[1].split('\0'))
+
+        # -z格式：先输出":mode mode sha sha 类型\0路径\0"，再输出"新增\t删除\t路径\0"
+        files = dict()
+        pos = 0
+        while pos < len(items):
+            _item = items[pos]
+            if _item.startswith(':'):
+                files[items[pos + 1]] = [_item.split(' ')[-1], -1, -1]
+                pos += 2
+                continue
+            _stat = _item.split('\t', 2)
+            if len(_stat) == 3 and _stat[2] in files.keys():
+                files[_stat[2]][1] = -1 if _stat[0] == '-' else int(_stat[0])
+                files[_stat[2]][2] = -1 if _stat[1] == '-' else int(_stat[1])
+            pos += 1
+        return files
+
+    @staticmethod
+    def log_commits(work_dir, from_commit, to_commit):
+        """
+        获取两个提交之间的提交摘要（to_commit可达而from_commit不可达的提交）
+
+        @decorators staticmethod
+
+        @param {string} work_dir - 仓库工作目录
+        @param {string} from_commit - 起始提交
+        @param {string} to_commit - 结束提交
+
+        @returns {list} - 提交摘要清单（从新到旧），获取失败返回None，
+            格式为[['commit id', '提交日期', '作者', '提交信息'], ...]
+        """
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git log --format=%%H%%x09%%ad%%x09%%an%%x09%%s --date=short %s..%s' % (
+                from_commit, to_commit),
+            cwd=work_dir)
+        if res[0] != 0:
+            return None
+        return [_line.split('\t', 3) for _line in res[1].splitlines() if _line != '']
+
+    @staticmethod
+    def compute(work_dir, from_commit, to_commit):
+        """
+        直接计算两个提交的差异
+
+        @decorators staticmethod
+
+        @param {string} work_dir - 仓库工作目录
+        @param {string} from_commit - 起始提交
+        @param {string} to_commit - 结束提交
+
+        @returns {dict} - 差异信息，获取失败返回None，格式为
+            {
+                'from': '起始提交', 'to': '结束提交',
+                'commits': [提交摘要], @see FCMMDiffCache.log_commits
+                'files': {文件差异}, @see FCMMDiffCache.diff_files
+            }
+        """
+        files = FCMMDiffCache.diff_files(work_dir, from_commit, to_commit)
+        commits = FCMMDiffCache.log_commits(work_dir, from_commit, to_commit)
+        if files is None or commits is None:
+            return None
+        return {'from': from_commit, 'to': to_commit, 'commits': commits, 'files': files}
+
+    @staticmethod
+    def compose(work_dir, left, right):
+        """
+        合并两个相邻范围的差异（left为A..B，right为B..C，B在A和C之间）
+
+        @decorators staticmethod
+
+        @param {string} work_dir - 仓库工作目录
+        @param {dict} left - A..B的差异信息
+        @param {dict} right - B..C的差异信息
+
+        @returns {dict} - A..C的差异信息，获取失败返回None
+        """
+        files = dict()
+        overlap_list = list()
+        for _path, _stat in left['files'].items():
+            if _path in right['files'].keys():
+                overlap_list.append(_path)
+            else:
+                files[_path] = _stat
+        for _path, _stat in right['files'].items():
+            if _path not in left['files'].keys():
+                files[_path] = _stat
+        if len(overlap_list) > 0:
+            # 两个范围都修改的文件重新比较（可能已改回原内容，此时不在结果中）
+            overlap_files = FCMMDiffCache.diff_files(
+                work_dir, left['from'], right['to'], path_list=overlap_list)
+            if overlap_files is None:
+                return None
+            files.update(overlap_files)
+        return {
+            'from': left['from'], 'to': right['to'],
+            'commits': right['commits'] + left['commits'], 'files': files
+        }
+
+    @staticmethod
+    def find_middle(cache_path, from_commit, to_commit, is_ancestor):
+        """
+        查找可以复用的已缓存相邻范围（起始于from_commit或结束于to_commit，且中间提交在两者之间）
+
+        @decorators staticmethod
+
+        @param {string} cache_path - 缓存目录
+        @param {string} from_commit - 起始提交
+        @param {string} to_commit - 结束提交
+        @param {function} is_ancestor - 判断祖先关系的函数，fun(ancestor, commit)返回bool
+
+        @returns {string} - 中间提交，优先选择覆盖提交数最多的缓存范围，没有可复用的范围返回None
+        """
+        middle = None
+        max_count = -1
+        for _from, _to, _count in FCMMDiffCache.cached_pairs(cache_path):
+            if _from == _to:
+                # 零长度的范围无法缩小待计算的范围（复用会导致无限递归）
+                continue
+            if _from == from_commit and _to != to_commit:
+                _middle = _to
+            elif _to == to_commit and _from != from_commit:
+                _middle = _from
+            else:
+                continue
+            if _middle in (from_commit, to_commit):
+                continue
+            if _count <= max_count:
+                continue
+            if is_ancestor(from_commit, _middle) and is_ancestor(_middle, to_commit):
+                middle = _middle
+                max_count = _count
+        return middle
+
+    @staticmethod
+    def get(work_dir, cache_path, from_commit, to_commit, is_ancestor, refresh=False):
+        """
+        获取两个提交的差异（优先使用缓存，其次复用相邻的缓存范围，最后直接计算），结果保存到缓存
+
+        @decorators staticmethod
+
+        @param {string} work_dir - 仓库工作目录
+        @param {string} cache_path - 缓存目录
+        @param {string} from_commit - 起始提交
+        @param {string} to_commit - 结束提交
+        @param {function} is_ancestor - 判断祖先关系的函数，fun(ancestor, commit)返回bool
+        @param {bool} refresh=False - 是否忽略缓存重新计算
+
+        @returns {list} - 执行结果[diff_info, source]
+            diff_info - 差异信息，@see FCMMDiffCache.compute，获取失败为None
+            source - 结果来源，cached-缓存，composed-由缓存范围合并，computed-直接计算
+        """
+        if from_commit == to_commit:
+            # 零长度的范围不缓存也不参与合并，直接计算（结果为空）
+            return [FCMMDiffCache.compute(work_dir, from_commit, to_commit), 'computed']
+
+        if not refresh:
+            diff_info = FCMMDiffCache.load(cache_path, from_commit, to_commit)
+            if diff_info is not None:
+                return [diff_info, 'cached']
+            middle = FCMMDiffCache.find_middle(cache_path, from_commit, to_commit, is_ancestor)
+            if middle is not None:
+                left = FCMMDiffCache.get(work_dir, cache_path, from_commit, middle, is_ancestor)[0]
+                right = FCMMDiffCache.get(work_dir, cache_path, middle, to_commit, is_ancestor)[0]
+                diff_info = None
+                if left is not None and right is not None:
+                    diff_info = FCMMDiffCache.compose(work_dir, left, right)
+                if diff_info is not None:
+                    FCMMDiffCache.save(cache_path, diff_info)
+                return [diff_info, 'composed']
+
+        diff_info = FCMMDiffCache.compute(work_dir, from_commit, to_commit)
+        if diff_info is not None:
+            FCMMDiffCache.save(cache_path, diff_info)
+        return [diff_info, 'computed']
+
+
+if __name__ == '__main__':
+    # 当程序自己独立运行时执行的操作
+    # 打印版本信息
+    print(('模块名：%s  -  %s\n'
+           '作者：%s\n'
+           '发布日期：%s\n'
+           '版本：%s' % (__MOUDLE__, __DESCRIPT__, __AUTHOR__, __PUBLISH__, __VERSION__)))
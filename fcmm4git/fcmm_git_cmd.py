@@ -8,11 +8,22 @@ FCMM针对Git的命令处理
 """
 
 import os
+import time
 import datetime
 import traceback
 from snakerlib.generic import RunTools, FileTools
 from fcmm_tools import FCMMTools
 from fcmm_git_tools import FCMMGitTools
+from fcmm_repo_session import RepoSession
+from fcmm_lock import FCMMRepoLock
+from fcmm_mirror_cache import FCMMMirrorCache
+from fcmm_shared_store import FCMMSharedStore
+from fcmm_copier import FCMMCopier
+from fcmm_metrics import FCMMMetrics
+from fcmm_maintain import FCMMMaintain
+from fcmm_version_index import FCMMVersionIndex
+from fcmm_diff_cache import FCMMDiffCache
+from fcmm_large_file import FCMMLargeFile
 
 
 __MOUDLE__ = 'fcmm_git_cmd'  # 模块名
@@ -28,14 +39,18 @@ class FCMMGitCmd(object):
     """
 
     @staticmethod
-    def main_cmd_fun(cmd='', cmd_para=''):
+    def main_cmd_fun(cmd='', cmd_para='', work_dir=None, dict_cmd_para=None):
         """
         主含函数入口，所有命令都是走这个函数进行处理
+        命令只在指定的工作目录执行，不会改变进程的当前目录，不同仓库的命令可以在多个线程中同时执行；
+        执行后可通过FCMMMetrics.last_run获取本次执行的记录
 
         @decorators staticmethod
 
         @param {string} cmd='' - 命令
         @param {string} cmd_para='' - 参数字符串
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
+        @param {dict} dict_cmd_para=None - 参数字典，传入时不再解析cmd_para（参数值可以包含空格）
 
         @returns {list} - 执行结果[returncode, msgstring]
             returncode - 0代表成功，其他代表失败
@@ -48,21 +63,76 @@ class FCMMGitCmd(object):
             'help': FCMMGitCmd.cmd_help,
             'init': FCMMGitCmd.cmd_init,
             'add-pkg': FCMMGitCmd.cmd_add_pkg,
+            'release': FCMMGitCmd.cmd_release,
+            'add-cfg': FCMMGitCmd.cmd_add_cfg,
             'add-dev': FCMMGitCmd.cmd_add_dev,
             'add-temp': FCMMGitCmd.cmd_add_temp,
             'rollback': FCMMGitCmd.cmd_rollback,
-            'check': FCMMGitCmd.cmd_check
+            'check': FCMMGitCmd.cmd_check,
+            'merge': FCMMGitCmd.cmd_merge,
+            'status': FCMMGitCmd.cmd_status,
+            'diff': FCMMGitCmd.cmd_diff,
+            'stats': FCMMGitCmd.cmd_stats,
+            'maintain': FCMMGitCmd.cmd_maintain
         }
+        config = RunTools.get_global_var('config')
+        if work_dir is None:
+            work_dir = os.getcwd()
+        work_dir = os.path.realpath(work_dir)
+        # 远程仓库快照超过有效期的需重新获取（交互模式有后台预获取时按预获取的有效期判断）
+        ttl = float(config['remote_refs_ttl'])
+        if RunTools.get_global_var('prefetch') is not None:
+            ttl = max(ttl, float(config['prefetch']['max_age']))
+        FCMMGitTools.expire_remote_ref_snapshot(ttl)
+        # 本地仓库可能已被其他进程修改，仓库会话的本地缓存失效
+        session = RepoSession.get_cached(work_dir)
+        if session is not None:
+            session.invalidate()
+        is_record = (cmd not in ('help', 'cd', 'stats'))
+        if is_record:
+            FCMMMetrics.begin_run(cmd)
         try:
-            dict_cmd_para = FCMMTools.split_cmd_para(cmd_para)
+            if dict_cmd_para is None:
+                dict_cmd_para = FCMMTools.split_cmd_para(cmd_para)
             if 'h' in dict_cmd_para.keys() or 'help' in dict_cmd_para.keys():
                 # 只是返回帮助文档
                 back_obj = FCMMGitCmd.cmd_help({"cmd": ""})
-            else:
+            elif cmd in ('help', 'stats'):
                 back_obj = switch[cmd](dict_cmd_para)
+            elif cmd == 'cd':
+                back_obj = switch[cmd](dict_cmd_para, work_dir)
+            else:
+                # 获取仓库的排他锁：不修改远程仓库的命令也会更新本地分支（按远程快照同步master/lb-pkg）、
+                # 获取远程分支及写入fcmm4git数据目录，不能与其他命令并行处理同一仓库
+                repo_lock = FCMMRepoLock(
+                    os.path.join(config['temp_path'], 'locks'), work_dir,
+                    shared=False, timeout=float(config['lock_timeout'])
+                )
+                if not repo_lock.acquire():
+                    # 在finally中按失败记录本次执行
+                    back_obj = [1, FCMMTools.get_i18n_tips(config, 'repo_locked', work_dir)]
+                    return back_obj
+                try:
+                    back_obj = switch[cmd](dict_cmd_para, work_dir)
+                    if (back_obj[0] == 0 and cmd not in config['readonly_cmd'] and
+                            cmd != 'maintain' and config['maintain']['auto'] == 'true'):
+                        # 修改仓库的命令执行成功后，按阈值自动维护
+                        FCMMGitCmd.auto_maintain(config, work_dir)
+                finally:
+                    repo_lock.release()
         except Exception as e:
             back_obj[0] = -1
             back_obj[1] = 'execute "%s %s" error : \n%s' % (cmd, cmd_para, traceback.format_exc())
+        finally:
+            if cmd not in config['readonly_cmd']:
+                # 可能修改了远程仓库，快照失效
+                FCMMGitTools.clear_remote_ref_snapshot(work_dir)
+            if is_record:
+                # 结束执行记录，开启性能指标时汇总到指标文件
+                FCMMMetrics.end_run(
+                    back_obj[0],
+                    config['metrics']['file'] if config['metrics']['enable'] == 'true' else None,
+                    os.path.join(config['temp_path'], 'locks'))
 
         return back_obj
 
@@ -71,7 +141,7 @@ class FCMMGitCmd(object):
     #############################
 
     @staticmethod
-    def cmd_common_init(cmd_str='', dict_cmd_para=None):
+    def cmd_common_init(cmd_str='', dict_cmd_para=None, work_dir=None):
         """
         通用命令前期通用处理
         具体处理的内容包括：
@@ -84,6 +154,7 @@ class FCMMGitCmd(object):
         @decorators staticmethod
 
         @param {dict} dict_cmd_para=None - 参数字典
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
 
         @returns {tuple} - 返回多个值的数组，按顺序如下
             is_exit {bool} - 标识是否应直接，不进行后续的处理
@@ -92,7 +163,7 @@ class FCMMGitCmd(object):
                 msgstring - 要返回显示的内容
             config {dict} - 获取到的全局参数config
             fcmm_config {dict} - 获取到的.fcmm4git配置信息
-            repo_info {dict} - 获取到的本地仓库信息
+            repo_info {RepoSession} - 获取到的本地仓库会话
             current_branch {string} - 当前本地工作分支
 
         """
@@ -107,66 +178,127 @@ class FCMMGitCmd(object):
 
         # 本地仓库信息检查
         config = RunTools.get_global_var('config')
-        repo_info = FCMMGitTools.get_repo_info(os.getcwd())
-        fcmm_config = FCMMTools.get_fcmm_config(repo_info['work_dir'])
-        if repo_info['repo'] is None or fcmm_config is None:
+        repo_info = FCMMGitTools.get_repo_info(os.getcwd() if work_dir is None else work_dir)
+        fcmm_config = repo_info.get_fcmm_config()
+        if repo_info.repo is None or fcmm_config is None:
             return (True, [2, FCMMTools.get_i18n_tips(config, 'local_git_error')], None, None, None, None)
 
         # 检查当前分支是否存在未提交信息
-        if FCMMGitTools.is_dirty(repo_info):
+        start_time = time.time()
+        is_dirty = FCMMGitTools.is_dirty(
+            repo_info,
+            scope=config['dirty_check']['scope'],
+            untracked_cache=(config['dirty_check']['untracked_cache'] == 'true'),
+            fsmonitor=config['dirty_check']['fsmonitor']
+        )
+        FCMMTools.echo('check dirty state: %.3fs' % (time.time() - start_time))
+        if is_dirty:
             return (True, [2, FCMMTools.get_i18n_tips(config, 'current_branch_is_dirty')], None, None, None, None)
 
-        # 下载最新的master分支
+        # 更新master分支的最新版本（通过远程快照判断，无需切换分支）
         current_branch = FCMMGitTools.get_active_branch(repo_info)
-        try:
-            res = FCMMTools.run_sys_cmd_list([
-                'git checkout master',
-                'git pull origin master'
-            ])
-            if res[0] != 0:
-                return (True, [res[0], FCMMTools.get_i18n_tips(config, 'execute_fail')], None, None, None, None)
-            fcmm_config = FCMMTools.get_fcmm_config(repo_info['work_dir'])
-            if fcmm_config is None:
-                return (True, [2, FCMMTools.get_i18n_tips(config, 'local_git_error')], None, None, None, None)
-
-            # 判断是否有版本分支
-            if fcmm_config['has_pkg'] == "true":
-                # 要下载版本分支，绑定与本地版本分支的关系
-                res = FCMMGitTools.get_remote_branch(repo_info, 'lb-pkg')
+        if FCMMGitTools.get_remote_ref_snapshot(repo_info) is None:
+            return (True, [1, FCMMTools.get_i18n_tips(config, 'remote_refs_fail')], None, None, None, None)
+        res = FCMMGitTools.get_remote_branch(repo_info, 'master')
+        if res[0] != 0:
+            return (True, [res[0], FCMMGitCmd.get_remote_branch_fail_tips(
+                config, res, 'master', FCMMTools.get_i18n_tips(config, 'execute_fail'))],
+                None, None, None, None)
+        fcmm_config = FCMMGitTools.get_fcmm_config_by_branch(repo_info, 'master')
+        if fcmm_config is None:
+            return (True, [2, FCMMTools.get_i18n_tips(config, 'local_git_error')], None, None, None, None)
 
-                # 处理结果
-                if res[0] != 0:
-                    return (True, [res[0], FCMMTools.get_i18n_tips(config, 'execute_fail')], None, None, None, None)
+        # 判断是否有版本分支
+        if fcmm_config['has_pkg'] == "true":
+            # 要下载版本分支，绑定与本地版本分支的关系
+            res = FCMMGitTools.get_remote_branch(repo_info, 'lb-pkg')
 
-        finally:
-            # 最后尝试跳转回工作分支
-            FCMMTools.run_sys_cmd('git checkout %s' % (current_branch))
+            # 处理结果
+            if res[0] != 0:
+                return (True, [res[0], FCMMGitCmd.get_remote_branch_fail_tips(
+                    config, res, 'lb-pkg', FCMMTools.get_i18n_tips(config, 'execute_fail'))],
+                    None, None, None, None)
 
         # 最后返回
         return (False, [0, ''], config, fcmm_config, repo_info, current_branch)
 
+    @staticmethod
+    def get_remote_branch_fail_tips(config, res, branch, tips):
+        """
+        获取FCMMGitTools.get_remote_branch执行失败时的提示信息
+        本地分支有未推送的提交且远程分支已被改写时返回具体的提示，其他情况返回默认的提示
+
+        @decorators staticmethod
+
+        @param {dict} config - 全局参数config
+        @param {list} res - get_remote_branch的执行结果
+        @param {string} branch - 分支名
+        @param {string} tips - 默认的提示信息
+
+        @returns {string} - 提示信息
+        """
+        if res[0] == 3:
+            return FCMMTools.get_i18n_tips(config, 'local_branch_diverged', branch)
+        return tips
+
+    @staticmethod
+    def auto_maintain(config, work_dir):
+        """
+        按阈值自动维护仓库（在时间预算内执行，维护失败不影响命令的执行结果）
+
+        @decorators staticmethod
+
+        @param {dict} config - 全局参数config
+        @param {string} work_dir - 仓库工作目录
+        """
+        repo_info = FCMMGitTools.get_repo_info(work_dir)
+        if repo_info.repo is None:
+            return
+        try:
+            res = FCMMMaintain.run(
+                work_dir, repo_info.repo.common_dir, config['maintain'],
+                time_budget=float(config['maintain']['time_budget']))
+        except Exception as e:
+            FCMMTools.echo('auto maintain error : \n%s' % (traceback.format_exc()))
+            return
+        finally:
+            repo_info.invalidate()
+        if res[1].find('\n') > 0:
+            # 有执行维护任务
+            FCMMTools.echo('auto maintain:\n%s' % (res[1]))
+
     #############################
     # 具体命令处理函数
     #############################
 
     @staticmethod
-    def cmd_cd(dict_cmd_para=None):
+    def cmd_cd(dict_cmd_para=None, work_dir=None):
         """
         切换目录命令，为了适应cd命令无效的问题
+        只修改交互会话的工作目录（全局变量work_dir），不改变进程的当前目录
 
         @decorators staticmethod
 
         @param {dict} dict_cmd_para=None - 参数字典
+        @param {string} work_dir=None - 会话当前的工作目录
 
         @returns {list} - 执行结果[returncode, msgstring]
             returncode - 0代表成功，其他代表失败
-            msgstring - 要返回显示的内容
+            msgstring - 切换后的工作目录
         """
+        if work_dir is None:
+            work_dir = os.getcwd()
         if len(dict_cmd_para) > 0:
-            # 带参数，修改路径
-            os.chdir(sorted(dict_cmd_para.keys())[0])
+            # 带参数，修改路径（相对路径基于会话当前的工作目录）
+            new_dir = os.path.realpath(os.path.join(
+                work_dir, os.path.expanduser(sorted(dict_cmd_para.keys())[0])))
+            if not os.path.isdir(new_dir):
+                config = RunTools.get_global_var('config')
+                return [1, FCMMTools.get_i18n_tips(config, 'path_not_exists', new_dir)]
+            work_dir = new_dir
+            RunTools.set_global_var('work_dir', work_dir)
 
-        return FCMMTools.run_sys_cmd('cd')
+        return [0, work_dir]
 
     @staticmethod
     def cmd_help(dict_cmd_para=None):
@@ -195,13 +327,14 @@ class FCMMGitCmd(object):
             return [0, config['help_text'][sorted(dict_cmd_para.keys())[0]]]
 
     @staticmethod
-    def cmd_init(dict_cmd_para=None):
+    def cmd_init(dict_cmd_para=None, work_dir=None):
         """
         初始化FCMM版本库：根据指定的参数建立及初始化FCMM版本库
 
         @decorators staticmethod
 
         @param {dict} dict_cmd_para=None - 参数字典
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
 
         @returns {list} - 执行结果[returncode, msgstring]
             returncode - 0代表成功，其他代表失败
@@ -225,10 +358,11 @@ class FCMMGitCmd(object):
         ver = FCMMTools.get_cmd_para_value(dict_cmd_para, '-v', '-version')
 
         # 常用信息获取
-        repo_info = FCMMGitTools.get_repo_info(os.getcwd())  # 获取git库原生信息有建库
-        repo_name = FileTools.get_dir_name(repo_info['work_dir'])
+        repo_info = FCMMGitTools.get_repo_info(
+            os.getcwd() if work_dir is None else work_dir)  # 获取git库原生信息有建库
+        repo_name = FileTools.get_dir_name(repo_info.work_dir)
         # 获取fcmm4git配置信息
-        fcmm_config = FCMMTools.get_fcmm_config(repo_info['work_dir'])
+        fcmm_config = repo_info.get_fcmm_config()
         remote_name = FCMMGitTools.get_remote_repo_name(url)  # 远程仓库命名
         remote_repo_info = None
         remote_has_pkg = False
@@ -242,166 +376,293 @@ class FCMMGitCmd(object):
         else:
             # 检查本地目录是否为空
             if not ('-f' in dict_cmd_para.keys() or '-force' in dict_cmd_para.keys()):
-                if os.listdir(repo_info['work_dir']):
+                if os.listdir(repo_info.work_dir):
                     return [3, config['i18n_tips']['local_not_bare']]
 
-        # 需要将远程版本库下载下来比较处理
-        fun_res = FCMMGitTools.clone_remote_repo(url, config['temp_path'], None, True)
-        if fun_res[0] != 0:
-            return [fun_res[0], config['i18n_tips']['execute_fail']]
-        remote_repo_info = FCMMGitTools.get_repo_info(
-            config['temp_path'].rstrip('\\/') + '/' + remote_name)
-        # 尝试找远程的版本分支
-        os.chdir(remote_repo_info['work_dir'])
-        FCMMTools.run_sys_cmd('git checkout --track origin/lb-pkg')
-        remote_has_pkg = FCMMGitTools.check_branch_exists(remote_repo_info, 'lb-pkg')
-        if ver is not None and FCMMGitTools.check_tag_exists(remote_repo_info['repo'], ver):
-            remote_has_tag = True
-
-        if not ('-f' in dict_cmd_para.keys() or '-force' in dict_cmd_para.keys()):
-            # 没有强制标志，需要进行验证
-            if base == 'local':
-                if not FCMMGitTools.is_bare(remote_repo_info):
-                    return [3, config['i18n_tips']['remote_not_bare']]
-            if remote_has_tag:
-                # 检查版本号是否已存在
-                return [3, config['i18n_tips']['remote_tag_exists']]
-
-        # 检查通过或强制执行
-        is_force_reset = False  # 标记是否强制更新服务器端版本
-        if base == 'local':
-            # 本地为准，打包备份到指备份目录中
-            if not FCMMGitTools.is_bare(remote_repo_info):
-                FCMMTools.backup_to_tar(
-                    src_path=remote_repo_info['work_dir'],
-                    save_path=config['backup_path'],
-                    save_name='%s.bak.%s.tar' % (
-                        remote_name, datetime.datetime.now().strftime("%Y%m%d%H%M%S"))
+        # 需要将远程版本库下载下来比较处理，克隆到本次执行独立的临时目录
+        temp_workspace = FCMMTools.create_temp_workspace(config['temp_path'])
+        try:
+            if config['mirror_cache']['enable'] == 'true':
+                # 通过镜像缓存克隆，只增量获取远程仓库的变化
+                fun_res = FCMMMirrorCache.clone_remote_repo(
+                    url, temp_workspace, config['mirror_cache']['path'],
+                    os.path.join(config['temp_path'], 'locks'),
+                    max_count=int(config['mirror_cache']['max_count']),
+                    max_size=float(config['mirror_cache']['max_size']),
+                    lock_timeout=float(config['lock_timeout'])
                 )
+            else:
+                fun_res = FCMMGitTools.clone_remote_repo(url, temp_workspace, None, True)
+            if fun_res[0] != 0:
+                return [fun_res[0], config['i18n_tips']['execute_fail']]
+            remote_repo_info = FCMMGitTools.get_repo_info(
+                temp_workspace.rstrip('\\/') + '/' + remote_name)
+            # 尝试找远程的版本分支
+            FCMMTools.run_sys_cmd(
+                'git checkout --track origin/lb-pkg', cwd=remote_repo_info.work_dir)
+            remote_repo_info.invalidate()
+            remote_has_pkg = FCMMGitTools.check_branch_exists(remote_repo_info, 'lb-pkg')
+            if ver is not None and FCMMGitTools.check_tag_exists(remote_repo_info, ver):
+                remote_has_tag = True
 
-            if '-r' in dict_cmd_para.keys() or '-reset' in dict_cmd_para.keys():
-                # 强制替换服务器端的版本，以本地的版本库为准，直接强制替换
-                # 如果不是git仓库，先初始化
-                os.chdir(repo_info['work_dir'])
-                if repo_info['repo'] is None:
-                    fun_res = FCMMTools.run_sys_cmd('git init')
-                    if fun_res[0] != 0:
-                        return [fun_res[0], config['i18n_tips']['execute_fail']]
-                    repo_info = FCMMGitTools.get_repo_info(repo_info['work_dir'])
-                else:
-                    # 如果原来有远程连接，解除连接
-                    for remote_obj in repo_info['repo'].remotes:
-                        fun_res = FCMMTools.run_sys_cmd('git remote rm %s' % (remote_obj.name))
+            if not ('-f' in dict_cmd_para.keys() or '-force' in dict_cmd_para.keys()):
+                # 没有强制标志，需要进行验证
+                if base == 'local':
+                    if not FCMMGitTools.is_bare(remote_repo_info):
+                        return [3, config['i18n_tips']['remote_not_bare']]
+                if remote_has_tag:
+                    # 检查版本号是否已存在
+                    return [3, config['i18n_tips']['remote_tag_exists']]
+
+            # 检查通过或强制执行
+            is_force_reset = False  # 标记是否强制更新服务器端版本
+            if base == 'local':
+                # 本地为准，打包备份到指备份目录中
+                if not FCMMGitTools.is_bare(remote_repo_info):
+                    FCMMTools.backup_to_tar(
+                        src_path=remote_repo_info.work_dir,
+                        save_path=config['backup_path'],
+                        save_name='%s.bak.%s.tar' % (
+                            remote_name, datetime.datetime.now().strftime("%Y%m%d%H%M%S"))
+                    )
+
+                if '-r' in dict_cmd_para.keys() or '-reset' in dict_cmd_para.keys():
+                    # 强制替换服务器端的版本，以本地的版本库为准，直接强制替换
+                    # 如果不是git仓库，先初始化
+                    if repo_info.repo is None:
+                        fun_res = FCMMTools.run_sys_cmd('git init', cwd=repo_info.work_dir)
                         if fun_res[0] != 0:
                             return [fun_res[0], config['i18n_tips']['execute_fail']]
+                        repo_info = FCMMGitTools.get_repo_info(repo_info.work_dir)
+                    else:
+                        # 如果原来有远程连接，解除连接
+                        for remote_obj in repo_info.repo.remotes:
+                            fun_res = FCMMTools.run_sys_cmd(
+                                'git remote rm %s' % (remote_obj.name), cwd=repo_info.work_dir)
+                            if fun_res[0] != 0:
+                                return [fun_res[0], config['i18n_tips']['execute_fail']]
+                        # 远程仓库已变化，原快照失效
+                        repo_info.remote_ref_snapshot = None
+
+                    # 绑定远程仓库
+                    fun_res = FCMMTools.run_sys_cmd(
+                        'git remote add origin %s' % (url), cwd=repo_info.work_dir)
+                    if fun_res[0] != 0:
+                        return [fun_res[0], config['i18n_tips']['execute_fail']]
 
-                # 绑定远程仓库
-                fun_res = FCMMTools.run_sys_cmd('git remote add origin %s' % (url))
+                    # 指定强制更新服务器端
+                    is_force_reset = True
+                    remote_has_tag = False
+                else:
+                    # 保留服务器端版本信息，用文件清除方式实现文件替换
+                    # 1：删除临时目录中远程分支的所有文件
+                    FCMMTools.run_sys_cmd('git checkout master', cwd=remote_repo_info.work_dir)
+                    FCMMTools.run_sys_cmd('git rm * -r', cwd=remote_repo_info.work_dir)
+
+                    # 2: 将本地目录中的文件复制到远程目录，删除本地目录，复制远程目录到本地目录
+                    FCMMTools.echo(FCMMCopier.copy_all_with_path(
+                        repo_info.work_dir, remote_repo_info.work_dir, '^(?!\\.git$)',
+                        workers=int(config['copy_workers']))[1])
+                    FileTools.remove_all_with_path(repo_info.work_dir)
+                    FCMMTools.echo(FCMMCopier.copy_all_with_path(
+                        remote_repo_info.work_dir, repo_info.work_dir,
+                        workers=int(config['copy_workers']))[1])
+            else:
+                # 远程为准，打包备份到指备份目录中
+                if os.listdir(repo_info.work_dir):
+                    fun_res = [1, '']
+                    if config['backup_mode'] == 'delta' and repo_info.repo is not None:
+                        # 增量备份，只备份git无法重建的内容
+                        fun_res = FCMMGitTools.backup_repo_delta(
+                            repo_info,
+                            save_path=config['backup_path'],
+                            save_name='%s.%s.delta.tar' % (
+                                repo_name, datetime.datetime.now().strftime("%Y%m%d%H%M%S")),
+                            temp_path=temp_workspace
+                        )
+                    if fun_res[0] != 0:
+                        FCMMTools.backup_to_tar(
+                            src_path=repo_info.work_dir,
+                            save_path=config['backup_path'],
+                            save_name='%s.%s.tar' % (
+                                repo_name, datetime.datetime.now().strftime("%Y%m%d%H%M%S"))
+                        )
+                # 复制远程目录到本地目录
+                FileTools.remove_all_with_path(repo_info.work_dir)
+                FCMMTools.echo(FCMMCopier.copy_all_with_path(
+                    remote_repo_info.work_dir, repo_info.work_dir,
+                    workers=int(config['copy_workers']))[1])
+
+            # 完成本地版本库的建立和更新，统一进行配置参数处理和服务器的推送
+            FCMMTools.run_sys_cmd('git checkout master', cwd=repo_info.work_dir)
+            fcmm_config_file = repo_info.work_dir.rstrip('\\/') + '/.fcmm4git'
+            if not os.path.exists(fcmm_config_file):
+                fcmm_config = dict()
+                fcmm_config['remote_url'] = url
+                if '-n' in dict_cmd_para.keys() or '-nopkg' in dict_cmd_para.keys():
+                    fcmm_config['has_pkg'] = "false"
+                else:
+                    fcmm_config['has_pkg'] = "true"
+                # 提交前扫描大文件，大的二进制文件按处理方式以指针提交或拒绝初始化
+                fun_res = FCMMGitCmd.init_large_file(dict_cmd_para, config, repo_info.work_dir)
+                if fun_res[0] != 0:
+                    return fun_res[0:2]
+                fcmm_config['large_file'] = fun_res[2]
+                FCMMTools.save_to_json_file(fcmm_config_file, fcmm_config)
+                # 提交修改（git add *在非windows平台不会包含.fcmm4git等以.开头的文件）
+                FCMMTools.run_sys_cmd('git add -A', cwd=repo_info.work_dir)
+                fun_res = FCMMTools.run_sys_cmd(
+                    'git commit -am "add .fcmm4git by fcmm4git"', cwd=repo_info.work_dir)
                 if fun_res[0] != 0:
                     return [fun_res[0], config['i18n_tips']['execute_fail']]
+                # 设置版本信息
+                ver = FCMMTools.get_cmd_para_value(dict_cmd_para, '-v', '-version')
+                if ver is not None:
+                    if remote_has_tag:
+                        # 远程服务器已经有标签，应先删除标签，再新建
+                        fun_res = FCMMTools.run_sys_cmd(
+                            'git tag -d %s' % (ver), cwd=repo_info.work_dir)
+                        if fun_res[0] != 0:
+                            return [fun_res[0], config['i18n_tips']['execute_fail']]
 
-                # 指定强制更新服务器端
-                is_force_reset = True
-                remote_has_tag = False
-            else:
-                # 保留服务器端版本信息，用文件清除方式实现文件替换
-                # 1：删除临时目录中远程分支的所有文件
-                os.chdir(remote_repo_info['work_dir'])
-                FCMMTools.run_sys_cmd('git checkout master')
-                FCMMTools.run_sys_cmd('git rm * -r')
-
-                # 2: 将本地目录中的文件复制到远程目录，删除本地目录，复制远程目录到本地目录
-                FileTools.copy_all_with_path(
-                    repo_info['work_dir'], remote_repo_info['work_dir'], '^(?!\\.git$)')
-                FileTools.remove_all_with_path(repo_info['work_dir'])
-                FileTools.copy_all_with_path(remote_repo_info['work_dir'], repo_info['work_dir'])
-                os.chdir(repo_info['work_dir'])
-        else:
-            # 远程为准，打包备份到指备份目录中
-            if os.listdir(repo_info['work_dir']):
-                FCMMTools.backup_to_tar(
-                    src_path=repo_info['work_dir'],
-                    save_path=config['backup_path'],
-                    save_name='%s.%s.tar' % (
-                        repo_name, datetime.datetime.now().strftime("%Y%m%d%H%M%S"))
-                )
-            # 复制远程目录到本地目录
-            os.chdir(remote_repo_info['work_dir'])
-            FileTools.remove_all_with_path(repo_info['work_dir'])
-            FileTools.copy_all_with_path(remote_repo_info['work_dir'], repo_info['work_dir'])
-            os.chdir(repo_info['work_dir'])
-
-        # 完成本地版本库的建立和更新，统一进行配置参数处理和服务器的推送
-        FCMMTools.run_sys_cmd('git checkout master')
-        fcmm_config_file = repo_info['work_dir'].rstrip('\\/') + '/.fcmm4git'
-        if not os.path.exists(fcmm_config_file):
-            fcmm_config = dict()
-            fcmm_config['remote_url'] = url
-            if '-n' in dict_cmd_para.keys() or '-nopkg' in dict_cmd_para.keys():
-                fcmm_config['has_pkg'] = "false"
+                    fun_res = FCMMTools.run_sys_cmd(
+                        'git tag -a %s -m "add version by fcmm4git"' % (ver),
+                        cwd=repo_info.work_dir)
+                    if fun_res[0] != 0:
+                        return [fun_res[0], config['i18n_tips']['execute_fail']]
             else:
-                fcmm_config['has_pkg'] = "true"
-            FCMMTools.save_to_json_file(fcmm_config_file, fcmm_config)
-            # 提交修改
-            FCMMTools.run_sys_cmd('git add *')
-            fun_res = FCMMTools.run_sys_cmd('git commit -am "add .fcmm4git by fcmm4git"')
+                # 如果已经有.fcmm4git配置文件说明该目录已经初始化过，同步下来即可，不用再重新推送服务器
+                fcmm_config = FCMMTools.get_fcmm_config(repo_info.work_dir)
+                large_file_list = fcmm_config.get('large_file', dict()).get('files', list())
+                if len(large_file_list) > 0:
+                    # 从本机的大文件存储恢复以指针提交的文件
+                    fun_res = FCMMLargeFile.restore(
+                        repo_info.work_dir, config['large_file']['store_path'], large_file_list)
+                    if len(fun_res[1]) > 0:
+                        FCMMTools.echo(FCMMTools.get_i18n_tips(
+                            config, 'large_file_missing', '\n'.join(fun_res[1])))
+                return FCMMGitCmd.init_shared_store(
+                    dict_cmd_para, config, repo_info.work_dir, url,
+                    [0, config['i18n_tips']['just_clone_remote']])
+
+            # 推送到服务器端
+            push_force_tag = ''
+            if is_force_reset:
+                push_force_tag = '-f '
+            fun_res = FCMMTools.run_sys_cmd(
+                'git push %s--follow-tags origin master' % (push_force_tag), cwd=repo_info.work_dir)
             if fun_res[0] != 0:
                 return [fun_res[0], config['i18n_tips']['execute_fail']]
-            # 设置版本信息
-            ver = FCMMTools.get_cmd_para_value(dict_cmd_para, '-v', '-version')
-            if ver is not None:
-                if remote_has_tag:
-                    # 远程服务器已经有标签，应先删除标签，再新建
-                    fun_res = FCMMTools.run_sys_cmd(
-                        'git tag -d %s' % (ver))
+            # 添加版本分支
+            if not ('-n' in dict_cmd_para.keys() or '-nopkg' in dict_cmd_para.keys()):
+                if remote_has_pkg:
+                    # 远程仓库已有版本分支，要删除并强制推送
+                    fun_res = FCMMTools.run_sys_cmd('git branch -d lb-pkg', cwd=repo_info.work_dir)
                     if fun_res[0] != 0:
                         return [fun_res[0], config['i18n_tips']['execute_fail']]
+                    push_force_tag = '-f '  # 指定强制推送
 
-                fun_res = FCMMTools.run_sys_cmd(
-                    'git tag -a %s -m "add version by fcmm4git"' % (ver))
+                fun_res = FCMMTools.run_sys_cmd('git checkout -b lb-pkg', cwd=repo_info.work_dir)
                 if fun_res[0] != 0:
                     return [fun_res[0], config['i18n_tips']['execute_fail']]
-        else:
-            # 如果已经有.fcmm4git配置文件说明该目录已经初始化过，同步下来即可，不用再重新推送服务器
-            return [0, config['i18n_tips']['just_clone_remote']]
-
-        # 推送到服务器端
-        push_force_tag = ''
-        if is_force_reset:
-            push_force_tag = '-f '
-        fun_res = FCMMTools.run_sys_cmd(
-            'git push %s--follow-tags origin master' % (push_force_tag))
-        if fun_res[0] != 0:
-            return [fun_res[0], config['i18n_tips']['execute_fail']]
-        # 添加版本分支
-        if not ('-n' in dict_cmd_para.keys() or '-nopkg' in dict_cmd_para.keys()):
-            if remote_has_pkg:
-                # 远程仓库已有版本分支，要删除并强制推送
-                fun_res = FCMMTools.run_sys_cmd('git branch -d lb-pkg')
+                fun_res = FCMMTools.run_sys_cmd(
+                    'git push %s--follow-tags origin lb-pkg' % (push_force_tag),
+                    cwd=repo_info.work_dir)
                 if fun_res[0] != 0:
                     return [fun_res[0], config['i18n_tips']['execute_fail']]
-                push_force_tag = '-f '  # 指定强制推送
+                FCMMTools.run_sys_cmd('git checkout master', cwd=repo_info.work_dir)
 
-            fun_res = FCMMTools.run_sys_cmd('git checkout -b lb-pkg')
-            if fun_res[0] != 0:
-                return [fun_res[0], config['i18n_tips']['execute_fail']]
-            fun_res = FCMMTools.run_sys_cmd(
-                'git push %s--follow-tags origin lb-pkg' % (push_force_tag))
-            if fun_res[0] != 0:
-                return [fun_res[0], config['i18n_tips']['execute_fail']]
-            FCMMTools.run_sys_cmd('git checkout master')
+            # 返回执行成功
+            return FCMMGitCmd.init_shared_store(
+                dict_cmd_para, config, repo_info.work_dir, url,
+                [0, config['i18n_tips']['execute_success']])
+        finally:
+            # 本地仓库可能已被整体替换，临时仓库将被删除，都不再使用原会话
+            if remote_repo_info is not None:
+                RepoSession.drop(remote_repo_info.work_dir)
+            RepoSession.drop(repo_info.work_dir)
+            # 删除临时目录
+            FileTools.remove_dir(temp_workspace)
+
+    @staticmethod
+    def init_large_file(dict_cmd_para, config, work_dir):
+        """
+        初始化提交前并行扫描要提交的文件，显示大小报告，并按处理方式处理超过阈值的二进制文件
+
+        @decorators staticmethod
+
+        @param {dict} dict_cmd_para - 参数字典
+        @param {dict} config - fcmm的配置对象
+        @param {string} work_dir - 仓库工作目录
+
+        @returns {list} - 执行结果[returncode, msgstring, large_file_config]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 要返回显示的内容
+            large_file_config - 要登记到.fcmm4git的大文件配置，包括阈值、处理方式及以指针提交的文件清单
+        """
+        action = FCMMTools.get_cmd_para_value(
+            dict_cmd_para, '-l', '-large', config['large_file']['action'])
+        large_file_config = {
+            'max_size': config['large_file']['max_size'], 'action': action, 'files': list()
+        }
+        scan_res = FCMMLargeFile.scan(
+            work_dir, float(large_file_config['max_size']), workers=int(config['copy_workers']))
+        if scan_res is None:
+            return [1, FCMMTools.get_i18n_tips(config, 'execute_fail'), large_file_config]
+        FCMMTools.echo(FCMMLargeFile.get_report(scan_res, action))
+
+        binary_list = [_item[0] for _item in scan_res['large_binary']]
+        if len(binary_list) > 0:
+            if action == 'reject':
+                return [3, FCMMTools.get_i18n_tips(
+                    config, 'large_file_rejected', '\n'.join(binary_list)), large_file_config]
+            elif action == 'lfs':
+                fun_res = FCMMLargeFile.stage_pointers(
+                    work_dir, config['large_file']['store_path'], binary_list,
+                    workers=int(config['copy_workers']))
+                if fun_res[0] != 0:
+                    return [fun_res[0], FCMMTools.get_i18n_tips(config, 'execute_fail'),
+                            large_file_config]
+                large_file_config['files'] = binary_list
+                FCMMTools.echo(FCMMTools.get_i18n_tips(
+                    config, 'large_file_skip_worktree', '\n'.join(binary_list)))
+        return [0, '', large_file_config]
+
+    @staticmethod
+    def init_shared_store(dict_cmd_para, config, work_dir, url, success_res):
+        """
+        初始化完成后按参数将本地仓库加入共享对象库（失败不影响初始化结果，只增加提示）
+
+        @decorators staticmethod
 
-        # 返回执行成功
-        return [0, config['i18n_tips']['execute_success']]
+        @param {dict} dict_cmd_para - 参数字典
+        @param {dict} config - fcmm的配置对象
+        @param {string} work_dir - 本地仓库的工作目录
+        @param {string} url - 远程仓库url
+        @param {list} success_res - 初始化成功的执行结果[returncode, msgstring]
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 要返回显示的内容
+        """
+        if not ('-s' in dict_cmd_para.keys() or '-shared' in dict_cmd_para.keys()):
+            return success_res
+        fun_res = FCMMSharedStore.attach(
+            config['shared_store']['path'], url, work_dir,
+            os.path.join(config['temp_path'], 'locks'), lock_timeout=float(config['lock_timeout']))
+        if fun_res[0] != 0:
+            return [success_res[0], '%s\n%s' % (success_res[1], config['i18n_tips']['shared_store_fail'])]
+        return success_res
 
     @staticmethod
-    def cmd_add_pkg(dict_cmd_para=None):
+    def cmd_add_pkg(dict_cmd_para=None, work_dir=None):
         """
         新增FCMM的pkg分支，如果原分支存在，可以重置分支
 
         @decorators staticmethod
 
         @param {dict} dict_cmd_para=None - 参数字典
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
 
         @returns {list} - 执行结果[returncode, msgstring]
             returncode - 0代表成功，其他代表失败
@@ -409,12 +670,13 @@ class FCMMGitCmd(object):
         """
         # 进行初始化
         is_exit, res, config, fcmm_config, repo_info, current_branch = FCMMGitCmd.cmd_common_init(
-            'add-pkg', dict_cmd_para)
+            'add-pkg', dict_cmd_para, work_dir)
         if is_exit:
             return res
 
         # 进一步检查
         ver = FCMMTools.get_cmd_para_value(dict_cmd_para, '-v', '-version')
+        ver = FCMMGitTools.resolve_version(repo_info, ver)
         has_pkg = FCMMGitTools.check_branch_exists(repo_info, 'lb-pkg')
         if not('-f' in dict_cmd_para.keys() or '-force' in dict_cmd_para.keys()):
             if has_pkg:
@@ -436,32 +698,140 @@ class FCMMGitCmd(object):
                 res = FCMMGitTools.overwrite_branch(repo_info, 'lb-pkg', 'master', ver)
         else:
             # 分支不存在，创建分支并推送到远端
-            res = FCMMTools.run_sys_cmd('git checkout master')
+            res = FCMMTools.run_sys_cmd('git checkout master', cwd=repo_info.work_dir)
             if res[0] == 0:
                 fcmm_config['has_pkg'] = "true"
-                FCMMTools.save_to_json_file(repo_info['work_dir'], fcmm_config)
+                FCMMTools.save_to_json_file(repo_info.work_dir, fcmm_config)
                 res = FCMMTools.run_sys_cmd_list([
                     'git add *',
                     'git commit -m "change .fcmm4gig by tools"',
                     'git push origin master'
-                ])
+                ], cwd=repo_info.work_dir)
+                repo_info.invalidate()
                 if res[0] == 0:
                     res = FCMMGitTools.add_branch(repo_info, 'lb-pkg', 'master', ver)
 
         # 返回值
-        FCMMTools.run_sys_cmd('git checkout %s' % (current_branch))
+        FCMMTools.run_sys_cmd('git checkout %s' % (current_branch), cwd=repo_info.work_dir)
+        repo_info.invalidate()
         if res[0] != 0:
             res[1] = FCMMTools.get_i18n_tips(config, 'execute_fail')
         return res
 
     @staticmethod
-    def cmd_add_cfg(dict_cmd_para=None):
+    def cmd_release(dict_cmd_para=None, work_dir=None):
+        """
+        定版发布：基于master的版本创建附注版本标签，将lb-pkg移动到该版本并备份原lb-pkg分支
+        全部修改通过一次原子推送提交到远程仓库（全部成功或全部不更新），不检出分支，不修改工作目录；
+        远程仓库的信息通过快照获取，本地已有需要的提交时不再fetch
+
+        @decorators staticmethod
+
+        @param {dict} dict_cmd_para=None - 参数字典
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 要返回显示的内容
+        """
+        # 判断是否有帮助
+        if '-h' in dict_cmd_para.keys() or '-help' in dict_cmd_para.keys():
+            return FCMMGitCmd.cmd_help({'release': ''})
+
+        # 最基础的参数校验
+        res = FCMMTools.vailidate_cmd_para(dict_cmd_para, 'release')
+        if res[0] != 0:
+            return res
+
+        config = RunTools.get_global_var('config')
+        repo_info = FCMMGitTools.get_repo_info(os.getcwd() if work_dir is None else work_dir)
+        if repo_info.repo is None or repo_info.get_fcmm_config() is None:
+            return [2, FCMMTools.get_i18n_tips(config, 'local_git_error')]
+
+        # 通过版本号索引检查版本号
+        ver = FCMMTools.get_cmd_para_value(dict_cmd_para, '-v', '-version')
+        ver_key = FCMMVersionIndex.parse_version(ver)
+        if ver_key is None:
+            return [1, FCMMTools.get_i18n_tips(config, 'version_invalid', ver)]
+        snapshot = FCMMGitTools.get_remote_ref_snapshot(repo_info)
+        if snapshot is None:
+            return [1, FCMMTools.get_i18n_tips(config, 'execute_fail')]
+        if ver in snapshot['tags'].keys() or ver in repo_info.get_tags().keys():
+            return [1, FCMMTools.get_i18n_tips(config, 'remote_tag_exists')]
+        if not('-f' in dict_cmd_para.keys() or '-force' in dict_cmd_para.keys()):
+            latest = FCMMGitTools.get_version_index(repo_info).latest(ver_key[0])
+            if latest is not None and FCMMVersionIndex.parse_version(latest) >= ver_key:
+                return [1, FCMMTools.get_i18n_tips(config, 'version_not_newer', ver, latest)]
+
+        # 确定发布的提交，本地没有需要的提交时通过一次fetch获取
+        master_commit = snapshot['heads'].get('master')
+        if master_commit is None:
+            return [1, FCMMTools.get_i18n_tips(config, 'branch_not_exists', 'master')]
+        pkg_commit = snapshot['heads'].get('lb-pkg')
+        refspec_list = list()
+        if not FCMMGitTools.has_commit(repo_info, master_commit):
+            refspec_list.append('+refs/heads/master:refs/remotes/origin/master')
+        if pkg_commit is not None and not FCMMGitTools.has_commit(repo_info, pkg_commit):
+            refspec_list.append('+refs/heads/lb-pkg:refs/remotes/origin/lb-pkg')
+        if len(refspec_list) > 0:
+            res = FCMMGitTools.fetch_refs(repo_info, refspec_list)
+            if res[0] != 0:
+                return [res[0], FCMMTools.get_i18n_tips(config, 'execute_fail')]
+        commit = master_commit
+        tag = FCMMTools.get_cmd_para_value(dict_cmd_para, '-t', '-tag')
+        if tag is not None:
+            res = FCMMTools.run_sys_cmd_with_output(
+                'git rev-parse -q --verify %s^{commit}' % (tag), cwd=repo_info.work_dir)
+            if res[0] != 0 or not FCMMGitTools.is_ancestor(repo_info, res[1].strip(), master_commit):
+                return [1, FCMMTools.get_i18n_tips(config, 'commit_not_exists', tag)]
+            commit = res[1].strip()
+        fcmm_config = FCMMGitTools.get_fcmm_config_by_branch(repo_info, commit)
+        if fcmm_config is None:
+            return [2, FCMMTools.get_i18n_tips(config, 'local_git_error')]
+
+        # 在本地创建版本标签及备份分支，与lb-pkg的移动一起推送
+        refspec_list = ['refs/tags/%s:refs/tags/%s' % (ver, ver)]
+        lease_dict = dict()
+        backup_name = None
+        cmd_list = ['git tag -a %s %s -m "release %s by fcmm4git"' % (ver, commit, ver)]
+        is_move_pkg = (fcmm_config['has_pkg'] == 'true' and pkg_commit != commit)
+        if is_move_pkg:
+            refspec_list.append('%s:refs/heads/lb-pkg' % (commit))
+            lease_dict['refs/heads/lb-pkg'] = '' if pkg_commit is None else pkg_commit
+            if pkg_commit is not None and config['backup_before'] == 'true':
+                backup_name = FCMMGitTools.get_backup_branch_name(
+                    'lb-pkg',
+                    FCMMGitTools.get_git_config_user_name(repo_info, config['consle_encode']))
+                cmd_list.append('git branch %s %s' % (backup_name, pkg_commit))
+                refspec_list.append('refs/heads/%s:refs/heads/%s' % (backup_name, backup_name))
+        res = FCMMTools.run_sys_cmd_list(cmd_list, cwd=repo_info.work_dir)
+        if res[0] == 0:
+            res = FCMMGitTools.push_atomic(repo_info, refspec_list, lease_dict)
+        if res[0] != 0:
+            # 推送失败（例如lb-pkg已被他人修改），删除本地创建的标签及备份分支
+            FCMMTools.run_sys_cmd_with_output('git tag -d %s' % (ver), cwd=repo_info.work_dir)
+            if backup_name is not None:
+                FCMMTools.run_sys_cmd_with_output(
+                    'git branch -D %s' % (backup_name), cwd=repo_info.work_dir)
+            repo_info.invalidate()
+            return [res[0], FCMMTools.get_i18n_tips(config, 'execute_fail')]
+
+        # 同步本地的lb-pkg分支（只进行快进，不修改本地的提交）
+        if is_move_pkg:
+            FCMMGitTools.update_local_branch(repo_info, 'lb-pkg', commit)
+        return [0, FCMMTools.get_i18n_tips(
+            config, 'release_success', ver, commit,
+            '' if backup_name is None else backup_name)]
+
+    @staticmethod
+    def cmd_add_cfg(dict_cmd_para=None, work_dir=None):
         """
         新增FCMM的cfg分支，如果原分支存在，可以重置分支
 
         @decorators staticmethod
 
         @param {dict} dict_cmd_para=None - 参数字典
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
 
         @returns {list} - 执行结果[returncode, msgstring]
             returncode - 0代表成功，其他代表失败
@@ -469,21 +839,15 @@ class FCMMGitCmd(object):
         """
         # 进行初始化
         is_exit, res, config, fcmm_config, repo_info, current_branch = FCMMGitCmd.cmd_common_init(
-            'add-cfg', dict_cmd_para)
+            'add-cfg', dict_cmd_para, work_dir)
         if is_exit:
             return res
 
         # 进一步检查
         cfg_branch_name = 'lb-cfg-' + FCMMTools.get_cmd_para_value(dict_cmd_para, '-n', '-name')
-        res = FCMMGitTools.get_remote_branch(repo_info, cfg_branch_name)
-        has_cfg_branch = False
-        if res[0] == 0:
-            has_cfg_branch = True
-        elif not res[2]:
-            # 远程节点存在但处理失败
-            res[1] = FCMMTools.get_i18n_tips(config, 'execute_fail')
-            return res
-
+        has_cfg_branch = FCMMGitTools.check_remote_branch_exists(repo_info, cfg_branch_name)
+        if has_cfg_branch is None:
+            return [1, FCMMTools.get_i18n_tips(config, 'remote_refs_fail')]
         if not('-f' in dict_cmd_para.keys() or '-force' in dict_cmd_para.keys()):
             if has_cfg_branch:
                 return [1, FCMMTools.get_i18n_tips(config, 'branch_has_exists', cfg_branch_name)]
@@ -498,10 +862,18 @@ class FCMMGitCmd(object):
             clone_branch_name = 'lb-cfg-' + para_clone
             res = FCMMGitTools.get_remote_branch(repo_info, clone_branch_name)
             if res[0] != 0:
-                return [1, FCMMTools.get_i18n_tips(config, 'branch_not_exists', clone_branch_name)]
+                return [1, FCMMGitCmd.get_remote_branch_fail_tips(
+                    config, res, clone_branch_name,
+                    FCMMTools.get_i18n_tips(config, 'branch_not_exists', clone_branch_name))]
 
         # 进行实际的处理
         if has_cfg_branch:
+            # 需要备份及覆盖，获取分支到本地
+            res = FCMMGitTools.get_remote_branch(repo_info, cfg_branch_name)
+            if res[0] != 0:
+                res[1] = FCMMGitCmd.get_remote_branch_fail_tips(
+                    config, res, cfg_branch_name, FCMMTools.get_i18n_tips(config, 'execute_fail'))
+                return res[0:2]
             # 先备份
             if config['backup_before'] == 'true':
                 res = FCMMGitTools.backup_branch(
@@ -512,9 +884,11 @@ class FCMMGitCmd(object):
             if res[0] == 0:
                 if clone_branch_name != '':
                     res = FCMMGitTools.overwrite_branch(
-                        repo_info, cfg_branch_name, src_branch=clone_branch_name)
+                        repo_info, cfg_branch_name, src_branch=clone_branch_name,
+                        fcmm_config=fcmm_config)
                 else:
-                    res = FCMMGitTools.overwrite_branch(repo_info, cfg_branch_name, is_bare=True)
+                    res = FCMMGitTools.overwrite_branch(
+                        repo_info, cfg_branch_name, is_bare=True, fcmm_config=fcmm_config)
         else:
             if clone_branch_name != '':
                 res = FCMMGitTools.add_branch(
@@ -525,13 +899,14 @@ class FCMMGitCmd(object):
         return res
 
     @staticmethod
-    def cmd_add_dev(dict_cmd_para=None):
+    def cmd_add_dev(dict_cmd_para=None, work_dir=None):
         """
         新增FCMM的dev分支，如果原分支存在，可以重置分支
 
         @decorators staticmethod
 
         @param {dict} dict_cmd_para=None - 参数字典
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
 
         @returns {list} - 执行结果[returncode, msgstring]
             returncode - 0代表成功，其他代表失败
@@ -539,30 +914,26 @@ class FCMMGitCmd(object):
         """
         # 进行初始化
         is_exit, res, config, fcmm_config, repo_info, current_branch = FCMMGitCmd.cmd_common_init(
-            'add-dev', dict_cmd_para)
+            'add-dev', dict_cmd_para, work_dir)
         if is_exit:
             return res
 
         # 进一步检查
         branch_name = 'tb-%s-%s' % (
-            FCMMTools.get_cmd_para_value(dict_cmd_para, '-t', '-type '),
+            FCMMTools.get_cmd_para_value(dict_cmd_para, '-t', '-type'),
             FCMMTools.get_cmd_para_value(dict_cmd_para, '-n', '-name')
         )
-        res = FCMMGitTools.get_remote_branch(repo_info, branch_name)
-        has_branch = False
-        if res[0] == 0:
-            has_branch = True
-        elif not res[2]:
-            # 远程节点存在但处理失败
-            res[1] = FCMMTools.get_i18n_tips(config, 'execute_fail')
-            return res
+        has_branch = FCMMGitTools.check_remote_branch_exists(repo_info, branch_name)
+        if has_branch is None:
+            return [1, FCMMTools.get_i18n_tips(config, 'remote_refs_fail')]
         if not('-f' in dict_cmd_para.keys() or '-force' in dict_cmd_para.keys()):
             if has_branch:
-                return [1, FCMMTools.get_i18n_tips(config, 'branch_has_exists', has_branch)]
+                return [1, FCMMTools.get_i18n_tips(config, 'branch_has_exists', branch_name)]
 
         clone_branch_name = ''
         para_clone = FCMMTools.get_cmd_para_value(dict_cmd_para, '-c', '-clone')
         ver = FCMMTools.get_cmd_para_value(dict_cmd_para, '-v', '-version')
+        ver = FCMMGitTools.resolve_version(repo_info, ver)
         if ver is not None and not FCMMGitTools.check_tag_exists(repo_info, ver):
             return [1, FCMMTools.get_i18n_tips(config, 'tag_not_exists', ver)]
 
@@ -575,11 +946,19 @@ class FCMMGitCmd(object):
             clone_branch_name = 'tb-' + para_clone
             res = FCMMGitTools.get_remote_branch(repo_info, clone_branch_name)
             if res[0] != 0:
-                return [1, FCMMTools.get_i18n_tips(config, 'branch_not_exists', clone_branch_name)]
+                return [1, FCMMGitCmd.get_remote_branch_fail_tips(
+                    config, res, clone_branch_name,
+                    FCMMTools.get_i18n_tips(config, 'branch_not_exists', clone_branch_name))]
         tag = FCMMTools.get_cmd_para_value(dict_cmd_para, '-tag', '-tag')
 
         # 进行实际的处理
         if has_branch:
+            # 需要备份及覆盖，获取分支到本地
+            res = FCMMGitTools.get_remote_branch(repo_info, branch_name)
+            if res[0] != 0:
+                res[1] = FCMMGitCmd.get_remote_branch_fail_tips(
+                    config, res, branch_name, FCMMTools.get_i18n_tips(config, 'execute_fail'))
+                return res[0:2]
             # 先备份
             if config['backup_before'] == 'true':
                 res = FCMMGitTools.backup_branch(
@@ -589,7 +968,8 @@ class FCMMGitCmd(object):
                 )
             if res[0] == 0:
                 res = FCMMGitTools.overwrite_branch(
-                    repo_info, branch_name, src_branch=clone_branch_name, tag=ver, commit=tag)
+                    repo_info, branch_name, src_branch=clone_branch_name, tag=ver, commit=tag,
+                    fcmm_config=fcmm_config)
         else:
             res = FCMMGitTools.add_branch(repo_info, branch_name,
                                           src_branch=clone_branch_name, tag=ver, commit=tag)
@@ -597,13 +977,14 @@ class FCMMGitCmd(object):
         return res
 
     @staticmethod
-    def cmd_add_temp(dict_cmd_para=None):
+    def cmd_add_temp(dict_cmd_para=None, work_dir=None):
         """
         新增FCMM的开发者临时分支，如果原分支存在，可以重置分支
 
         @decorators staticmethod
 
         @param {dict} dict_cmd_para=None - 参数字典
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
 
         @returns {list} - 执行结果[returncode, msgstring]
             returncode - 0代表成功，其他代表失败
@@ -611,7 +992,7 @@ class FCMMGitCmd(object):
         """
         # 进行初始化
         is_exit, res, config, fcmm_config, repo_info, current_branch = FCMMGitCmd.cmd_common_init(
-            'add-temp', dict_cmd_para)
+            'add-temp', dict_cmd_para, work_dir)
         if is_exit:
             return res
 
@@ -620,14 +1001,9 @@ class FCMMGitCmd(object):
             FCMMTools.get_cmd_para_value(dict_cmd_para, '-n', '-name')
         )
         clone_branch_name = FCMMGitTools.get_active_branch(repo_info)
-        res = FCMMGitTools.get_remote_branch(repo_info, branch_name)
-        has_branch = False
-        if res[0] == 0:
-            has_branch = True
-        elif not res[2]:
-            # 远程节点存在但处理失败
-            res[1] = FCMMTools.get_i18n_tips(config, 'execute_fail')
-            return res
+        has_branch = FCMMGitTools.check_remote_branch_exists(repo_info, branch_name)
+        if has_branch is None:
+            return [1, FCMMTools.get_i18n_tips(config, 'remote_refs_fail')]
         if not('-f' in dict_cmd_para.keys() or '-force' in dict_cmd_para.keys()):
             if has_branch:
                 return [1, FCMMTools.get_i18n_tips(config, 'branch_has_exists', branch_name)]
@@ -635,30 +1011,35 @@ class FCMMGitCmd(object):
         # 进行处理
         para_bare = FCMMTools.get_cmd_para_value(dict_cmd_para, '-b', '-bare')
         if has_branch:
-            if para_bare:
+            # 需要覆盖，获取分支到本地
+            res = FCMMGitTools.get_remote_branch(repo_info, branch_name)
+            if res[0] != 0:
+                res[1] = FCMMGitCmd.get_remote_branch_fail_tips(
+                    config, res, branch_name, FCMMTools.get_i18n_tips(config, 'execute_fail'))
+                return res[0:2]
+            if para_bare is not None:
                 res = FCMMGitTools.overwrite_branch(
-                    repo_info, branch_name, is_bare=True)
+                    repo_info, branch_name, is_bare=True, fcmm_config=fcmm_config)
             else:
                 res = FCMMGitTools.overwrite_branch(
-                    repo_info, branch_name, src_branch=clone_branch_name)
+                    repo_info, branch_name, src_branch=clone_branch_name, fcmm_config=fcmm_config)
         else:
-            if para_bare:
-                res = FCMMGitTools.add_branch(
-                    repo_info, branch_name, is_bare=True)
+            if para_bare is not None:
+                res = FCMMGitTools.add_branch(repo_info, branch_name, is_bare=True)
             else:
-                res = FCMMGitTools.add_branch(
-                    repo_info, branch_name, src_branch=clone_branch_name)
+                res = FCMMGitTools.add_branch(repo_info, branch_name, src_branch=clone_branch_name)
 
         return res
 
     @staticmethod
-    def cmd_rollback(dict_cmd_para=None):
+    def cmd_rollback(dict_cmd_para=None, work_dir=None):
         """
         将指定分支回退到指定版本
 
         @decorators staticmethod
 
         @param {dict} dict_cmd_para=None - 参数字典
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
 
         @returns {list} - 执行结果[returncode, msgstring]
             returncode - 0代表成功，其他代表失败
@@ -666,7 +1047,7 @@ class FCMMGitCmd(object):
         """
         # 进行初始化
         is_exit, res, config, fcmm_config, repo_info, current_branch = FCMMGitCmd.cmd_common_init(
-            'rollback', dict_cmd_para)
+            'rollback', dict_cmd_para, work_dir)
         if is_exit:
             return res
 
@@ -679,7 +1060,9 @@ class FCMMGitCmd(object):
             # 检查分支是否存在
             res = FCMMGitTools.get_remote_branch(repo_info, branch_name)
             if res[0] != 0:
-                return [1, FCMMTools.get_i18n_tips(config, 'branch_not_exists', branch_name)]
+                return [1, FCMMGitCmd.get_remote_branch_fail_tips(
+                    config, res, branch_name,
+                    FCMMTools.get_i18n_tips(config, 'branch_not_exists', branch_name))]
 
         # master和lb-pkg分支不允许回退
         if not('-f' in dict_cmd_para.keys() or '-force' in dict_cmd_para.keys()):
@@ -687,6 +1070,7 @@ class FCMMGitCmd(object):
                 return [1, FCMMTools.get_i18n_tips(config, 'master_pkg_no_rollback')]
 
         ver = FCMMTools.get_cmd_para_value(dict_cmd_para, '-v', '-version')
+        ver = FCMMGitTools.resolve_version(repo_info, ver)
         tag = FCMMTools.get_cmd_para_value(dict_cmd_para, '-t', '-tag')
         if ver is None and tag is None:
             return [1, FCMMTools.get_i18n_tips(config, 'must_has_para', 'version / tag')]
@@ -713,19 +1097,20 @@ class FCMMGitCmd(object):
                 if fcmm_config['has_pkg'] == 'true':
                     src_branch = 'lb-pkg'
                 res = FCMMGitTools.overwrite_branch(
-                    repo_info, branch_name, src_branch, tag=ver, commit=tag)
+                    repo_info, branch_name, src_branch, tag=ver, commit=tag, fcmm_config=fcmm_config)
 
         # 返回结果
         return res
 
     @staticmethod
-    def cmd_check(dict_cmd_para=None):
+    def cmd_check(dict_cmd_para=None, work_dir=None):
         """
         检查分支的基础版本与指定分支是否一致（比较版本在检查分支的历史节点里）
 
         @decorators staticmethod
 
         @param {dict} dict_cmd_para=None - 参数字典
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
 
         @returns {list} - 执行结果[returncode, msgstring]
             returncode - 0代表成功，其他代表失败
@@ -733,10 +1118,14 @@ class FCMMGitCmd(object):
         """
         # 进行初始化
         is_exit, res, config, fcmm_config, repo_info, current_branch = FCMMGitCmd.cmd_common_init(
-            'check', dict_cmd_para)
+            'check', dict_cmd_para, work_dir)
         if is_exit:
             return res
 
+        if '-a' in dict_cmd_para.keys() or '-all' in dict_cmd_para.keys():
+            # 检查全部分支
+            return FCMMGitCmd.check_all_branch(config, fcmm_config, repo_info, dict_cmd_para)
+
         # 进一步检查
         branch_name = FCMMTools.get_cmd_para_value(dict_cmd_para, '-n', '-name')
         if branch_name is None:
@@ -746,7 +1135,9 @@ class FCMMGitCmd(object):
             # 检查分支是否存在
             res = FCMMGitTools.get_remote_branch(repo_info, branch_name)
             if res[0] != 0:
-                return [1, FCMMTools.get_i18n_tips(config, 'branch_not_exists', branch_name)]
+                return [1, FCMMGitCmd.get_remote_branch_fail_tips(
+                    config, res, branch_name,
+                    FCMMTools.get_i18n_tips(config, 'branch_not_exists', branch_name))]
         source_branch = FCMMTools.get_cmd_para_value(dict_cmd_para, '-s', '-source')
         if source_branch is None:
             if fcmm_config['has_pkg'] == 'true':
@@ -757,11 +1148,14 @@ class FCMMGitCmd(object):
             # 检查分支是否存在
             res = FCMMGitTools.get_remote_branch(repo_info, source_branch)
             if res[0] != 0:
-                return [1, FCMMTools.get_i18n_tips(config, 'branch_not_exists', source_branch)]
+                return [1, FCMMGitCmd.get_remote_branch_fail_tips(
+                    config, res, source_branch,
+                    FCMMTools.get_i18n_tips(config, 'branch_not_exists', source_branch))]
         # 检查分支是否同一个
         if branch_name == source_branch:
             return [1, FCMMTools.get_i18n_tips(config, 'check_branch_is_same', source_branch)]
         ver = FCMMTools.get_cmd_para_value(dict_cmd_para, '-v', '-version')
+        ver = FCMMGitTools.resolve_version(repo_info, ver)
         # 检查版本号是否一致
         if ver is not None and not FCMMGitTools.check_tag_exists(repo_info, ver):
             return [1, FCMMTools.get_i18n_tips(config, 'tag_not_exists', ver)]
@@ -777,13 +1171,343 @@ class FCMMGitCmd(object):
             return [1, FCMMTools.get_i18n_tips(config, 'branch_check_failed')]
 
     @staticmethod
-    def cmd_merge(dict_cmd_para=None):
+    def check_all_branch(config, fcmm_config, repo_info, dict_cmd_para):
+        """
+        检查全部tb-*分支（不含备份分支）的基础版本与指定分支是否一致
+        通过一次fetch获取全部分支，在一次历史遍历中计算（或通过线程池并行计算）各分支的领先及落后提交数
+
+        @decorators staticmethod
+
+        @param {dict} config - fcmm的配置对象
+        @param {dict} fcmm_config - .fcmm4git配置信息
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {dict} dict_cmd_para - 参数字典
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表全部分支检查通过，1代表有分支检查不通过，其他代表失败
+            msgstring - 以tab分隔的检查结果表格，列为branch、based、ahead、behind
+        """
+        snapshot = FCMMGitTools.get_remote_ref_snapshot(repo_info)
+        if snapshot is None:
+            return [2, FCMMTools.get_i18n_tips(config, 'execute_fail')]
+        source_branch = FCMMTools.get_cmd_para_value(dict_cmd_para, '-s', '-source')
+        if source_branch is None:
+            if fcmm_config['has_pkg'] == 'true':
+                source_branch = 'lb-pkg'
+            else:
+                source_branch = 'master'
+        if source_branch not in snapshot['heads'].keys():
+            return [1, FCMMTools.get_i18n_tips(config, 'branch_not_exists', source_branch)]
+        ver = FCMMTools.get_cmd_para_value(dict_cmd_para, '-v', '-version')
+        ver = FCMMGitTools.resolve_version(repo_info, ver)
+        if ver is not None and ver not in snapshot['tags'].keys():
+            return [1, FCMMTools.get_i18n_tips(config, 'tag_not_exists', ver)]
+        tag = FCMMTools.get_cmd_para_value(dict_cmd_para, '-t', '-tag')
+
+        # 一次获取全部要检查的分支（备份分支tb-bak-*不检查，也不获取）
+        branch_list = sorted([
+            _branch for _branch in snapshot['heads'].keys()
+            if FCMMGitTools.get_branch_type(_branch) in ('tb', 'tb-dev') and _branch != source_branch
+        ])
+        if FCMMGitTools.get_git_version() >= (2, 29):
+            # 通过负向refspec排除备份分支
+            refspec_list = ['+refs/heads/tb-*:refs/remotes/origin/tb-*', '"^refs/heads/tb-bak-*"']
+        else:
+            refspec_list = ['+refs/heads/%s:refs/remotes/origin/%s' % (_branch, _branch)
+                            for _branch in branch_list]
+        refspec_list.append('+refs/heads/%s:refs/remotes/origin/%s' % (source_branch, source_branch))
+        if ver is not None:
+            refspec_list.append('+refs/tags/%s:refs/tags/%s' % (ver, ver))
+        res = FCMMGitTools.fetch_refs(repo_info, refspec_list)
+        if res[0] != 0:
+            return [res[0], FCMMTools.get_i18n_tips(config, 'execute_fail')]
+
+        # 确定比较的基础提交
+        if ver is not None:
+            base_commit = snapshot['tags'][ver]
+        elif tag is not None:
+            # 无效的commit标签会使全部分支的计算失败，先校验
+            res = FCMMTools.run_sys_cmd_with_output(
+                'git rev-parse -q --verify %s^{commit}' % (tag), cwd=repo_info.work_dir)
+            if res[0] != 0:
+                return [1, FCMMTools.get_i18n_tips(config, 'commit_not_exists', tag)]
+            base_commit = res[1].strip()
+        else:
+            base_commit = snapshot['heads'][source_branch]
+
+        counts = FCMMGitTools.get_ahead_behind(
+            repo_info, base_commit,
+            ['refs/remotes/origin/%s' % (_branch) for _branch in branch_list],
+            int(config['check_workers'])
+        )
+
+        # 生成检查结果表格
+        returncode = 0
+        lines = ['branch\tbased\tahead\tbehind']
+        for _branch in branch_list:
+            _counts = counts.get('refs/remotes/origin/%s' % (_branch))
+            if _counts is None:
+                returncode = 1
+                lines.append('%s\terror\t\t' % (_branch))
+                continue
+            is_base = (_counts[1] == 0)
+            if not is_base:
+                returncode = 1
+            lines.append('%s\t%s\t%d\t%d' % (
+                _branch, 'true' if is_base else 'false', _counts[0], _counts[1]))
+        return [returncode, '\n'.join(lines)]
+
+    @staticmethod
+    def cmd_status(dict_cmd_para=None, work_dir=None):
+        """
+        显示FCMM分支拓扑（各分支类型、基础版本及相对基础分支的领先及落后提交数）
+        通过增量更新的拓扑索引显示，不进行远程同步
+
+        @decorators staticmethod
+
+        @param {dict} dict_cmd_para=None - 参数字典
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 要返回显示的内容
+        """
+        # 判断是否有帮助
+        if '-h' in dict_cmd_para.keys() or '-help' in dict_cmd_para.keys():
+            return FCMMGitCmd.cmd_help({'status': ''})
+
+        # 最基础的参数校验
+        res = FCMMTools.vailidate_cmd_para(dict_cmd_para, 'status')
+        if res[0] != 0:
+            return res
+
+        # 本地仓库信息检查
+        config = RunTools.get_global_var('config')
+        repo_info = FCMMGitTools.get_repo_info(os.getcwd() if work_dir is None else work_dir)
+        fcmm_config = repo_info.get_fcmm_config()
+        if repo_info.repo is None or fcmm_config is None:
+            return [2, FCMMTools.get_i18n_tips(config, 'local_git_error')]
+
+        base_branch = 'master'
+        if fcmm_config['has_pkg'] == 'true':
+            base_branch = 'lb-pkg'
+        index = FCMMGitTools.update_topology_index(
+            repo_info, base_branch, int(config['check_workers']),
+            rebuild=('-r' in dict_cmd_para.keys() or '-refresh' in dict_cmd_para.keys())
+        )
+
+        # 按分支类型排序输出
+        type_order = ['master', 'lb-pkg', 'lb-cfg', 'tb', 'tb-dev', 'tb-bak']
+        branch_list = sorted(
+            index['branches'].keys(),
+            key=lambda _branch: (type_order.index(index['branches'][_branch]['type']), _branch)
+        )
+        lines = ['branch\ttype\tbase_tag\tahead\tbehind  (base: %s)' % (base_branch)]
+        for _branch in branch_list:
+            _item = index['branches'][_branch]
+            lines.append('%s\t%s\t%s\t%d\t%d' % (
+                _branch, _item['type'], _item['base_tag'], _item['ahead'], _item['behind']))
+        return [0, '\n'.join(lines)]
+
+    @staticmethod
+    def cmd_diff(dict_cmd_para=None, work_dir=None):
+        """
+        显示两个版本之间的差异（文件差异统计及提交摘要）
+        直接比较提交的目录树，不检出分支；结果按提交对缓存，较大的范围复用已缓存的相邻范围增量计算
+
+        @decorators staticmethod
+
+        @param {dict} dict_cmd_para=None - 参数字典
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 要返回显示的内容
+        """
+        # 判断是否有帮助
+        if '-h' in dict_cmd_para.keys() or '-help' in dict_cmd_para.keys():
+            return FCMMGitCmd.cmd_help({'diff': ''})
+
+        # 最基础的参数校验
+        res = FCMMTools.vailidate_cmd_para(dict_cmd_para, 'diff')
+        if res[0] != 0:
+            return res
+
+        # 本地仓库信息检查
+        config = RunTools.get_global_var('config')
+        repo_info = FCMMGitTools.get_repo_info(os.getcwd() if work_dir is None else work_dir)
+        fcmm_config = repo_info.get_fcmm_config()
+        if repo_info.repo is None or fcmm_config is None:
+            return [2, FCMMTools.get_i18n_tips(config, 'local_git_error')]
+        snapshot = FCMMGitTools.get_remote_ref_snapshot(repo_info)
+        if snapshot is None:
+            return [1, FCMMTools.get_i18n_tips(config, 'execute_fail')]
+
+        # 确定比较的提交，不指定结束版本时为lb-pkg（没有lb-pkg时为master）的最新提交
+        refspec_list = list()
+        commit_list = list()
+        desc_list = list()
+        for _short, _long in (('-f', '-from'), ('-t', '-to')):
+            _ver = FCMMTools.get_cmd_para_value(dict_cmd_para, _short, _long)
+            _ver = FCMMGitTools.resolve_version(repo_info, _ver)
+            if _ver is not None:
+                if _ver not in snapshot['tags'].keys():
+                    return [1, FCMMTools.get_i18n_tips(config, 'tag_not_exists', _ver)]
+                _commit = snapshot['tags'][_ver]
+                _refspec = '+refs/tags/%s:refs/tags/%s' % (_ver, _ver)
+            else:
+                _ver = 'lb-pkg' if fcmm_config['has_pkg'] == 'true' else 'master'
+                _commit = snapshot['heads'].get(_ver)
+                if _commit is None:
+                    return [1, FCMMTools.get_i18n_tips(config, 'branch_not_exists', _ver)]
+                _refspec = '+refs/heads/%s:refs/remotes/origin/%s' % (_ver, _ver)
+            if not FCMMGitTools.has_commit(repo_info, _commit):
+                refspec_list.append(_refspec)
+            commit_list.append(_commit)
+            desc_list.append(_ver)
+
+        # 本地没有需要的提交时通过一次fetch获取
+        if len(refspec_list) > 0:
+            res = FCMMGitTools.fetch_refs(repo_info, refspec_list)
+            if res[0] != 0:
+                return [res[0], FCMMTools.get_i18n_tips(config, 'execute_fail')]
+
+        diff_info, source = FCMMDiffCache.get(
+            repo_info.work_dir, os.path.join(FCMMGitTools.get_fcmm_data_path(repo_info), 'diff'),
+            commit_list[0], commit_list[1],
+            lambda _ancestor, _commit: FCMMGitTools.is_ancestor(repo_info, _ancestor, _commit),
+            refresh=('-r' in dict_cmd_para.keys() or '-refresh' in dict_cmd_para.keys())
+        )
+        if diff_info is None:
+            return [1, FCMMTools.get_i18n_tips(config, 'execute_fail')]
+
+        # 输出提交摘要及文件差异统计，二进制文件的行数显示为-
+        lines = ['diff %s..%s (%s..%s, %s)' % (
+            desc_list[0], desc_list[1], commit_list[0][0:8], commit_list[1][0:8], source)]
+        lines.append('commits: %d' % (len(diff_info['commits'])))
+        for _commit in diff_info['commits']:
+            lines.append('  %s\t%s' % (_commit[0][0:8], '\t'.join(_commit[1:])))
+        added = sum([_stat[1] for _stat in diff_info['files'].values() if _stat[1] > 0])
+        deleted = sum([_stat[2] for _stat in diff_info['files'].values() if _stat[2] > 0])
+        lines.append('files: %d changed, +%d -%d' % (len(diff_info['files']), added, deleted))
+        for _path in sorted(diff_info['files'].keys()):
+            _stat = diff_info['files'][_path]
+            lines.append('  %s\t%s\t%s\t%s' % (
+                _stat[0], '-' if _stat[1] < 0 else '+%d' % (_stat[1]),
+                '-' if _stat[2] < 0 else '-%d' % (_stat[2]), _path))
+        return [0, '\n'.join(lines)]
+
+    @staticmethod
+    def cmd_stats(dict_cmd_para=None):
+        """
+        显示跨多次执行汇总的性能指标（各命令的执行次数、耗时百分位、推送次数及各阶段耗时）
+
+        @decorators staticmethod
+
+        @param {dict} dict_cmd_para=None - 参数字典
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 要返回显示的内容
+        """
+        # 判断是否有帮助
+        if '-h' in dict_cmd_para.keys() or '-help' in dict_cmd_para.keys():
+            return FCMMGitCmd.cmd_help({'stats': ''})
+
+        # 最基础的参数校验
+        res = FCMMTools.vailidate_cmd_para(dict_cmd_para, 'stats')
+        if res[0] != 0:
+            return res
+
+        config = RunTools.get_global_var('config')
+        state = FCMMMetrics.load_state(config['metrics']['file'])
+        if '-r' in dict_cmd_para.keys() or '-raw' in dict_cmd_para.keys():
+            # 直接输出Prometheus文本
+            return [0, FCMMMetrics.to_prometheus_text(state)]
+
+        buckets = FCMMMetrics.DURATION_BUCKETS
+        lines = ['command\truns\tfail\tavg\tp50\tp95\tpushes/run  (metrics: %s)' % (
+            config['metrics']['file'])]
+        for _cmd in sorted(state['duration'].keys()):
+            _histogram = state['duration'][_cmd]
+            _push = state['push'].get(_cmd, {'sum': 0, 'count': 1})
+            lines.append('%s\t%d\t%d\t%.3f\t%.3f\t%.3f\t%.2f' % (
+                _cmd, _histogram['count'], state['runs'].get(_cmd + '\tfail', 0),
+                _histogram['sum'] / _histogram['count'],
+                FCMMMetrics.percentile(_histogram, buckets, 0.5),
+                FCMMMetrics.percentile(_histogram, buckets, 0.95),
+                _push['sum'] / max(_push['count'], 1)
+            ))
+        lines.append('')
+        lines.append('command\tphase\truns\tavg\tp95')
+        for _key in sorted(state['phase'].keys()):
+            _histogram = state['phase'][_key]
+            lines.append('%s\t%d\t%.3f\t%.3f' % (
+                _key, _histogram['count'], _histogram['sum'] / _histogram['count'],
+                FCMMMetrics.percentile(_histogram, buckets, 0.95)
+            ))
+        return [0, '\n'.join(lines)]
+
+    @staticmethod
+    def cmd_maintain(dict_cmd_para=None, work_dir=None):
         """
-        将指定分支版本合并到当前分支中
+        按阈值维护仓库：引用打包、松散对象打包、增量合并小包、更新multi-pack-index及commit-graph
 
         @decorators staticmethod
 
         @param {dict} dict_cmd_para=None - 参数字典
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 要返回显示的内容
+        """
+        # 判断是否有帮助
+        if '-h' in dict_cmd_para.keys() or '-help' in dict_cmd_para.keys():
+            return FCMMGitCmd.cmd_help({'maintain': ''})
+
+        # 最基础的参数校验
+        res = FCMMTools.vailidate_cmd_para(dict_cmd_para, 'maintain')
+        if res[0] != 0:
+            return res
+
+        config = RunTools.get_global_var('config')
+        repo_info = FCMMGitTools.get_repo_info(os.getcwd() if work_dir is None else work_dir)
+        if repo_info.repo is None:
+            return [2, FCMMTools.get_i18n_tips(config, 'local_git_error')]
+
+        back_obj = FCMMMaintain.run(
+            repo_info.work_dir, repo_info.repo.common_dir, config['maintain'],
+            force=('-f' in dict_cmd_para.keys() or '-force' in dict_cmd_para.keys()),
+            dry_run=('-d' in dict_cmd_para.keys() or '-dry' in dict_cmd_para.keys()))
+        # 维护会重写引用及包文件，仓库会话的缓存失效
+        repo_info.invalidate()
+        if back_obj[0] != 0:
+            return back_obj
+
+        if '-s' in dict_cmd_para.keys() or '-store' in dict_cmd_para.keys():
+            # 共享对象库gc
+            res = FCMMSharedStore.gc_all(
+                config['shared_store']['path'], os.path.join(config['temp_path'], 'locks'),
+                prune_expire=config['shared_store']['prune_expire'],
+                lock_timeout=float(config['lock_timeout']),
+                cruft=(FCMMGitTools.get_git_version() >= (2, 37)))
+            back_obj[1] = '%s\nshared store gc: %s' % (
+                back_obj[1], 'done' if res[0] == 0 else 'fail')
+            back_obj[0] = res[0]
+        return back_obj
+
+    @staticmethod
+    def cmd_merge(dict_cmd_para=None, work_dir=None):
+        """
+        将指定分支版本合并到目标分支中（默认为当前分支）
+        合并在内存中完成，不检出任何分支；可快进的情况直接快进，合并结果通过一次推送提交到远程仓库
+
+        @decorators staticmethod
+
+        @param {dict} dict_cmd_para=None - 参数字典
+        @param {string} work_dir=None - 仓库工作目录，不传入代表进程的当前目录
 
         @returns {list} - 执行结果[returncode, msgstring]
             returncode - 0代表成功，其他代表失败
@@ -791,41 +1515,98 @@ class FCMMGitCmd(object):
         """
         # 进行初始化
         is_exit, res, config, fcmm_config, repo_info, current_branch = FCMMGitCmd.cmd_common_init(
-            'merge', dict_cmd_para)
+            'merge', dict_cmd_para, work_dir)
         if is_exit:
             return res
 
-        # 进一步检查
+        # 进一步检查，通过远程快照判断，不在本地创建分支
         branch_name = FCMMTools.get_cmd_para_value(dict_cmd_para, '-d', '-dest')
         if branch_name is None:
             # 获取当前工作分支
             branch_name = FCMMGitTools.get_active_branch(repo_info)
-        else:
-            # 检查分支是否存在
-            res = FCMMGitTools.get_remote_branch(repo_info, branch_name)
-            if res[0] != 0:
-                return [1, FCMMTools.get_i18n_tips(config, 'branch_not_exists', branch_name)]
+        has_branch = FCMMGitTools.check_remote_branch_exists(repo_info, branch_name)
+        if has_branch is None:
+            return [1, FCMMTools.get_i18n_tips(config, 'remote_refs_fail')]
+        if not has_branch:
+            return [1, FCMMTools.get_i18n_tips(config, 'branch_not_exists', branch_name)]
+        # master和lb-pkg分支不允许合并
+        if not('-f' in dict_cmd_para.keys() or '-force' in dict_cmd_para.keys()):
+            if branch_name == 'master' or branch_name == 'lb-pkg':
+                return [1, FCMMTools.get_i18n_tips(config, 'master_pkg_no_merge')]
         source_branch = FCMMTools.get_cmd_para_value(dict_cmd_para, '-s', '-source')
         if source_branch is None:
             if fcmm_config['has_pkg'] == 'true':
                 source_branch = 'lb-pkg'
             else:
                 source_branch = 'master'
-        else:
-            # 检查分支是否存在
-            res = FCMMGitTools.get_remote_branch(repo_info, source_branch)
-            if res[0] != 0:
-                return [1, FCMMTools.get_i18n_tips(config, 'branch_not_exists', source_branch)]
+        if not FCMMGitTools.check_remote_branch_exists(repo_info, source_branch):
+            # 快照在上面已成功获取，这里只会是分支不存在
+            return [1, FCMMTools.get_i18n_tips(config, 'branch_not_exists', source_branch)]
         # 检查分支是否同一个
         if branch_name == source_branch:
             return [1, FCMMTools.get_i18n_tips(config, 'check_branch_is_same', source_branch)]
+        snapshot = FCMMGitTools.get_remote_ref_snapshot(repo_info)
         ver = FCMMTools.get_cmd_para_value(dict_cmd_para, '-v', '-version')
+        ver = FCMMGitTools.resolve_version(repo_info, ver)
         # 检查版本号是否一致
-        if ver is not None and not FCMMGitTools.check_tag_exists(repo_info, ver):
+        if ver is not None and ver not in snapshot['tags'].keys():
             return [1, FCMMTools.get_i18n_tips(config, 'tag_not_exists', ver)]
         # 获取版本号
         tag = FCMMTools.get_cmd_para_value(dict_cmd_para, '-t', '-tag')
 
+        # 一次获取合并所需的全部对象
+        refspec_list = [
+            '+refs/heads/%s:refs/remotes/origin/%s' % (branch_name, branch_name),
+            '+refs/heads/%s:refs/remotes/origin/%s' % (source_branch, source_branch)
+        ]
+        if ver is not None:
+            refspec_list.append('+refs/tags/%s:refs/tags/%s' % (ver, ver))
+        res = FCMMGitTools.fetch_refs(repo_info, refspec_list)
+        if res[0] != 0:
+            return [res[0], FCMMTools.get_i18n_tips(config, 'execute_fail')]
+
+        # 确定要合并的提交
+        dest_commit = snapshot['heads'][branch_name]
+        if ver is not None:
+            source_commit = snapshot['tags'][ver]
+            source_desc = ver
+        elif tag is not None:
+            source_commit = tag
+            source_desc = tag
+            if not FCMMGitTools.is_ancestor(repo_info, tag, snapshot['heads'][source_branch]):
+                return [1, FCMMTools.get_i18n_tips(config, 'commit_not_exists', tag)]
+        else:
+            source_commit = snapshot['heads'][source_branch]
+            source_desc = source_branch
+
+        # 进行合并处理
+        if FCMMGitTools.is_ancestor(repo_info, source_commit, dest_commit):
+            # 已包含要合并的版本
+            return [0, FCMMTools.get_i18n_tips(config, 'merge_up_to_date')]
+        elif FCMMGitTools.is_ancestor(repo_info, dest_commit, source_commit):
+            # 可以快进，直接使用来源提交
+            new_commit = source_commit
+        else:
+            res = FCMMGitTools.merge_in_memory(
+                repo_info, dest_commit, source_commit,
+                'Merge %s into %s by fcmm4git' % (source_desc, branch_name))
+            if res[0] == 1:
+                return [1, FCMMTools.get_i18n_tips(config, 'merge_conflict', '\n'.join(res[2]))]
+            elif res[0] == 3:
+                return [1, FCMMTools.get_i18n_tips(
+                    config, 'merge_git_version_low',
+                    '.'.join([str(_item) for _item in FCMMGitTools.get_git_version()]))]
+            elif res[0] != 0:
+                return [res[0], FCMMTools.get_i18n_tips(config, 'execute_fail')]
+            new_commit = res[1]
+
+        # 推送到远程仓库（非强制推送，远程分支已被他人修改时会被拒绝）
+        res = FCMMTools.run_sys_cmd(
+            'git push origin %s:refs/heads/%s' % (new_commit, branch_name), cwd=repo_info.work_dir)
+        if res[0] != 0:
+            return [res[0], FCMMTools.get_i18n_tips(config, 'execute_fail')]
+        FCMMGitTools.update_local_branch(repo_info, branch_name, new_commit)
+        return [0, FCMMTools.get_i18n_tips(config, 'execute_success')]
 
 if __name__ == '__main__':
     # 当程序自己独立运行时执行的操作
@@ -8,10 +8,17 @@ fcmm针对Git的命令处理工具模块
 """
 
 import os
+import re
+import time
+import json
+import tarfile
 import datetime
 import subprocess
-from git import Repo
+from concurrent.futures import ThreadPoolExecutor
 from fcmm_tools import FCMMTools
+from fcmm_metrics import FCMMMetrics
+from fcmm_version_index import FCMMVersionIndex
+from fcmm_repo_session import RepoSession
 from snakerlib.generic import FileTools
 
 
@@ -27,6 +34,15 @@ class FCMMGitTools(object):
     fcmm针对Git的命令处理工具类
     """
 
+    # 当前git的版本号缓存
+    _git_version = None
+
+    # 后台预获取的FCMM分支（其他分支不预获取）
+    PREFETCH_BRANCH_PATTERNS = ('master', 'lb-pkg', 'lb-cfg-*', 'tb-*')
+
+    # 后台预获取的引用保存的命名空间（不与命令使用的远程跟踪分支及标签冲突）
+    PREFETCH_REF_PREFIX = 'refs/fcmm-prefetch/'
+
     @staticmethod
     def get_git_config_user_name(repo_info=None, encoding='GBK'):
         """
@@ -34,52 +50,55 @@ class FCMMGitTools(object):
 
         @decorators staticmethod - [description]
 
-        @param {dict} repo_info - repo信息字典
+        @param {RepoSession} repo_info=None - 仓库会话，不传入代表获取全局用户名
             @see FCMMGitTools.get_repo_info
         @param {string} encoding='GBK' - 命令终端编码
         """
-        cmd_str = ''
+        if repo_info is not None:
+            # 仓库用户名在会话期间缓存
+            return repo_info.get_user_name(encoding)
         username = ''
-        if repo_info is None:
-            cmd_str = 'git config --global user.name'
-        else:
-            os.chdir(repo_info['work_dir'])
-            cmd_str = 'git config user.name'
-        res = subprocess.run(cmd_str, shell=True,
+        res = subprocess.run('git config --global user.name', shell=True,
                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         if res.returncode == 0:
             username = res.stdout.decode(encoding=encoding).rstrip('\n\r')
 
         return username
 
+    @staticmethod
+    def get_git_version():
+        """
+        获取当前git的版本号
+
+        @decorators staticmethod
+
+        @returns {tuple} - 版本号元组，例如(2, 39, 5)，获取失败返回(0, )
+        """
+        if FCMMGitTools._git_version is None:
+            res = FCMMTools.run_sys_cmd_with_output('git --version')
+            match = re.search(r'(\d+)\.(\d+)(\.(\d+))?', res[1])
+            if res[0] != 0 or match is None:
+                FCMMGitTools._git_version = (0, )
+            else:
+                FCMMGitTools._git_version = (
+                    int(match.group(1)), int(match.group(2)), int(match.group(4) or 0))
+        return FCMMGitTools._git_version
+
     @staticmethod
     def get_repo_info(work_dir):
         """
-        从当前目录获取repo的信息
+        从当前目录获取仓库会话（同一工作目录在进程内共用会话，不重复创建Repo对象）
 
         @decorators staticmethod
 
         @param {string} work_dir - 工作目录
 
-        @returns {dict} - 返回repo信息字典，格式为
-            {
-                'work_dir': '当前工作目录',
-                'parent_dir': '工作目录的上一级目录',
-                'repo': 'repo对象，获取不到为None'
-            }
+        @returns {RepoSession} - 仓库会话，属性包括
+            work_dir - 当前工作目录
+            parent_dir - 工作目录的上一级目录
+            repo - git.Repo对象，获取不到为None
         """
-        repo_info = dict()
-        repo_info['work_dir'] = work_dir
-        temp_dir = work_dir.rstrip('\\/')
-        _index = temp_dir.replace('\\', '/').rfind('/')
-        repo_info['parent_dir'] = temp_dir[0: _index]
-        try:
-            repo_info['repo'] = Repo(repo_info['work_dir'])
-        except Exception as e:
-            # 忽略异常，通过repo_info['repo']是否为None来进行后续处理
-            repo_info['repo'] = None
-
-        return repo_info
+        return RepoSession.get(work_dir)
 
     @staticmethod
     def get_remote_repo_name(url):
@@ -129,11 +148,10 @@ class FCMMGitTools(object):
             if is_del_exit_dir:
                 FileTools.remove_dir(full_repo_path)
             else:
-                print('path is already exists: %s !' % (full_repo_path))
+                FCMMTools.echo('path is already exists: %s !' % (full_repo_path))
                 return [1, '']
         # 克隆远程库
-        os.chdir(full_path)  # 转到目录下
-        return FCMMTools.run_sys_cmd('git clone %s %s' % (url, repo_name))
+        return FCMMTools.run_sys_cmd('git clone %s %s' % (url, repo_name), cwd=full_path)
 
     @staticmethod
     def check_tag_exists(repo_info, tag_name):
@@ -142,19 +160,15 @@ class FCMMGitTools(object):
 
         @decorators staticmethod
 
-        @param {dict} repo_info - repo信息字典
+        @param {RepoSession} repo_info - 仓库会话
             @see FCMMGitTools.get_repo_info
         @param {string} tag_name - 要检查的版本号
 
         @returns {bool} - 版本号是否已存在
         """
-        is_exits = False
-        if repo_info is not None:
-            for tag in repo_info['repo'].tags:
-                if tag.name == tag_name:
-                    is_exits = True
-                    break
-        return is_exits
+        if repo_info is None:
+            return False
+        return tag_name in repo_info.get_tags().keys()
 
     @staticmethod
     def check_branch_exists(repo_info, branch_name):
@@ -163,20 +177,16 @@ class FCMMGitTools(object):
 
         @decorators staticmethod
 
-        @param {dict} repo_info - repo信息字典
+        @param {RepoSession} repo_info - 仓库会话
             @see FCMMGitTools.get_repo_info
         @param {string} branch_name - 要检查的分支名称
 
         @returns {bool} - 分支是否已存在
 
         """
-        is_exits = False
-        if repo_info is not None:
-            for branch in repo_info['repo'].branches:
-                if branch.name == branch_name:
-                    is_exits = True
-                    break
-        return is_exits
+        if repo_info is None:
+            return False
+        return branch_name in repo_info.get_branches().keys()
 
     @staticmethod
     def check_branch_base_commit(repo_info, check_branch, source_branch, tag_name=None, commit=None):
@@ -185,7 +195,7 @@ class FCMMGitTools(object):
 
         @decorators staticmethod
 
-        @param {dict} repo_info - repo信息字典
+        @param {RepoSession} repo_info - 仓库会话
             @see FCMMGitTools.get_repo_info
         @param {string} check_branch - 需要检查的分支
         @param {string} source_branch - 源分支
@@ -197,27 +207,20 @@ class FCMMGitTools(object):
         is_base = False
         check_commit = commit
         if tag_name is not None:
-            for tag_item in repo_info['repo'].tags:
-                if tag_item.name == tag_name:
-                    check_commit = str(tag_item.commit)
-                    break
-            if check_commit is None:
+            tag_item = repo_info.get_tags().get(tag_name)
+            if tag_item is None:
                 return False
+            check_commit = str(tag_item.commit)
         else:
             if check_commit is None:
                 # 获取最新的版本
-                for repo_branch in repo_info['repo'].branches:
-                    if repo_branch.name == source_branch:
-                        check_commit = str(repo_branch.commit)
-                        break
+                check_commit = FCMMGitTools.get_branch_commit(repo_info, source_branch)
                 if check_commit is None:
                     return False
-        # 根据check_commit进行检查
-        for repo_branch in repo_info['repo'].branches:
-            if repo_branch.name == check_branch:
-                for commit_item in repo_branch.commit.tree:
-                    if str(commit_item) == check_commit:
-                        return True
+        # 根据check_commit进行检查（比较版本在检查分支的历史节点里）
+        branch_commit = FCMMGitTools.get_branch_commit(repo_info, check_branch)
+        if branch_commit is not None:
+            is_base = FCMMGitTools.is_ancestor(repo_info, check_commit, branch_commit)
         return is_base
 
     @staticmethod
@@ -227,14 +230,14 @@ class FCMMGitTools(object):
 
         @decorators staticmethod - [description]
 
-        @param {dict} repo_info - repo信息字典
+        @param {RepoSession} repo_info - 仓库会话
             @see FCMMGitTools.get_repo_info
 
         @returns {string} - 分支名称
         """
         current_branch = ''
         if repo_info is not None:
-            current_branch = repo_info['repo'].active_branch.name
+            current_branch = repo_info.get_active_branch()
         return current_branch
 
     @staticmethod
@@ -244,69 +247,456 @@ class FCMMGitTools(object):
 
         @decorators staticmethod - [description]
 
-        @param {dict} repo_info - repo信息字典
+        @param {RepoSession} repo_info - 仓库会话
             @see FCMMGitTools.get_repo_info
 
         @returns {bool} - 是否为空，True-空仓库，False-非空仓库
         """
-        return repo_info['repo'].bare
+        return repo_info.repo.bare
 
     @staticmethod
-    def is_dirty(repo_info):
+    def is_dirty(repo_info, scope='tracked', untracked_cache=True, fsmonitor=''):
         """
         检查仓库当前分支是否存在未提交内容
+        通过git status快速检查，可利用git的untracked cache及文件系统监控（fsmonitor）减少对工作目录的扫描
 
         @decorators staticmethod - [description]
 
-        @param {dict} repo_info - repo信息字典
+        @param {RepoSession} repo_info - 仓库会话
             @see FCMMGitTools.get_repo_info
+        @param {string} scope='tracked' - 检查范围，tracked-只检查已跟踪文件，untracked-同时检查未跟踪文件
+        @param {bool} untracked_cache=True - 是否启用git的untracked cache
+        @param {string} fsmonitor='' - core.fsmonitor的取值，例如"true"（git内置监控）或监控钩子的路径，
+            为空代表不使用
 
         @returns {bool} - 是否存在未提交信息，True-存在未提交信息，False-已提交所有内容
         """
-        return repo_info['repo'].is_dirty()
+        cmd_str = 'git'
+        if untracked_cache:
+            cmd_str = cmd_str + ' -c core.untrackedCache=true'
+        if fsmonitor != '':
+            cmd_str = cmd_str + ' -c core.fsmonitor=%s' % (fsmonitor)
+        if scope == 'untracked':
+            cmd_str = cmd_str + ' status --porcelain --untracked-files=normal'
+        else:
+            cmd_str = cmd_str + ' status --porcelain --untracked-files=no'
+        res = FCMMTools.run_sys_cmd_with_output(cmd_str, cwd=repo_info.work_dir)
+        if res[0] != 0:
+            # git命令执行失败（例如fsmonitor不可用），使用原生方式检查
+            return repo_info.repo.is_dirty(untracked_files=(scope == 'untracked'))
+        return res[1].strip() != ''
 
     @staticmethod
+    def get_remote_ref_snapshot(repo_info, refresh=False):
+        """
+        获取远程仓库的分支及标签快照（通过一次ls-remote获取全部信息，并缓存在内存中）
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {bool} refresh=False - 是否忽略缓存重新获取
+
+        @returns {dict} - 快照字典，获取失败返回None，格式为
+            {
+                'time': 获取快照的时间戳,
+                'heads': {'分支名': 'commit id', ...},
+                'tags': {'标签名': '标签指向的commit id', ...}
+            }
+        """
+        snapshot = repo_info.remote_ref_snapshot
+        if snapshot is not None and not refresh:
+            return snapshot
+
+        snapshot = FCMMGitTools.list_remote_refs(repo_info.work_dir)
+        if snapshot is not None:
+            repo_info.remote_ref_snapshot = snapshot
+        return snapshot
+
+    @staticmethod
+    def list_remote_refs(work_dir):
+        """
+        通过一次ls-remote获取远程仓库的分支及标签（不缓存）
+
+        @decorators staticmethod
+
+        @param {string} work_dir - 工作目录
+
+        @returns {dict} - 快照字典，获取失败返回None，@see FCMMGitTools.get_remote_ref_snapshot
+        """
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git ls-remote --heads --tags origin', cwd=work_dir)
+        if res[0] != 0:
+            return None
+
+        snapshot = {'time': time.time(), 'heads': dict(), 'tags': dict()}
+        for line in res[1].splitlines():
+            _items = line.split('\t')
+            if len(_items) != 2:
+                continue
+            commit_id, ref_name = _items
+            if ref_name.startswith('refs/heads/'):
+                snapshot['heads'][ref_name[11:]] = commit_id
+            elif ref_name.startswith('refs/tags/'):
+                if ref_name.endswith('^{}'):
+                    # 附注标签，以解引用后的commit为准
+                    snapshot['tags'][ref_name[10:-3]] = commit_id
+                else:
+                    snapshot['tags'].setdefault(ref_name[10:], commit_id)
+        return snapshot
+
+    @staticmethod
+    def clear_remote_ref_snapshot(work_dir=None):
+        """
+        清除远程仓库快照缓存（远程仓库被修改后应调用）
+
+        @decorators staticmethod
+
+        @param {string} work_dir=None - 要清除的工作目录，不传入代表清除全部缓存
+        """
+        if work_dir is None:
+            session_list = RepoSession.all_sessions()
+        else:
+            session_list = [RepoSession.get_cached(work_dir)]
+        for _session in session_list:
+            if _session is not None:
+                _session.remote_ref_snapshot = None
+
+    @staticmethod
+    def expire_remote_ref_snapshot(ttl=0):
+        """
+        清除超过有效期的远程仓库快照缓存
+
+        @decorators staticmethod
+
+        @param {float} ttl=0 - 快照有效期（秒），0代表每个命令都重新获取
+        """
+        now = time.time()
+        for _session in RepoSession.all_sessions():
+            snapshot = _session.remote_ref_snapshot
+            if snapshot is not None and (ttl <= 0 or now - snapshot['time'] >= ttl):
+                _session.remote_ref_snapshot = None
+
+    @staticmethod
+    def get_version_index(repo_info):
+        """
+        获取版本号索引（与远程仓库快照一起缓存，快照失效时重新生成）
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+
+        @returns {FCMMVersionIndex} - 版本号索引
+        """
+        snapshot = FCMMGitTools.get_remote_ref_snapshot(repo_info)
+        if snapshot is None:
+            # 获取不到远程信息，使用本地标签生成
+            return FCMMVersionIndex(repo_info.get_tags().keys())
+        if 'version_index' not in snapshot.keys():
+            snapshot['version_index'] = FCMMVersionIndex(snapshot['tags'].keys())
+        return snapshot['version_index']
+
+    @staticmethod
+    def resolve_version(repo_info, version):
+        """
+        将-version参数的版本选择器（例如latest、d20180620~）解析为实际的版本号
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {string} version - 版本号或版本选择器，为None时直接返回None
+
+        @returns {string} - 版本号，选择器无法匹配时返回原值（由后续的版本检查提示不存在）
+            @see FCMMVersionIndex.resolve
+        """
+        if version is None:
+            return None
+        real_version = FCMMGitTools.get_version_index(repo_info).resolve(version)
+        if real_version is None:
+            return version
+        return real_version
+
+    @staticmethod
+    def get_remote_branch_commit(repo_info, branch):
+        """
+        从远程仓库快照中获取分支的最新commit
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {string} branch - 分支名
+
+        @returns {string} - 分支最新的commit id，远程分支不存在返回None
+        """
+        snapshot = FCMMGitTools.get_remote_ref_snapshot(repo_info)
+        if snapshot is None:
+            return None
+        return snapshot['heads'].get(branch)
+
+    @staticmethod
+    def check_remote_branch_exists(repo_info, branch):
+        """
+        检查远程仓库是否存在指定分支（通过快照判断，不会在本地创建分支）
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {string} branch - 分支名
+
+        @returns {bool} - 远程分支是否存在，获取远程仓库快照失败（无法判断）返回None
+        """
+        snapshot = FCMMGitTools.get_remote_ref_snapshot(repo_info)
+        if snapshot is None:
+            return None
+        return branch in snapshot['heads'].keys()
+
+    @staticmethod
+    def get_branch_commit(repo_info, branch):
+        """
+        获取本地分支的最新commit
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {string} branch - 分支名
+
+        @returns {string} - 分支最新的commit id，本地分支不存在返回None
+        """
+        return repo_info.get_branches().get(branch)
+
+    @staticmethod
+    def get_fcmm_config_by_branch(repo_info, branch):
+        """
+        不切换分支直接获取指定分支中的.fcmm4git配置信息
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {string} branch - 分支名
+
+        @returns {dict} - 返回JSON配置信息对象，如果配置文件不存在，返回None
+        """
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git show %s:.fcmm4git' % (branch), cwd=repo_info.work_dir)
+        if res[0] != 0:
+            return None
+        return json.loads(res[1])
+
+    @staticmethod
+    @RepoSession.mutating
     def get_remote_branch(repo_info, branch):
         """
-        获取远程分支到本地
+        获取远程分支到本地（仅在需要使用分支内容时调用，只判断是否存在应使用check_remote_branch_exists）
+        通过远程快照判断，如果本地分支已是最新版本则不进行网络处理，
+        非当前工作分支通过fetch直接更新，不切换工作分支
 
         @decorators staticmethod
 
-        @param {dict} repo_info - repo信息字典
+        @param {RepoSession} repo_info - 仓库会话
             @see FCMMGitTools.get_repo_info
         @param {string} branch - 分支名
 
         @returns {list} - 执行结果[returncode, msgstring, is_local_new]
-            returncode - 0代表成功，其他代表失败
-            msgstring - 要返回显示的内容
-            is_local_new - 本地是否新增分支
+            returncode - 0代表成功，3代表本地分支有未推送的提交且远程分支已被改写（无法更新），其他代表失败
+            msgstring - 要返回显示的内容，returncode为3时为'local_branch_diverged'
+            is_local_new - 本地是否新增分支（远程分支不存在时也返回True）
         """
         res = [0, '', False]
-        local_has_branch = FCMMGitTools.check_branch_exists(repo_info, branch)
-        if local_has_branch:
-            # 本地已有分支
-            res1 = FCMMTools.run_sys_cmd_list([
-                'git checkout ' + branch,
-                'git pull origin ' + branch
-            ])
-            res[0] = res1[0]
-        else:
+        remote_commit = FCMMGitTools.get_remote_branch_commit(repo_info, branch)
+        if remote_commit is None:
+            # 远程分支不存在
+            res[0] = 1
+            res[2] = True
+            return res
+
+        local_commit = FCMMGitTools.get_branch_commit(repo_info, branch)
+        if local_commit == remote_commit:
+            # 本地分支已是最新版本
+            return res
+
+        tracking_res = FCMMTools.run_sys_cmd_with_output(
+            'git rev-parse -q --verify refs/remotes/origin/%s' % (branch), cwd=repo_info.work_dir)
+        tracking_commit = tracking_res[1].strip() if tracking_res[0] == 0 else None
+        if FCMMGitTools.update_from_tracking_branch(
+                repo_info, branch, local_commit, remote_commit, tracking_commit):
+            # 远程跟踪分支已预获取到最新版本，无需网络处理
+            res[2] = (local_commit is None)
+            return res
+
+        if local_commit is None:
             # 本地没有分支，需新创建
             res1 = FCMMTools.run_sys_cmd_list([
-                'git checkout -b %s origin/%s' % (branch, branch)
-            ])
-            res[0] = res1[0]
+                'git fetch origin %s:%s' % (branch, branch),
+                'git branch --set-upstream-to=origin/%s %s' % (branch, branch)
+            ], cwd=repo_info.work_dir)
             res[2] = True
+        elif FCMMGitTools.get_active_branch(repo_info) == branch:
+            # 本地已有分支且为当前工作分支
+            res1 = FCMMTools.run_sys_cmd('git pull origin ' + branch, cwd=repo_info.work_dir)
+        else:
+            # 本地已有分支，直接更新
+            res1 = FCMMTools.run_sys_cmd(
+                'git fetch origin %s:%s' % (branch, branch), cwd=repo_info.work_dir)
+            if res1[0] != 0:
+                # 远程分支被改写（覆盖、回退等）时非快进的更新会被拒绝，获取远程版本后再判断
+                res1 = FCMMTools.run_sys_cmd(
+                    'git fetch origin +refs/heads/%s:refs/remotes/origin/%s' % (branch, branch),
+                    cwd=repo_info.work_dir)
+                if res1[0] == 0:
+                    if tracking_commit is None or not FCMMGitTools.is_ancestor(
+                            repo_info, local_commit, tracking_commit):
+                        # 本地分支有未推送的提交，不能直接覆盖
+                        return [3, 'local_branch_diverged', False]
+                    # 本地分支的提交都已推送过，直接指向远程快照的版本
+                    res1 = FCMMTools.run_sys_cmd(
+                        'git update-ref refs/heads/%s %s %s' % (branch, remote_commit, local_commit),
+                        cwd=repo_info.work_dir)
+        res[0] = res1[0]
         return res
 
     @staticmethod
+    @RepoSession.mutating
+    def update_from_tracking_branch(repo_info, branch, local_commit, remote_commit, tracking_commit):
+        """
+        使用已预获取的远程跟踪分支在本地更新分支（不访问网络）
+        仅在远程跟踪分支已是远程最新版本，且本地分支可快进时处理
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {string} branch - 分支名
+        @param {string} local_commit - 本地分支的commit id，本地分支不存在为None
+        @param {string} remote_commit - 远程分支的commit id
+        @param {string} tracking_commit - 本地远程跟踪分支的commit id，不存在为None
+
+        @returns {bool} - 是否已完成更新，False代表需通过网络更新
+        """
+        if tracking_commit != remote_commit:
+            return False
+
+        if local_commit is None:
+            cmd_list = [
+                'git branch %s %s' % (branch, remote_commit),
+                'git branch --set-upstream-to=origin/%s %s' % (branch, branch)
+            ]
+        elif not FCMMGitTools.is_ancestor(repo_info, local_commit, remote_commit):
+            return False
+        elif FCMMGitTools.get_active_branch(repo_info) == branch:
+            cmd_list = ['git merge --ff-only %s' % (remote_commit)]
+        else:
+            cmd_list = ['git update-ref refs/heads/%s %s %s' % (branch, remote_commit, local_commit)]
+
+        return FCMMTools.run_sys_cmd_list(cmd_list, cwd=repo_info.work_dir)[0] == 0
+
+    @staticmethod
+    def prefetch_remote(work_dir):
+        """
+        预获取远程仓库信息：获取远程仓库快照，并将FCMM分支及标签的对象获取到预获取命名空间
+        （@see FCMMGitTools.PREFETCH_REF_PREFIX）；只涉及网络访问及预获取命名空间，不修改命令使用的引用，
+        可以与命令并行执行，获取后需在命令执行间隙通过apply_prefetch生效
+        用于交互模式的后台线程，不输出任何信息，也不修改本地分支及工作目录
+
+        @decorators staticmethod
+
+        @param {string} work_dir - 工作目录
+
+        @returns {dict} - 远程仓库快照，预获取失败返回None，@see FCMMGitTools.get_remote_ref_snapshot
+        """
+        repo_info = FCMMGitTools.get_repo_info(work_dir)
+        if repo_info.repo is None:
+            return None
+        if 'origin' not in [_remote.name for _remote in repo_info.repo.remotes]:
+            return None
+        snapshot = FCMMGitTools.list_remote_refs(work_dir)
+        if snapshot is None:
+            return None
+        refspec_list = [
+            '"+refs/heads/%s:%sheads/%s"' % (_pattern, FCMMGitTools.PREFETCH_REF_PREFIX, _pattern)
+            for _pattern in FCMMGitTools.PREFETCH_BRANCH_PATTERNS
+        ]
+        refspec_list.append('"+refs/tags/*:%stags/*"' % (FCMMGitTools.PREFETCH_REF_PREFIX))
+        # --refmap=""避免git按remote.origin.fetch的配置顺带更新远程跟踪分支
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git fetch -q --prune --no-tags --refmap="" origin %s' % (' '.join(refspec_list)),
+            cwd=work_dir)
+        if res[0] != 0:
+            return None
+        return snapshot
+
+    @staticmethod
+    def apply_prefetch(work_dir, snapshot):
+        """
+        使预获取的结果生效（只执行本地操作，耗时很短）：
+        按预获取命名空间更新FCMM分支的远程跟踪分支（删除远程已不存在的分支），补充本地没有的标签，并替换远程仓库快照
+
+        @decorators staticmethod
+
+        @param {string} work_dir - 工作目录
+        @param {dict} snapshot - 预获取的远程仓库快照，@see FCMMGitTools.prefetch_remote
+
+        @returns {bool} - 是否生效成功
+        """
+        repo_info = FCMMGitTools.get_repo_info(work_dir)
+        prefix = FCMMGitTools.PREFETCH_REF_PREFIX
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git for-each-ref --format="%%(refname) %%(objectname)" %s refs/remotes/origin refs/tags' % (
+                prefix.rstrip('/')),
+            cwd=work_dir)
+        if res[0] != 0:
+            return False
+        prefetch_heads = dict()
+        prefetch_tags = dict()
+        tracking_heads = dict()
+        local_tags = set()
+        for _line in res[1].splitlines():
+            _items = _line.split(' ')
+            if len(_items) != 2:
+                continue
+            _ref, _commit = _items
+            if _ref.startswith(prefix + 'heads/'):
+                prefetch_heads[_ref[len(prefix) + 6:]] = _commit
+            elif _ref.startswith(prefix + 'tags/'):
+                prefetch_tags[_ref[len(prefix) + 5:]] = _commit
+            elif _ref.startswith('refs/remotes/origin/'):
+                tracking_heads[_ref[20:]] = _commit
+            else:
+                local_tags.add(_ref[10:])
+
+        stdin_list = list()
+        for _branch, _commit in prefetch_heads.items():
+            if tracking_heads.get(_branch) != _commit:
+                stdin_list.append('update refs/remotes/origin/%s %s\n' % (_branch, _commit))
+        for _branch in tracking_heads.keys():
+            if _branch not in prefetch_heads.keys() and FCMMGitTools.get_branch_type(_branch) != '':
+                stdin_list.append('delete refs/remotes/origin/%s\n' % (_branch))
+        for _tag, _commit in prefetch_tags.items():
+            if _tag not in local_tags:
+                stdin_list.append('create refs/tags/%s %s\n' % (_tag, _commit))
+        if len(stdin_list) > 0:
+            res = FCMMTools.run_sys_cmd_with_output(
+                'git update-ref --stdin', cwd=work_dir, input_str=''.join(stdin_list))
+            repo_info.invalidate()
+            if res[0] != 0:
+                return False
+        repo_info.remote_ref_snapshot = snapshot
+        return True
+
+    @staticmethod
+    @RepoSession.mutating
     def rollback_to_tag(repo_info, branch, tag):
         """
         回滚指定分支到指定的标签
 
         @decorators staticmethod - [description]
 
-        @param {dict} repo_info - repo信息字典
+        @param {RepoSession} repo_info - 仓库会话
             @see FCMMGitTools.get_repo_info
         @param {string} branch - 分支名
         @param {string} tag - 标签名
@@ -315,31 +705,28 @@ class FCMMGitTools(object):
             returncode - 0代表成功，其他代表失败
             msgstring - 要返回显示的内容
         """
-        commit_id = ''
-        for tag_item in repo_info['repo'].tags:
-            if tag_item.name == tag:
-                commit_id = str(tag_item.commit)
-                break
-        if commit_id == '':
+        tag_item = repo_info.get_tags().get(tag)
+        if tag_item is None:
             return [1, 'tag_not_exists']
+        commit_id = str(tag_item.commit)
 
         current_branch = FCMMGitTools.get_active_branch(repo_info)
-        os.chdir(repo_info['work_dir'])
         return FCMMTools.run_sys_cmd_list([
             'git checkout %s' % (branch),
             'git reset --hard %s' % (commit_id),
             'git push -f origin %s' % (branch),
             'git checkout %s' % (current_branch)
-        ])
+        ], cwd=repo_info.work_dir)
 
     @staticmethod
+    @RepoSession.mutating
     def rollback_to_commit(repo_info, branch, commit):
         """
         回滚指定分支到指定的提交版本
 
         @decorators staticmethod - [description]
 
-        @param {dict} repo_info - repo信息字典
+        @param {RepoSession} repo_info - 仓库会话
             @see FCMMGitTools.get_repo_info
         @param {string} branch - 分支名
         @param {string} commit - 提交标签
@@ -349,76 +736,205 @@ class FCMMGitTools(object):
             msgstring - 要返回显示的内容
         """
         current_branch = FCMMGitTools.get_active_branch(repo_info)
-        os.chdir(repo_info['work_dir'])
         return FCMMTools.run_sys_cmd_list([
             'git checkout %s' % (branch),
             'git reset --hard %s' % (commit),
             'git push -f origin %s' % (branch),
             'git checkout %s' % (current_branch)
-        ])
+        ], cwd=repo_info.work_dir)
 
     @staticmethod
-    def add_branch(repo_info, new_branch, src_branch=None, tag=None, is_bare=False, commit=None):
+    def get_branch_type(branch):
         """
-        通过其他分支或版本标签创建新分支
+        获取FCMM分支的类型
 
-        @decorators staticmethod - [description]
+        @decorators staticmethod
+
+        @param {string} branch - 分支名
+
+        @returns {string} - 分支类型，master/lb-pkg/lb-cfg/tb-bak/tb-dev/tb，非FCMM分支返回''
+        """
+        if branch in ('master', 'lb-pkg'):
+            return branch
+        for _prefix in ('lb-cfg', 'tb-bak', 'tb-dev', 'tb'):
+            if branch.startswith(_prefix + '-'):
+                return _prefix
+        return ''
+
+    @staticmethod
+    def get_sparse_checkout_state(repo_info, fcmm_config):
+        """
+        获取工作目录当前的稀疏检出（sparse-checkout）状态
+        fcmm应用稀疏检出配置后会在数据目录登记标记文件，用于区分用户自己设置的稀疏检出
+
+        @decorators staticmethod
 
-        @param {dict} repo_info - repo信息字典
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {dict} fcmm_config - .fcmm4git配置信息，没有配置稀疏检出时不检查，直接返回''
+
+        @returns {string} - 稀疏检出状态，fcmm-由fcmm应用，user-由用户设置，''-未启用
+        """
+        if fcmm_config is None or not fcmm_config.get('sparse_checkout'):
+            return ''
+        # 通过git命令获取，稀疏检出的配置可能在config.worktree中
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git config --bool core.sparseCheckout', cwd=repo_info.work_dir)
+        if res[1].strip() != 'true':
+            return ''
+        marker_file = os.path.join(FCMMGitTools.get_fcmm_data_path(repo_info), 'sparse_checkout')
+        return 'fcmm' if os.path.exists(marker_file) else 'user'
+
+    @staticmethod
+    def save_sparse_checkout_state(repo_info, fcmm_config, sparse_state):
+        """
+        执行切换分支的命令后登记稀疏检出是否由fcmm应用（用户设置的稀疏检出不处理）
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {dict} fcmm_config - .fcmm4git配置信息
+        @param {string} sparse_state - 执行命令前的稀疏检出状态，@see FCMMGitTools.get_sparse_checkout_state
+        """
+        if sparse_state == 'user' or fcmm_config is None or not fcmm_config.get('sparse_checkout'):
+            return
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git config --bool core.sparseCheckout', cwd=repo_info.work_dir)
+        marker_file = os.path.join(FCMMGitTools.get_fcmm_data_path(repo_info), 'sparse_checkout')
+        if res[1].strip() == 'true':
+            with open(marker_file, 'w', encoding='utf-8') as f:
+                f.write('fcmm4git')
+        elif os.path.exists(marker_file):
+            os.remove(marker_file)
+
+    @staticmethod
+    def get_sparse_checkout_cmds(fcmm_config, branch, sparse_state=''):
+        """
+        获取切换到指定分支前应用稀疏检出（sparse-checkout）配置的命令
+        配置在.fcmm4git的sparse_checkout中按分支类型登记，例如{"lb-cfg": ["config/**"]}，根目录的.fcmm4git总是检出；
+        用户自己设置的稀疏检出不做修改，没有配置的分支类型只关闭fcmm应用的稀疏检出
+
+        @decorators staticmethod
+
+        @param {dict} fcmm_config - .fcmm4git配置信息，为None代表不处理
+        @param {string} branch - 要切换到的分支名
+        @param {string} sparse_state='' - 当前的稀疏检出状态，@see FCMMGitTools.get_sparse_checkout_state
+
+        @returns {list} - [cmd_list, sparse_state]
+            cmd_list - 要执行的命令列表，不需要处理时为空列表
+            sparse_state - 执行命令后的稀疏检出状态
+        """
+        if fcmm_config is None or not fcmm_config.get('sparse_checkout') or sparse_state == 'user':
+            return [[], sparse_state]
+        patterns = fcmm_config['sparse_checkout'].get(FCMMGitTools.get_branch_type(branch))
+        if patterns:
+            # 根目录的.fcmm4git配置文件总是检出，fcmm需要通过工作目录读取
+            patterns = ['/.fcmm4git'] + [_pattern for _pattern in patterns if _pattern != '/.fcmm4git']
+            return [['git sparse-checkout set --no-cone %s' % (
+                ' '.join(['"%s"' % (_pattern) for _pattern in patterns]))], 'fcmm']
+        elif sparse_state == 'fcmm':
+            # 该类型分支没有配置，关闭之前应用的稀疏检出，检出全部文件
+            return [['git sparse-checkout disable'], '']
+        return [[], sparse_state]
+
+    @staticmethod
+    def create_bare_commit(repo_info, message='add bare branch by fcmm4git'):
+        """
+        创建一个指向空目录树的提交（不需要切换分支及删除工作目录的文件）
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {string} message='add bare branch by fcmm4git' - 提交信息
+
+        @returns {list} - 执行结果[returncode, commit_id]
+            returncode - 0代表成功，其他代表失败
+            commit_id - 新建提交的commit id
+        """
+        # 写入空目录树对象
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git hash-object -w -t tree --stdin', cwd=repo_info.work_dir, input_str='')
+        if res[0] != 0:
+            return [res[0], '']
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git commit-tree %s -m "%s"' % (res[1].strip(), message), cwd=repo_info.work_dir)
+        if res[0] != 0:
+            return [res[0], '']
+        return [0, res[1].strip()]
+
+    @staticmethod
+    def get_branch_start_point(repo_info, src_branch=None, tag=None, is_bare=False, commit=None):
+        """
+        获取创建或覆盖分支的起始版本
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
             @see FCMMGitTools.get_repo_info
-        @param {string} new_branch - 新分支名
         @param {string} src_branch=None - 源分支名
         @param {string} tag=None - 标签名
         @param {is_bare} is_bare=False - 是否创建空分支
             tag、src_branch、is_bare=True参数只需传入其中一个，优先取tag、其次为src_branch，最后为is_bare
         @param {string} commit=None - 如果是src_branch的情况，通过该参数获取指定commit的版本
 
-        @returns {list} - 执行结果[returncode, msgstring]
+        @returns {list} - 执行结果[returncode, start_point]
             returncode - 0代表成功，其他代表失败
-            msgstring - 要返回显示的内容
+            start_point - 起始版本（标签名、分支名或commit id），失败时为错误信息
         """
-        current_branch = FCMMGitTools.get_active_branch(repo_info)
-        os.chdir(repo_info['work_dir'])
-        cmd_list = []
         if tag is not None:
             # 通过标签版本创建
-            commit_id = ''
-            for tag_item in repo_info['repo'].tags:
-                if tag_item.name == tag:
-                    commit_id = str(tag_item.commit)
-                    break
-            if commit_id == '':
+            if tag not in repo_info.get_tags().keys():
                 return [1, 'tag_not_exists']
-            cmd_list.append('git branch %s %s' % (new_branch, tag))
-            cmd_list.append('git checkout %s' % (new_branch))
+            return [0, tag]
         elif src_branch is not None:
             # 通过其他分支创建
-            cmd_list.append('git checkout %s' % (src_branch))
-            if commit is None:
-                cmd_list.append('git checkout -b %s' % (new_branch))
-            else:
-                cmd_list.append('git checkout -b %s %s' % (new_branch, commit))
+            return [0, src_branch if commit is None else commit]
         elif is_bare:
-            # 创建空库
-            cmd_list.append('git checkout master')
-            cmd_list.append('git checkout --orphan %s' % (new_branch))
-            cmd_list.append('git rm -rf .')
-            cmd_list.append('git commit -am "add bare branch by fcmm4git"')
-        else:
-            return [1, 'para tag、src_branch、is_bare=True must input one!']
+            # 创建空库，直接将分支指向空目录树的提交
+            return FCMMGitTools.create_bare_commit(repo_info)
+        return [1, 'para tag、src_branch、is_bare=True must input one!']
+
+    @staticmethod
+    @RepoSession.mutating
+    def add_branch(repo_info, new_branch, src_branch=None, tag=None, is_bare=False, commit=None):
+        """
+        通过其他分支或版本标签创建新分支（直接创建分支引用并推送，不切换分支，不修改工作目录）
 
-        cmd_list.append('git push origin %s' % (new_branch))
-        cmd_list.append('git checkout %s' % (current_branch))
-        return FCMMTools.run_sys_cmd_list(cmd_list)
+        @decorators staticmethod - [description]
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {string} new_branch - 新分支名
+        @param {string} src_branch=None - 源分支名
+        @param {string} tag=None - 标签名
+        @param {is_bare} is_bare=False - 是否创建空分支
+            tag、src_branch、is_bare=True参数只需传入其中一个，优先取tag、其次为src_branch，最后为is_bare
+        @param {string} commit=None - 如果是src_branch的情况，通过该参数获取指定commit的版本
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 要返回显示的内容
+        """
+        res = FCMMGitTools.get_branch_start_point(repo_info, src_branch, tag, is_bare, commit)
+        if res[0] != 0:
+            return res
+        return FCMMTools.run_sys_cmd_list([
+            'git branch %s %s' % (new_branch, res[1]),
+            'git push origin %s' % (new_branch)
+        ], cwd=repo_info.work_dir)
 
     @staticmethod
-    def overwrite_branch(repo_info, dest_branch, src_branch=None, tag=None, is_bare=False, commit=None):
+    @RepoSession.mutating
+    def overwrite_branch(repo_info, dest_branch, src_branch=None, tag=None, is_bare=False, commit=None,
+                         fcmm_config=None):
         """
-        通过某分支覆盖指定分支
+        通过某分支覆盖指定分支（不切换分支，只有覆盖当前工作分支时才更新工作目录）
 
         @decorators staticmethod - [description]
 
-        @param {dict} repo_info - repo信息字典
+        @param {RepoSession} repo_info - 仓库会话
             @see FCMMGitTools.get_repo_info
         @param {string} src_branch - 源分支名
         @param {string} dest_branch - 目标分支名
@@ -426,55 +942,40 @@ class FCMMGitTools(object):
         @param {is_bare} is_bare=False - 是否创建空分支
             tag、src_branch、is_bare=True参数只需传入其中一个，优先取tag、其次为src_branch，最后为is_bare
         @param {string} commit=None - 如果是src_branch的情况，通过该参数获取指定commit的版本
+        @param {dict} fcmm_config=None - .fcmm4git配置信息，覆盖当前工作分支时按分支类型应用稀疏检出配置
 
         @returns {list} - 执行结果[returncode, msgstring]
             returncode - 0代表成功，其他代表失败
             msgstring - 要返回显示的内容
         """
-        current_branch = FCMMGitTools.get_active_branch(repo_info)
-        os.chdir(repo_info['work_dir'])
-        cmd_list = []
-        cmd_list.append('git checkout master')
-        cmd_list.append('git branch -d %s' % (dest_branch))  # 删除分支
-        if tag is not None:
-            # 使用标签创建
-            commit_id = ''
-            for tag_item in repo_info['repo'].tags:
-                if tag_item.name == tag:
-                    commit_id = str(tag_item.commit)
-                    break
-            if commit_id == '':
-                return [1, 'tag_not_exists']
-            cmd_list.append('git branch %s %s' % (dest_branch, tag))
-            cmd_list.append('git checkout %s' % (dest_branch))
-        elif src_branch is not None:
-            # 使用其他分支创建
-            cmd_list.append('git checkout %s' % (src_branch))
-            if commit is None:
-                cmd_list.append('git checkout -b %s' % (dest_branch))
-            else:
-                cmd_list.append('git checkout -b %s %s' % (dest_branch, commit))
-        elif is_bare:
-            # 创建空库
-            cmd_list.append('git checkout master')
-            cmd_list.append('git checkout --orphan %s' % (dest_branch))
-            cmd_list.append('git rm -rf .')
-            cmd_list.append('git commit -am "add bare branch by fcmm4git"')
-        else:
-            return [1, 'para tag、src_branch、is_bare=True must input one!']
-
+        res = FCMMGitTools.get_branch_start_point(repo_info, src_branch, tag, is_bare, commit)
+        if res[0] != 0:
+            return res
+        start_point = res[1]
+        if dest_branch != FCMMGitTools.get_active_branch(repo_info):
+            return FCMMTools.run_sys_cmd_list([
+                'git branch -f %s %s' % (dest_branch, start_point),
+                'git push -f origin %s' % (dest_branch)
+            ], cwd=repo_info.work_dir)
+
+        # 覆盖的是当前工作分支，需同步更新工作目录，工作目录保持在该类型的分支，先应用其稀疏检出配置
+        sparse_state = FCMMGitTools.get_sparse_checkout_state(repo_info, fcmm_config)
+        cmd_list = FCMMGitTools.get_sparse_checkout_cmds(fcmm_config, dest_branch, sparse_state)[0]
+        cmd_list.append('git reset --hard %s' % (start_point))
         cmd_list.append('git push -f origin %s' % (dest_branch))
-        cmd_list.append('git checkout %s' % (current_branch))
-        return FCMMTools.run_sys_cmd_list(cmd_list)
+        res = FCMMTools.run_sys_cmd_list(cmd_list, cwd=repo_info.work_dir)
+        FCMMGitTools.save_sparse_checkout_state(repo_info, fcmm_config, sparse_state)
+        return res
 
     @staticmethod
+    @FCMMMetrics.phase('backup')
     def backup_branch(repo_info, branch, op_user=''):
         """
         备份指定分支
 
         @decorators staticmethod - [description]
 
-        @param {dict} repo_info - repo信息字典
+        @param {RepoSession} repo_info - 仓库会话
             @see FCMMGitTools.get_repo_info
         @param {string} branch - 要备份的分支
         @param {string} op_user='' - 操作人
@@ -483,11 +984,528 @@ class FCMMGitTools(object):
             returncode - 0代表成功，其他代表失败
             msgstring - 要返回显示的内容
         """
+        backup_name = FCMMGitTools.get_backup_branch_name(branch, op_user)
+        return FCMMGitTools.add_branch(repo_info, backup_name, branch)
+
+    @staticmethod
+    def get_backup_branch_name(branch, op_user=''):
+        """
+        获取分支的备份分支名
+
+        @decorators staticmethod
+
+        @param {string} branch - 要备份的分支
+        @param {string} op_user='' - 操作人
+
+        @returns {string} - 备份分支名，格式为tb-bak-分支名-时间[-by-操作人]
+        """
         backup_name = 'tb-bak-' + branch + '-' + datetime.datetime.now().strftime("%Y%m%d%H%M%S")
         if op_user != '':
             backup_name = backup_name + '-by-' + op_user
-        return FCMMGitTools.add_branch(repo_info, backup_name, branch)
+        return backup_name
+
+    @staticmethod
+    @RepoSession.mutating
+    def fetch_refs(repo_info, refspec_list):
+        """
+        通过一次fetch获取多个远程引用（只更新引用及对象，不切换分支）
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {string[]} refspec_list - refspec清单，例如['+refs/heads/lb-pkg:refs/remotes/origin/lb-pkg']
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 要返回显示的内容
+        """
+        return FCMMTools.run_sys_cmd(
+            'git fetch origin %s' % (' '.join(refspec_list)), cwd=repo_info.work_dir)
+
+    @staticmethod
+    @RepoSession.mutating
+    def push_atomic(repo_info, refspec_list, lease_dict=None):
+        """
+        通过一次原子推送更新远程仓库的多个引用（全部成功或全部不更新）
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {string[]} refspec_list - refspec清单，例如['refs/tags/v1.0.1:refs/tags/v1.0.1']
+        @param {dict} lease_dict=None - 需覆盖的远程引用，key为引用全名，value为预期的远程commit id
+            （''代表预期引用不存在），远程引用已被他人修改时推送被拒绝
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 要返回显示的内容
+        """
+        cmd_str = 'git push --atomic origin'
+        if lease_dict is not None:
+            for _ref, _commit in lease_dict.items():
+                cmd_str = cmd_str + ' --force-with-lease=%s:%s' % (_ref, _commit)
+        return FCMMTools.run_sys_cmd(
+            '%s %s' % (cmd_str, ' '.join(refspec_list)), cwd=repo_info.work_dir)
+
+    @staticmethod
+    def has_commit(repo_info, commit):
+        """
+        检查本地仓库是否已有指定提交的对象
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {string} commit - commit id
+
+        @returns {bool} - 是否已有提交
+        """
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git cat-file -e %s^{commit}' % (commit), cwd=repo_info.work_dir)
+        return res[0] == 0
+
+    @staticmethod
+    def is_ancestor(repo_info, ancestor, commit):
+        """
+        检查提交是否为另一提交的祖先（或同一提交）
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {string} ancestor - 要检查的祖先提交
+        @param {string} commit - 要检查的提交
 
+        @returns {bool} - ancestor是否为commit的祖先
+        """
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git merge-base --is-ancestor %s %s' % (ancestor, commit), cwd=repo_info.work_dir)
+        return res[0] == 0
+
+    @staticmethod
+    def merge_in_memory(repo_info, dest_commit, source_commit, message):
+        """
+        在内存中进行三方合并并生成合并提交（不检出任何分支，不修改工作目录）
+        需要git 2.38以上版本支持merge-tree --write-tree
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {string} dest_commit - 合并目标的提交
+        @param {string} source_commit - 合并来源的提交
+        @param {string} message - 合并提交的信息
+
+        @returns {list} - 执行结果[returncode, commit_id, conflict_files]
+            returncode - 0代表成功，1代表存在冲突，3代表git版本过低，其他代表失败
+            commit_id - 合并后生成的commit id
+            conflict_files - 存在冲突的文件清单
+        """
+        if FCMMGitTools.get_git_version() < (2, 38):
+            # 低版本的merge-tree为旧的输出格式，不能生成合并的目录树
+            return [3, '', []]
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git merge-tree --write-tree --name-only --no-messages %s %s' % (
+                dest_commit, source_commit),
+            cwd=repo_info.work_dir)
+        lines = [_line for _line in res[1].splitlines() if _line != '']
+        if res[0] == 1:
+            # 存在冲突，第一行为目录树，后续为冲突文件
+            return [1, '', lines[1:]]
+        elif res[0] != 0 or len(lines) == 0:
+            return [2, '', []]
+
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git commit-tree %s -p %s -p %s -m "%s"' % (
+                lines[0], dest_commit, source_commit, message),
+            cwd=repo_info.work_dir)
+        if res[0] != 0:
+            return [res[0], '', []]
+        return [0, res[1].strip(), []]
+
+    @staticmethod
+    @RepoSession.mutating
+    def update_local_branch(repo_info, branch, commit):
+        """
+        推送后同步本地分支到指定提交（仅在本地分支为该提交的祖先时更新，不覆盖本地的修改）
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {string} branch - 分支名
+        @param {string} commit - 要更新到的commit id
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 要返回显示的内容
+        """
+        local_commit = FCMMGitTools.get_branch_commit(repo_info, branch)
+        if local_commit is None or not FCMMGitTools.is_ancestor(repo_info, local_commit, commit):
+            return [0, '']
+        if FCMMGitTools.get_active_branch(repo_info) == branch:
+            return FCMMTools.run_sys_cmd(
+                'git merge --ff-only %s' % (commit), cwd=repo_info.work_dir)
+        else:
+            return FCMMTools.run_sys_cmd(
+                'git update-ref refs/heads/%s %s %s' % (branch, commit, local_commit),
+                cwd=repo_info.work_dir)
+
+    @staticmethod
+    def get_ahead_behind(repo_info, base_commit, ref_list, workers=8):
+        """
+        批量计算多个引用相对基础提交的领先及落后提交数
+        git 2.41以上版本通过for-each-ref的ahead-behind在一次历史遍历中完成，
+        低版本通过线程池对各引用并行计算
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {string} base_commit - 基础提交
+        @param {string[]} ref_list - 要计算的引用清单，例如['refs/remotes/origin/tb-req-xq01']
+        @param {int} workers=8 - 低版本git并行计算的线程数
+
+        @returns {dict} - 计算结果，key为引用，value为(ahead, behind)，计算失败的引用不在结果中
+        """
+        result = dict()
+        if len(ref_list) == 0:
+            return result
+
+        if FCMMGitTools.get_git_version() >= (2, 41):
+            res = FCMMTools.run_sys_cmd_with_output(
+                'git for-each-ref --format="%%(refname) %%(ahead-behind:%s)" %s' % (
+                    base_commit, ' '.join(ref_list)),
+                cwd=repo_info.work_dir)
+            if res[0] == 0:
+                for line in res[1].splitlines():
+                    _items = line.split(' ')
+                    if len(_items) == 3:
+                        result[_items[0]] = (int(_items[1]), int(_items[2]))
+                return result
+
+        def count_ref(ref):
+            # 左侧为只在基础提交中的提交（落后），右侧为只在引用中的提交（领先）
+            _res = FCMMTools.run_sys_cmd_with_output(
+                'git rev-list --left-right --count %s...%s' % (base_commit, ref),
+                cwd=repo_info.work_dir)
+            _items = _res[1].split()
+            if _res[0] != 0 or len(_items) != 2:
+                return (ref, None)
+            return (ref, (int(_items[1]), int(_items[0])))
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for ref, counts in executor.map(count_ref, ref_list):
+                if counts is not None:
+                    result[ref] = counts
+        return result
+
+    @staticmethod
+    def get_base_tags(repo_info, ref_list, workers=8):
+        """
+        获取多个引用最近的版本标签（git describe --tags --abbrev=0）
+        git 2.40及以上通过一次for-each-ref获取，否则通过一次传入全部引用的describe获取，
+        有引用没有标签时describe整体失败，再按引用并行逐个获取
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {string[]} ref_list - 引用清单，例如['refs/remotes/origin/tb-req-a']
+        @param {int} workers=8 - 逐个获取时的并行线程数
+
+        @returns {dict} - key为引用，value为最近的版本标签，没有标签的引用为''
+        """
+        result = dict()
+        if len(ref_list) == 0:
+            return result
+
+        if FCMMGitTools.get_git_version() >= (2, 40):
+            res = FCMMTools.run_sys_cmd_with_output(
+                'git for-each-ref --format="%%(refname) %%(describe:tags=true,abbrev=0)" %s' % (
+                    ' '.join(ref_list)),
+                cwd=repo_info.work_dir)
+            if res[0] == 0:
+                for line in res[1].splitlines():
+                    _items = line.split(' ', 1)
+                    if len(_items) == 2:
+                        result[_items[0]] = _items[1].strip()
+                return result
+
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git describe --tags --abbrev=0 %s' % (' '.join(ref_list)), cwd=repo_info.work_dir)
+        tag_list = res[1].splitlines()
+        if res[0] == 0 and len(tag_list) == len(ref_list):
+            for _ref, _tag in zip(ref_list, tag_list):
+                result[_ref] = _tag.strip()
+            return result
+
+        def describe_ref(ref):
+            _res = FCMMTools.run_sys_cmd_with_output(
+                'git describe --tags --abbrev=0 %s' % (ref), cwd=repo_info.work_dir)
+            return (ref, _res[1].strip() if _res[0] == 0 else '')
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for _ref, _tag in executor.map(describe_ref, ref_list):
+                result[_ref] = _tag
+        return result
+
+    @staticmethod
+    def get_fcmm_data_path(repo_info):
+        """
+        获取仓库中fcmm4git的数据目录（位于.git目录下，不纳入版本管理），目录不存在时自动创建
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+
+        @returns {string} - 数据目录路径
+        """
+        data_path = os.path.join(repo_info.repo.git_dir, 'fcmm4git')
+        if not os.path.exists(data_path):
+            os.makedirs(data_path)
+        return data_path
+
+    @staticmethod
+    def get_branch_commit_map(repo_info):
+        """
+        一次获取全部分支的最新commit（远程跟踪分支优先，补充仅本地存在的分支）
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+
+        @returns {dict} - key为分支名，value为[引用名, commit id]
+        """
+        branch_map = dict()
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git for-each-ref --format="%(refname) %(objectname)" refs/heads refs/remotes/origin',
+            cwd=repo_info.work_dir)
+        if res[0] != 0:
+            return branch_map
+        remote_map = dict()
+        for line in res[1].splitlines():
+            _items = line.split(' ')
+            if len(_items) != 2:
+                continue
+            if _items[0].startswith('refs/heads/'):
+                branch_map[_items[0][11:]] = _items
+            elif _items[0] != 'refs/remotes/origin/HEAD':
+                remote_map[_items[0][20:]] = _items
+        branch_map.update(remote_map)
+        return branch_map
+
+    @staticmethod
+    def update_topology_index(repo_info, base_branch, workers=8, rebuild=False):
+        """
+        增量更新FCMM分支拓扑索引，索引保存在仓库数据目录的topology.json中
+        只重新计算上次更新后提交发生变化的分支，基础分支变化时重新计算全部分支的领先及落后提交数
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {string} base_branch - 计算领先及落后提交数的基础分支，例如lb-pkg
+        @param {int} workers=8 - 并行计算的线程数
+        @param {bool} rebuild=False - 是否忽略已有索引重新生成
+
+        @returns {dict} - 拓扑索引，格式为
+            {
+                'base_branch': '基础分支',
+                'base_commit': '基础分支的commit id',
+                'branches': {
+                    '分支名': {
+                        'type': '分支类型', 'commit': 'commit id', 'base_tag': '最近的版本标签',
+                        'ahead': 领先提交数, 'behind': 落后提交数
+                    }, ...
+                }
+            }
+        """
+        index_file = os.path.join(FCMMGitTools.get_fcmm_data_path(repo_info), 'topology.json')
+        index = None
+        if not rebuild and os.path.exists(index_file):
+            with open(index_file, 'r', encoding='utf-8') as f:
+                index = json.loads(f.read())
+        if index is None or index.get('base_branch') != base_branch:
+            index = {'base_branch': base_branch, 'base_commit': '', 'branches': dict()}
+
+        branch_map = FCMMGitTools.get_branch_commit_map(repo_info)
+        base_commit = branch_map.get(base_branch, ['', ''])[1]
+        old_branches = index['branches']
+        new_branches = dict()
+        changed_list = list()
+        for _branch, (_ref, _commit) in branch_map.items():
+            _type = FCMMGitTools.get_branch_type(_branch)
+            if _type == '':
+                # 非FCMM分支不登记
+                continue
+            _item = old_branches.get(_branch)
+            if _item is None or _item['commit'] != _commit:
+                _item = {'type': _type, 'commit': _commit, 'base_tag': '', 'ahead': 0, 'behind': 0}
+                changed_list.append(_branch)
+            new_branches[_branch] = _item
+
+        # 重新计算版本标签，只处理发生变化的分支
+        base_tags = FCMMGitTools.get_base_tags(
+            repo_info, [branch_map[_branch][0] for _branch in changed_list], workers)
+        for _branch in changed_list:
+            new_branches[_branch]['base_tag'] = base_tags.get(branch_map[_branch][0], '')
+
+        # 重新计算领先及落后提交数，基础分支变化时全部重新计算
+        if base_commit != index['base_commit']:
+            count_list = list(new_branches.keys())
+        else:
+            count_list = changed_list
+        if base_commit != '':
+            counts = FCMMGitTools.get_ahead_behind(
+                repo_info, base_commit, [branch_map[_branch][0] for _branch in count_list], workers)
+            for _branch in count_list:
+                _counts = counts.get(branch_map[_branch][0], (0, 0))
+                new_branches[_branch]['ahead'] = _counts[0]
+                new_branches[_branch]['behind'] = _counts[1]
+
+        index['base_commit'] = base_commit
+        index['branches'] = new_branches
+        if len(changed_list) > 0 or len(new_branches) != len(old_branches) or len(count_list) > 0:
+            FCMMTools.save_to_json_file(index_file, index)
+        return index
+
+    @staticmethod
+    @FCMMMetrics.phase('backup')
+    def backup_repo_delta(repo_info, save_path, save_name, temp_path):
+        """
+        增量备份本地仓库：只备份git无法从远程仓库重建的内容
+        备份包中包括：
+            manifest.json - HEAD的commit id、当前分支、远程仓库url、本地引用清单及备份文件清单
+            files/ - 未跟踪、已修改及被忽略的文件
+            local-refs.bundle - 仅在本地存在的提交，包括HEAD（git bundle格式，没有本地提交时不生成）
+        恢复时克隆远程仓库，从bundle获取本地提交并检出HEAD，再将files/下的文件复制回工作目录即可；
+        本地仓库没有远程跟踪分支（从未fetch）时无法判断哪些提交仅在本地存在，返回失败由调用方改为全量备份
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+            @see FCMMGitTools.get_repo_info
+        @param {string} save_path - 保存路径
+        @param {string} save_name - 保存文件名
+        @param {string} temp_path - 临时目录，bundle及manifest等中间文件写入本次执行独立的工作目录
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败（不生成备份文件）
+            msgstring - 要返回显示的内容
+        """
+        tar_file = os.path.join(save_path, save_name)
+        temp_workspace = FCMMTools.create_temp_workspace(temp_path, prefix='fcmm-delta-')
+        try:
+            res = FCMMGitTools._write_delta_tar(repo_info, tar_file, temp_workspace)
+        except Exception as e:
+            res = [1, 'delta backup error: %s' % (str(e))]
+        finally:
+            FileTools.remove_dir(temp_workspace)
+        if res[0] != 0:
+            # 删除未完成的备份文件
+            if os.path.exists(tar_file):
+                os.remove(tar_file)
+            return res
+        FCMMMetrics.record_backup(tar_file)
+        return [0, '']
+
+    @staticmethod
+    def _write_delta_tar(repo_info, tar_file, temp_workspace):
+        """
+        生成增量备份文件，@see FCMMGitTools.backup_repo_delta
+
+        @decorators staticmethod
+
+        @param {RepoSession} repo_info - 仓库会话
+        @param {string} tar_file - 备份文件路径
+        @param {string} temp_workspace - 中间文件的临时工作目录
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 要返回显示的内容
+        """
+        work_dir = repo_info.work_dir.rstrip('\\/')
+        res = FCMMTools.run_sys_cmd_with_output('git rev-parse HEAD', cwd=work_dir)
+        if res[0] != 0:
+            return [res[0], 'get HEAD commit failed']
+        manifest = {
+            'head': res[1].strip(),
+            'branch': FCMMGitTools.get_active_branch(repo_info),
+            'remote_url': '',
+            'refs': dict(),
+            'files': list(),
+            'bundle': ''
+        }
+        for remote_obj in repo_info.repo.remotes:
+            if remote_obj.name == 'origin':
+                manifest['remote_url'] = remote_obj.url
+
+        # 本地引用清单，同时检查是否有远程跟踪分支
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git for-each-ref --format="%(refname) %(objectname)" '
+            'refs/heads refs/tags refs/stash refs/remotes',
+            cwd=work_dir)
+        if res[0] != 0:
+            return [res[0], 'get local refs failed']
+        has_remotes = False
+        for line in res[1].splitlines():
+            _items = line.split(' ')
+            if len(_items) != 2:
+                continue
+            if _items[0].startswith('refs/remotes/'):
+                has_remotes = True
+            else:
+                manifest['refs'][_items[0]] = _items[1]
+        if not has_remotes:
+            # --not --remotes排除不了任何提交，bundle会包含全部历史
+            return [1, 'no remote-tracking refs, use full backup']
+
+        # 未跟踪、已修改及被忽略的文件（已删除的文件无需备份）
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git status --porcelain -z --ignored --untracked-files=all', cwd=work_dir)
+        if res[0] != 0:
+            return [res[0], 'get working tree status failed']
+        entries = res[1].split('\0')
+        i = 0
+        while i < len(entries):
+            entry = entries[i]
+            i = i + 1
+            if len(entry) < 4:
+                continue
+            if entry[0] in ('R', 'C'):
+                # 重命名及复制的情况，后面跟着原文件名
+                i = i + 1
+            if 'D' not in entry[0:2]:
+                manifest['files'].append(entry[3:])
+
+        # 仅在本地存在的提交（包括分离HEAD时的提交），先统计提交数，没有本地提交时才不生成bundle
+        rev_args = 'HEAD --branches --tags%s --not --remotes' % (
+            ' refs/stash' if 'refs/stash' in manifest['refs'].keys() else '')
+        res = FCMMTools.run_sys_cmd_with_output('git rev-list --count %s' % (rev_args), cwd=work_dir)
+        if res[0] != 0:
+            return [res[0], 'count local commits failed']
+        if int(res[1].strip()) > 0:
+            bundle_file = os.path.join(temp_workspace, 'local-refs.bundle')
+            res = FCMMTools.run_sys_cmd_with_output(
+                'git bundle create "%s" %s' % (bundle_file, rev_args), cwd=work_dir)
+            if res[0] != 0:
+                # 本地提交无法备份，不能生成不完整的增量备份
+                return [res[0], 'create local commits bundle failed: %s' % (res[1])]
+            manifest['bundle'] = 'local-refs.bundle'
+
+        manifest_file = os.path.join(temp_workspace, 'manifest.json')
+        FCMMTools.save_to_json_file(manifest_file, manifest)
+        with tarfile.open(tar_file, 'w:gz') as tar:
+            tar.add(manifest_file, arcname='manifest.json')
+            if manifest['bundle'] != '':
+                tar.add(bundle_file, arcname=manifest['bundle'])
+            for _file in manifest['files']:
+                tar.add(os.path.join(work_dir, _file), arcname='files/' + _file)
+        return [0, '']
 
 if __name__ == '__main__':
     # 当程序自己独立运行时执行的操作
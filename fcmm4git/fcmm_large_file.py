@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+FCMM大文件处理模块，初始化导入前扫描要提交的文件，将大的二进制文件以指针方式提交并保存到本地存储
+@module fcmm_large_file
+@file fcmm_large_file.py
+"""
+
+import os
+import re
+import time
+import shutil
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from fcmm_tools import FCMMTools
+from fcmm_copier import FCMMCopier
+
+
+__MOUDLE__ = 'fcmm_large_file'  # 模块名
+__DESCRIPT__ = 'FCMM大文件处理'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = '黎慧剑'  # 作者
+__PUBLISH__ = '2018.07.19'  # 发布日期
+
+
+class FCMMLargeFile(object):
+    """
+    FCMM大文件处理类
+    扫描git add -A将要提交的文件（未跟踪及已修改的文件），按大小及类型分为：
+        small - 未超过阈值的文件，正常提交
+        large_text - 超过阈值的文本文件，正常提交，只在报告中提示
+        large_binary - 超过阈值的二进制文件（前8000字节包含\\0，与git的判断方式一致），
+            按处理方式以指针提交（lfs）、拒绝初始化（reject）或正常提交（none）
+    指针与git-lfs的指针格式一致，文件内容按sha256保存在本地存储的objects/xx/yy/sha256中；
+    提交指针时直接写入索引并设置skip-worktree，工作目录保留原文件，文件内容不会写入git对象库
+    """
+
+    # 指针文件的版本行
+    POINTER_VERSION = 'version https://git-lfs.github.com/spec/v1'
+
+    # 判断二进制文件读取的字节数
+    SNIFF_SIZE = 8000
+
+    # 读写文件的块大小
+    CHUNK_SIZE = 1048576
+
+    @staticmethod
+    def is_binary(file_path):
+        """
+        判断文件是否二进制文件
+
+        @decorators staticmethod
+
+        @param {string} file_path - 文件路径
+
+        @returns {bool} - 是否二进制文件
+        """
+        with open(file_path, 'rb') as f:
+            return b'\0' in f.read(FCMMLargeFile.SNIFF_SIZE)
+
+    @staticmethod
+    def scan(work_dir, max_size, workers=8):
+        """
+        并行扫描工作目录中将要提交的文件并按大小及类型分类
+
+        @decorators staticmethod
+
+        @param {string} work_dir - 仓库工作目录
+        @param {float} max_size - 大文件阈值（MB）
+        @param {int} workers=8 - 扫描线程数
+
+        @returns {dict} - 扫描结果，获取文件清单失败返回None，格式为
+            {
+                'files': 文件数, 'size': 总字节数, 'time': 扫描耗时,
+                'small': [文件数, 字节数],
+                'large_text': [(文件路径, 字节数), ...],
+                'large_binary': [(文件路径, 字节数), ...]
+            }
+            文件路径为相对工作目录的路径，大文件按字节数从大到小排序
+        """
+        begin_time = time.time()
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git ls-files -z --others --modified --exclude-standard', cwd=work_dir)
+        if res[0] != 0:
+            return None
+        # 已修改且已删除的文件也会列出，扫描时忽略
+        path_list = sorted(set([_path for _path in res[1].split('\0') if _path != '']))
+        limit = max_size * 1048576
+
+        def stat_file(path):
+            _file = os.path.join(work_dir, path)
+            if os.path.islink(_file) or not os.path.isfile(_file):
+                return (path, -1, False)
+            _size = os.path.getsize(_file)
+            return (path, _size, _size > limit and FCMMLargeFile.is_binary(_file))
+
+        scan_res = {'files': 0, 'size': 0, 'time': 0, 'small': [0, 0],
+                    'large_text': list(), 'large_binary': list()}
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for _path, _size, _is_binary in executor.map(stat_file, path_list):
+                if _size < 0:
+                    continue
+                scan_res['files'] += 1
+                scan_res['size'] += _size
+                if _size <= limit:
+                    scan_res['small'][0] += 1
+                    scan_res['small'][1] += _size
+                elif _is_binary:
+                    scan_res['large_binary'].append((_path, _size))
+                else:
+                    scan_res['large_text'].append((_path, _size))
+        for _key in ('large_text', 'large_binary'):
+            scan_res[_key].sort(key=lambda _item: (-_item[1], _item[0]))
+        scan_res['time'] = time.time() - begin_time
+        return scan_res
+
+    @staticmethod
+    def get_report(scan_res, action):
+        """
+        生成扫描结果的大小报告
+
+        @decorators staticmethod
+
+        @param {dict} scan_res - 扫描结果，@see FCMMLargeFile.scan
+        @param {string} action - 大的二进制文件的处理方式，lfs/reject/none
+
+        @returns {string} - 报告内容
+        """
+        large_text_size = sum([_item[1] for _item in scan_res['large_text']])
+        large_binary_size = sum([_item[1] for _item in scan_res['large_binary']])
+        lines = ['scan %d files (%.1f MB) in %.3fs: %d small (%.1f MB), %d large text (%.1f MB), '
+                 '%d large binary (%.1f MB) -> %s' % (
+                     scan_res['files'], scan_res['size'] / 1048576, scan_res['time'],
+                     scan_res['small'][0], scan_res['small'][1] / 1048576,
+                     len(scan_res['large_text']), large_text_size / 1048576,
+                     len(scan_res['large_binary']), large_binary_size / 1048576, action)]
+        for _key, _desc in (('large_binary', 'large binary'), ('large_text', 'large text')):
+            for _path, _size in scan_res[_key]:
+                lines.append('  %s\t%.1f MB\t%s' % (_desc, _size / 1048576, _path))
+        return '\n'.join(lines)
+
+    @staticmethod
+    def get_object_file(store_path, oid):
+        """
+        获取文件内容在本地存储中的路径
+
+        @decorators staticmethod
+
+        @param {string} store_path - 本地存储目录
+        @param {string} oid - 文件内容的sha256
+
+        @returns {string} - 存储文件路径
+        """
+        return os.path.join(store_path, 'objects', oid[0:2], oid[2:4], oid)
+
+    @staticmethod
+    def store_file(store_path, file_path):
+        """
+        将文件内容保存到本地存储（计算sha256的同时写入临时文件，内容已存在时不重复保存）
+
+        @decorators staticmethod
+
+        @param {string} store_path - 本地存储目录
+        @param {string} file_path - 要保存的文件路径
+
+        @returns {tuple} - (sha256, 字节数)
+        """
+        temp_path = os.path.join(store_path, 'tmp')
+        os.makedirs(temp_path, exist_ok=True)
+        temp_file = FCMMTools.get_temp_file_name(os.path.join(temp_path, 'object'))
+        sha = hashlib.sha256()
+        size = 0
+        try:
+            with open(file_path, 'rb') as src, open(temp_file, 'wb') as dest:
+                while True:
+                    _data = src.read(FCMMLargeFile.CHUNK_SIZE)
+                    if not _data:
+                        break
+                    sha.update(_data)
+                    dest.write(_data)
+                    size += len(_data)
+            oid = sha.hexdigest()
+            object_file = FCMMLargeFile.get_object_file(store_path, oid)
+            if not os.path.exists(object_file):
+                os.makedirs(os.path.dirname(object_file), exist_ok=True)
+                os.replace(temp_file, object_file)
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+        return (oid, size)
+
+    @staticmethod
+    def get_pointer(oid, size):
+        """
+        生成指针文件内容
+
+        @decorators staticmethod
+
+        @param {string} oid - 文件内容的sha256
+        @param {int} size - 文件字节数
+
+        @returns {string} - 指针文件内容
+        """
+        return '%s\noid sha256:%s\nsize %d\n' % (FCMMLargeFile.POINTER_VERSION, oid, size)
+
+    @staticmethod
+    def parse_pointer(text):
+        """
+        解析指针文件内容
+
+        @decorators staticmethod
+
+        @param {string} text - 指针文件内容
+
+        @returns {tuple} - (sha256, 字节数)，不是指针文件返回None
+        """
+        lines = text.splitlines()
+        if (len(lines) != 3 or lines[0] != FCMMLargeFile.POINTER_VERSION or
+                not lines[1].startswith('oid sha256:') or not lines[2].startswith('size ')):
+            return None
+        # oid用于拼接本地存储的文件路径，必须是64位小写十六进制（避免"../"等路径穿越）
+        oid = lines[1][11:]
+        if re.fullmatch('[0-9a-f]{64}', oid) is None or re.fullmatch('[0-9]+', lines[2][5:]) is None:
+            return None
+        return (oid, int(lines[2][5:]))
+
+    @staticmethod
+    def stage_pointers(work_dir, store_path, path_list, workers=8):
+        """
+        将文件内容保存到本地存储，并以指针提交到索引（工作目录的文件保持不变并设置skip-worktree）
+
+        @decorators staticmethod
+
+        @param {string} work_dir - 仓库工作目录
+        @param {string} store_path - 本地存储目录
+        @param {string[]} path_list - 要处理的文件清单（相对工作目录的路径）
+        @param {int} workers=8 - 保存文件的线程数
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 要返回显示的内容
+        """
+        if len(path_list) == 0:
+            return [0, '']
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            stored_list = list(executor.map(
+                lambda _path: FCMMLargeFile.store_file(
+                    store_path, os.path.join(work_dir, _path)),
+                path_list
+            ))
+
+        # 通过一次hash-object写入全部指针对象
+        pointer_dir = tempfile.mkdtemp(prefix='fcmm-pointer-')
+        try:
+            pointer_files = list()
+            for _i, (_oid, _size) in enumerate(stored_list):
+                _file = os.path.join(pointer_dir, str(_i))
+                with open(_file, 'w', encoding='utf-8', newline='\n') as f:
+                    f.write(FCMMLargeFile.get_pointer(_oid, _size))
+                pointer_files.append(_file)
+            res = FCMMTools.run_sys_cmd_with_output(
+                'git hash-object -w --no-filters --stdin-paths', cwd=work_dir,
+                input_str='\n'.join(pointer_files) + '\n')
+        finally:
+            shutil.rmtree(pointer_dir, ignore_errors=True)
+        if res[0] != 0:
+            return [res[0], '']
+        blob_list = res[1].split()
+
+        # 登记到索引并设置skip-worktree，之后的git add/commit -a不会提交工作目录中的原文件
+        index_info = ''.join([
+            '%s %s\t%s\0' % (
+                '100755' if os.access(os.path.join(work_dir, _path), os.X_OK) else '100644',
+                _blob, _path)
+            for _path, _blob in zip(path_list, blob_list)
+        ])
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git update-index -z --index-info', cwd=work_dir, input_str=index_info)
+        if res[0] != 0:
+            return [res[0], '']
+        return FCMMTools.run_sys_cmd_with_output(
+            'git update-index -z --skip-worktree --stdin', cwd=work_dir,
+            input_str=''.join([_path + '\0' for _path in path_list]))
+
+    @staticmethod
+    def restore(work_dir, store_path, path_list):
+        """
+        从本地存储恢复工作目录中指针文件的内容，并设置skip-worktree
+
+        @decorators staticmethod
+
+        @param {string} work_dir - 仓库工作目录
+        @param {string} store_path - 本地存储目录
+        @param {string[]} path_list - 以指针提交的文件清单（相对工作目录的路径）
+
+        @returns {list} - 执行结果[returncode, missing_list]
+            returncode - 0代表成功，其他代表失败
+            missing_list - 本地存储中没有内容的文件清单（保留指针文件）
+        """
+        restored_list = list()
+        missing_list = list()
+        for _path in path_list:
+            _file = os.path.join(work_dir, _path)
+            if not os.path.isfile(_file) or os.path.getsize(_file) > 1024:
+                # 不是指针文件（已恢复）
+                continue
+            with open(_file, 'r', encoding='utf-8', errors='replace') as f:
+                _pointer = FCMMLargeFile.parse_pointer(f.read())
+            if _pointer is None:
+                continue
+            _object_file = FCMMLargeFile.get_object_file(store_path, _pointer[0])
+            if not os.path.exists(_object_file):
+                missing_list.append(_path)
+                continue
+            FCMMCopier.copy_file(_object_file, _file)
+            restored_list.append(_path)
+        if len(restored_list) > 0:
+            res = FCMMTools.run_sys_cmd_with_output(
+                'git update-index -z --skip-worktree --stdin', cwd=work_dir,
+                input_str=''.join([_path + '\0' for _path in restored_list]))
+            if res[0] != 0:
+                return [res[0], missing_list]
+        return [0, missing_list]
+
+
+if __name__ == '__main__':
+    # 当程序自己独立运行时执行的操作
+    # 打印版本信息
+    print(('模块名：%s  -  %s\n'
+           '作者：%s\n'
+           '发布日期：%s\n'
+           '版本：%s' % (__MOUDLE__, __DESCRIPT__, __AUTHOR__, __PUBLISH__, __VERSION__)))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+FCMM仓库锁模块，通过文件锁实现同一台机器上多个fcmm进程对同一仓库的并发控制
+@module fcmm_lock
+@file fcmm_lock.py
+"""
+
+import os
+import time
+import hashlib
+try:
+    import fcntl
+except ImportError:
+    # windows平台没有fcntl，使用msvcrt（只支持排他锁）
+    fcntl = None
+    import msvcrt
+
+
+__MOUDLE__ = 'fcmm_lock'  # 模块名
+__DESCRIPT__ = 'FCMM仓库锁'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = '黎慧剑'  # 作者
+__PUBLISH__ = '2018.07.19'  # 发布日期
+
+
+class FCMMRepoLock(object):
+    """
+    FCMM仓库锁类（建议锁，只对使用该锁的fcmm进程有效）
+    锁文件按被保护对象（仓库工作目录、共享对象库等）的真实路径生成，只读访问使用共享锁，修改使用排他锁；
+    windows平台不支持共享锁，统一使用排他锁
+    支持with语句，获取锁超时抛出TimeoutError
+    """
+
+    def __init__(self, lock_path, work_dir, shared=False, timeout=600):
+        """
+        构造函数
+
+        @param {string} lock_path - 锁文件存放目录
+        @param {string} work_dir - 要锁定的工作目录
+        @param {bool} shared=False - 是否共享锁
+        @param {float} timeout=600 - 等待获取锁的超时时间（秒）
+        """
+        key = os.path.normcase(os.path.realpath(work_dir)).encode(encoding='utf-8')
+        self.lock_file = os.path.join(lock_path, hashlib.sha1(key).hexdigest() + '.lock')
+        self.work_dir = work_dir
+        self.shared = shared
+        self.timeout = timeout
+        self._fp = None
+
+    def acquire(self):
+        """
+        获取锁
+
+        @returns {bool} - 是否获取成功，超时返回False
+        """
+        if not os.path.exists(os.path.dirname(self.lock_file)):
+            os.makedirs(os.path.dirname(self.lock_file), exist_ok=True)
+        self._fp = open(self.lock_file, 'a+')
+        begin_time = time.time()
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(self._fp.fileno(),
+                                (fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+                else:
+                    self._fp.seek(0)
+                    msvcrt.locking(self._fp.fileno(), msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if time.time() - begin_time >= self.timeout:
+                    self._fp.close()
+                    self._fp = None
+                    return False
+                time.sleep(0.1)
+
+    def release(self):
+        """
+        释放锁
+        """
+        if self._fp is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fp.fileno(), fcntl.LOCK_UN)
+            else:
+                self._fp.seek(0)
+                msvcrt.locking(self._fp.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._fp.close()
+            self._fp = None
+
+    def __enter__(self):
+        if not self.acquire():
+            raise TimeoutError('wait for repo lock timeout: %s' % (self.work_dir))
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.release()
+
+
+if __name__ == '__main__':
+    # 当程序自己独立运行时执行的操作
+    # 打印版本信息
+    print(('模块名：%s  -  %s\n'
+           '作者：%s\n'
+           '发布日期：%s\n'
+           '版本：%s' % (__MOUDLE__, __DESCRIPT__, __AUTHOR__, __PUBLISH__, __VERSION__)))
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+FCMM仓库维护模块，根据仓库的度量值按阈值进行引用打包、增量重新打包及commit-graph、multi-pack-index的维护
+@module fcmm_maintain
+@file fcmm_maintain.py
+"""
+
+import os
+import time
+from fcmm_tools import FCMMTools
+from fcmm_metrics import FCMMMetrics
+
+
+__MOUDLE__ = 'fcmm_maintain'  # 模块名
+__DESCRIPT__ = 'FCMM仓库维护'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = '黎慧剑'  # 作者
+__PUBLISH__ = '2018.07.19'  # 发布日期
+
+
+class FCMMMaintain(object):
+    """
+    FCMM仓库维护类
+    度量值直接从.git目录的文件获取（不启动git进程），超过阈值的维护任务按以下顺序执行：
+        pack-refs - 松散引用数超过阈值（备份分支、临时分支较多时），打包为packed-refs
+        repack - 松散对象数超过阈值，将全部松散对象打包为一个新的包并删除已打包的松散对象（不重写已有的包）
+        midx-repack - 包数量超过阈值，通过multi-pack-index将较小的包合并（保留最大的包），并删除已合并的包
+        multi-pack-index - 有多个包且multi-pack-index不存在或比最新的包旧
+        commit-graph - commit-graph不存在，或之后变化的引用数超过阈值（增量写入split commit-graph）
+    指定时间预算时，超过预算后不再开始后续的任务（已开始的任务不中断），未执行的任务在下一次维护时执行
+    """
+
+    @staticmethod
+    def measure(git_dir):
+        """
+        获取仓库的度量值
+
+        @decorators staticmethod
+
+        @param {string} git_dir - 仓库的.git目录（工作树的情况为公共的.git目录）
+
+        @returns {dict} - 度量值，格式为
+            {
+                'loose_refs': 松散引用数,
+                'loose_objects': 松散对象数,
+                'packs': 包数量,
+                'pack_sizes': [各包的大小],
+                'midx': multi-pack-index的状态，ok/missing/stale,
+                'commit_graph': commit-graph的状态，ok/missing/stale,
+                'graph_stale_refs': commit-graph写入后变化的引用数
+            }
+        """
+        objects_dir = os.path.join(git_dir, 'objects')
+        pack_dir = os.path.join(objects_dir, 'pack')
+        info_dir = os.path.join(objects_dir, 'info')
+
+        # commit-graph写入时间，split方式以commit-graph-chain为准
+        graph_mtime = None
+        for _file in (os.path.join(info_dir, 'commit-graphs', 'commit-graph-chain'),
+                      os.path.join(info_dir, 'commit-graph')):
+            if os.path.exists(_file):
+                graph_mtime = os.stat(_file).st_mtime
+                break
+
+        # 松散引用及commit-graph写入后变化的引用
+        loose_refs = 0
+        graph_stale_refs = 0
+        stack = [os.path.join(git_dir, 'refs')]
+        while len(stack) > 0:
+            with os.scandir(stack.pop()) as it:
+                for _entry in it:
+                    if _entry.is_dir(follow_symlinks=False):
+                        stack.append(_entry.path)
+                    elif _entry.is_file(follow_symlinks=False):
+                        loose_refs += 1
+                        if graph_mtime is not None and _entry.stat().st_mtime > graph_mtime:
+                            graph_stale_refs += 1
+        packed_refs_file = os.path.join(git_dir, 'packed-refs')
+        if (graph_mtime is not None and os.path.exists(packed_refs_file) and
+                os.stat(packed_refs_file).st_mtime > graph_mtime):
+            graph_stale_refs += 1
+
+        # 松散对象（objects/xx/目录下的文件）
+        loose_objects = 0
+        with os.scandir(objects_dir) as it:
+            for _entry in it:
+                if len(_entry.name) == 2 and _entry.is_dir(follow_symlinks=False):
+                    loose_objects += len(os.listdir(_entry.path))
+
+        # 包及multi-pack-index
+        pack_sizes = list()
+        pack_mtime = 0
+        if os.path.exists(pack_dir):
+            with os.scandir(pack_dir) as it:
+                for _entry in it:
+                    if _entry.name.endswith('.pack'):
+                        _stat = _entry.stat()
+                        pack_sizes.append(_stat.st_size)
+                        pack_mtime = max(pack_mtime, _stat.st_mtime)
+        midx_file = os.path.join(pack_dir, 'multi-pack-index')
+        midx = 'missing'
+        if os.path.exists(midx_file):
+            midx = 'ok' if os.stat(midx_file).st_mtime >= pack_mtime else 'stale'
+
+        commit_graph = 'missing'
+        if graph_mtime is not None:
+            commit_graph = 'ok' if graph_stale_refs == 0 else 'stale'
+
+        return {
+            'loose_refs': loose_refs,
+            'loose_objects': loose_objects,
+            'packs': len(pack_sizes),
+            'pack_sizes': pack_sizes,
+            'midx': midx,
+            'commit_graph': commit_graph,
+            'graph_stale_refs': graph_stale_refs
+        }
+
+    @staticmethod
+    def plan(stats, thresholds, force=False):
+        """
+        根据度量值及阈值确定要执行的维护任务
+
+        @decorators staticmethod
+
+        @param {dict} stats - 度量值，@see FCMMMaintain.measure
+        @param {dict} thresholds - 阈值（fcmm.json的maintain参数），包括loose_refs、loose_objects、
+            max_packs、graph_stale_refs
+        @param {bool} force=False - 是否忽略阈值执行全部任务（只有一个包时不处理multi-pack-index）
+
+        @returns {string[]} - 要执行的任务清单（按执行顺序）
+        """
+        tasks = list()
+        packs = stats['packs']
+        if force or stats['loose_refs'] > int(thresholds['loose_refs']):
+            tasks.append('pack-refs')
+        if stats['loose_objects'] > 0 and (
+                force or stats['loose_objects'] > int(thresholds['loose_objects'])):
+            tasks.append('repack')
+            packs += 1
+        if packs > 2 and (force or packs > int(thresholds['max_packs'])):
+            tasks.append('midx-repack')
+        if packs > 1 and (force or len(tasks) > 0 or stats['midx'] != 'ok'):
+            tasks.append('multi-pack-index')
+        if (force or stats['commit_graph'] == 'missing' or
+                stats['graph_stale_refs'] > int(thresholds['graph_stale_refs'])):
+            tasks.append('commit-graph')
+        return tasks
+
+    @staticmethod
+    def run_task(task, work_dir, git_dir, stats):
+        """
+        执行维护任务
+
+        @decorators staticmethod
+
+        @param {string} task - 任务名
+        @param {string} work_dir - 仓库工作目录
+        @param {string} git_dir - 仓库的.git目录
+        @param {dict} stats - 度量值，@see FCMMMaintain.measure
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 要返回显示的内容
+        """
+        if task == 'pack-refs':
+            return FCMMTools.run_sys_cmd('git pack-refs --all --prune', cwd=work_dir)
+        elif task == 'repack':
+            # 与git maintenance的loose-objects任务一致，不可达的松散对象也一起打包（repack只打包可达对象）
+            objects_dir = os.path.join(git_dir, 'objects')
+            oid_list = list()
+            with os.scandir(objects_dir) as it:
+                for _entry in it:
+                    if len(_entry.name) == 2 and _entry.is_dir(follow_symlinks=False):
+                        oid_list.extend([_entry.name + _name for _name in os.listdir(_entry.path)
+                                         if len(_entry.name + _name) in (40, 64)])
+            res = FCMMTools.run_sys_cmd_with_output(
+                'git pack-objects -q "%s"' % (os.path.join(objects_dir, 'pack', 'loose')),
+                cwd=work_dir, input_str='\n'.join(oid_list) + '\n')
+            if res[0] != 0:
+                return res
+            return FCMMTools.run_sys_cmd('git prune-packed -q', cwd=work_dir)
+        elif task == 'midx-repack':
+            # 合并除最大的包以外的全部包（与git maintenance的incremental-repack一致）
+            batch_size = sum(stats['pack_sizes']) - max(stats['pack_sizes']) + 1
+            return FCMMTools.run_sys_cmd_list([
+                'git multi-pack-index write --no-progress',
+                'git multi-pack-index repack --no-progress --batch-size=%d' % (batch_size),
+                'git multi-pack-index expire --no-progress'
+            ], cwd=work_dir)
+        elif task == 'multi-pack-index':
+            return FCMMTools.run_sys_cmd('git multi-pack-index write --no-progress', cwd=work_dir)
+        else:
+            return FCMMTools.run_sys_cmd(
+                'git commit-graph write --reachable --split --no-progress', cwd=work_dir)
+
+    @staticmethod
+    @FCMMMetrics.phase('maintain')
+    def run(work_dir, git_dir, thresholds, time_budget=0, force=False, dry_run=False):
+        """
+        按阈值执行仓库维护
+
+        @decorators staticmethod
+
+        @param {string} work_dir - 仓库工作目录
+        @param {string} git_dir - 仓库的.git目录
+        @param {dict} thresholds - 阈值，@see FCMMMaintain.plan
+        @param {float} time_budget=0 - 时间预算（秒），超过后不再开始后续任务，0代表不限制
+        @param {bool} force=False - 是否忽略阈值执行全部任务
+        @param {bool} dry_run=False - 只显示度量值及要执行的任务，不实际执行
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 度量值及各任务的执行情况，没有要执行的任务时只有度量值
+        """
+        begin_time = time.time()
+        stats = FCMMMaintain.measure(git_dir)
+        lines = ['loose refs: %d, loose objects: %d, packs: %d, multi-pack-index: %s, '
+                 'commit-graph: %s (%d refs changed)' % (
+                     stats['loose_refs'], stats['loose_objects'], stats['packs'], stats['midx'],
+                     stats['commit_graph'], stats['graph_stale_refs'])]
+        for _task in FCMMMaintain.plan(stats, thresholds, force=force):
+            if dry_run:
+                lines.append('%s: planned' % (_task))
+                continue
+            if time_budget > 0 and time.time() - begin_time >= time_budget:
+                lines.append('%s: skipped (time budget %.1fs)' % (_task, time_budget))
+                continue
+            _task_begin = time.time()
+            res = FCMMMaintain.run_task(_task, work_dir, git_dir, stats)
+            if res[0] != 0:
+                lines.append('%s: fail' % (_task))
+                return [res[0], '\n'.join(lines)]
+            lines.append('%s: done %.3fs' % (_task, time.time() - _task_begin))
+        return [0, '\n'.join(lines)]
+
+
+if __name__ == '__main__':
+    # 当程序自己独立运行时执行的操作
+    # 打印版本信息
+    print(('模块名：%s  -  %s\n'
+           '作者：%s\n'
+           '发布日期：%s\n'
+           '版本：%s' % (__MOUDLE__, __DESCRIPT__, __AUTHOR__, __PUBLISH__, __VERSION__)))
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+FCMM性能指标模块，跨多次执行汇总各命令及阶段的耗时直方图，输出Prometheus文本格式文件
+@module fcmm_metrics
+@file fcmm_metrics.py
+"""
+
+import os
+import json
+import time
+import functools
+import threading
+from fcmm_lock import FCMMRepoLock
+
+
+__MOUDLE__ = 'fcmm_metrics'  # 模块名
+__DESCRIPT__ = 'FCMM性能指标'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = '黎慧剑'  # 作者
+__PUBLISH__ = '2018.07.19'  # 发布日期
+
+
+class FCMMMetrics(object):
+    """
+    FCMM性能指标类
+    每次命令执行通过begin_run/end_run记录（记录按线程保存），执行期间本线程的git命令按类型归入阶段：
+        sync - 与远程仓库同步（fetch/pull/ls-remote/clone）
+        branch - 分支操作（branch/checkout/switch/reset/update-ref/merge/tag）
+        push - 推送
+        maintain - 仓库维护（pack-refs/repack/pack-objects/commit-graph/multi-pack-index/gc）
+        backup - 备份（通过phase装饰器标记的处理，期间的git命令耗时都归入备份）
+    end_run时将本次结果汇总到指标状态文件（<指标文件>.json），并重新生成Prometheus文本格式的指标文件，
+    可直接由node exporter的textfile collector采集；
+    本线程最近一次执行的记录（耗时、各阶段耗时、推送次数及生成的备份文件）可通过last_run获取
+    """
+
+    # 耗时直方图的分桶上限（秒）
+    DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+    # 每次执行推送次数直方图的分桶上限
+    PUSH_BUCKETS = (0, 1, 2, 3, 5, 10)
+
+    # git命令与阶段的对应关系
+    _git_phase = {
+        'fetch': 'sync', 'pull': 'sync', 'ls-remote': 'sync', 'clone': 'sync',
+        'branch': 'branch', 'checkout': 'branch', 'switch': 'branch', 'reset': 'branch',
+        'update-ref': 'branch', 'merge': 'branch', 'tag': 'branch',
+        'push': 'push',
+        'pack-refs': 'maintain', 'repack': 'maintain', 'commit-graph': 'maintain',
+        'multi-pack-index': 'maintain', 'pack-objects': 'maintain', 'prune-packed': 'maintain',
+        'gc': 'maintain'
+    }
+
+    # 当前执行的记录（按线程保存，多个线程可同时执行命令），属性包括
+    #   current - 当前执行的记录，没有执行中的命令为None
+    #   last - 最近一次结束的执行记录
+    #   phase_depth - 阶段装饰器的嵌套层数
+    _local = threading.local()
+
+    @staticmethod
+    def begin_run(cmd):
+        """
+        开始记录一次命令执行
+
+        @decorators staticmethod
+
+        @param {string} cmd - 命令
+        """
+        FCMMMetrics._local.current = {
+            'cmd': cmd, 'begin': time.time(), 'phases': dict(), 'push': 0, 'backups': list()
+        }
+        FCMMMetrics._local.phase_depth = 0
+
+    @staticmethod
+    def add_phase_time(phase, seconds):
+        """
+        累计当前执行的阶段耗时
+
+        @decorators staticmethod
+
+        @param {string} phase - 阶段名
+        @param {float} seconds - 耗时（秒）
+        """
+        current = getattr(FCMMMetrics._local, 'current', None)
+        if current is not None:
+            current['phases'][phase] = current['phases'].get(phase, 0.0) + seconds
+
+    @staticmethod
+    def record_git(cmd_str, seconds):
+        """
+        记录一个git命令的执行（由FCMMTools执行系统命令时调用）
+
+        @decorators staticmethod
+
+        @param {string} cmd_str - 执行的命令
+        @param {float} seconds - 耗时（秒）
+        """
+        current = getattr(FCMMMetrics._local, 'current', None)
+        if current is None:
+            return
+        # 取git子命令，跳过-c/-C等全局参数
+        items = cmd_str.split()
+        if len(items) < 2 or items[0] != 'git':
+            return
+        i = 1
+        while i < len(items) and items[i].startswith('-'):
+            i = i + (2 if items[i] in ('-c', '-C') else 1)
+        phase = FCMMMetrics._git_phase.get(items[i] if i < len(items) else '')
+        if phase == 'push':
+            current['push'] += 1
+        if phase is not None and getattr(FCMMMetrics._local, 'phase_depth', 0) == 0:
+            FCMMMetrics.add_phase_time(phase, seconds)
+
+    @staticmethod
+    def record_backup(file_path):
+        """
+        记录当前执行生成的备份文件
+
+        @decorators staticmethod
+
+        @param {string} file_path - 备份文件路径
+        """
+        current = getattr(FCMMMetrics._local, 'current', None)
+        if current is not None:
+            current['backups'].append(file_path)
+
+    @staticmethod
+    def phase(phase_name):
+        """
+        阶段装饰器，被装饰函数的耗时归入指定阶段（嵌套时只计算最外层）
+
+        @decorators staticmethod
+
+        @param {string} phase_name - 阶段名
+
+        @returns {function} - 装饰器
+        """
+        def decorator(fun):
+            @functools.wraps(fun)
+            def wrapper(*args, **kwargs):
+                begin_time = time.time()
+                local = FCMMMetrics._local
+                local.phase_depth = getattr(local, 'phase_depth', 0) + 1
+                try:
+                    return fun(*args, **kwargs)
+                finally:
+                    local.phase_depth -= 1
+                    if local.phase_depth == 0:
+                        FCMMMetrics.add_phase_time(phase_name, time.time() - begin_time)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def end_run(returncode, metrics_file, lock_path):
+        """
+        结束记录，将本次执行汇总到指标文件（获取不到文件锁时放弃汇总）
+
+        @decorators staticmethod
+
+        @param {int} returncode - 命令的返回码
+        @param {string} metrics_file - Prometheus文本格式的指标文件，为None代表不汇总到指标文件
+        @param {string} lock_path - 锁文件目录
+        """
+        current = getattr(FCMMMetrics._local, 'current', None)
+        FCMMMetrics._local.current = None
+        if current is None:
+            return
+        duration = time.time() - current['begin']
+        current['duration'] = duration
+        FCMMMetrics._local.last = current
+        if metrics_file is None:
+            return
+        cmd = current['cmd']
+        result = 'success' if returncode == 0 else 'fail'
+
+        file_lock = FCMMRepoLock(lock_path, metrics_file, shared=False, timeout=5)
+        if not file_lock.acquire():
+            return
+        try:
+            state = FCMMMetrics.load_state(metrics_file)
+            FCMMMetrics._observe(state['duration'], cmd, duration, FCMMMetrics.DURATION_BUCKETS)
+            for _phase, _seconds in current['phases'].items():
+                FCMMMetrics._observe(state['phase'], '%s\t%s' % (cmd, _phase), _seconds,
+                                     FCMMMetrics.DURATION_BUCKETS)
+            FCMMMetrics._observe(state['push'], cmd, current['push'], FCMMMetrics.PUSH_BUCKETS)
+            _key = '%s\t%s' % (cmd, result)
+            state['runs'][_key] = state['runs'].get(_key, 0) + 1
+
+            # 原子写入，采集程序不会读到写了一半的文件
+            # fcmm_tools依赖本模块，为避免循环导入在使用时才导入
+            from fcmm_tools import FCMMTools
+            FCMMTools.save_to_file_atomic(metrics_file + '.json', json.dumps(state))
+            FCMMTools.save_to_file_atomic(metrics_file, FCMMMetrics.to_prometheus_text(state))
+        finally:
+            file_lock.release()
+
+    @staticmethod
+    def last_run():
+        """
+        获取本线程最近一次结束的执行记录
+
+        @decorators staticmethod
+
+        @returns {dict} - 执行记录，没有时返回None，格式为
+            {
+                'cmd': 命令,
+                'duration': 耗时（秒）,
+                'phases': {'阶段': 耗时（秒）, ...},
+                'push': 推送次数,
+                'backups': [生成的备份文件, ...]
+            }
+        """
+        return getattr(FCMMMetrics._local, 'last', None)
+
+    @staticmethod
+    def load_state(metrics_file):
+        """
+        装载指标状态
+
+        @decorators staticmethod
+
+        @param {string} metrics_file - 指标文件
+
+        @returns {dict} - 指标状态，格式为
+            {
+                'duration': {'命令': 直方图, ...},
+                'phase': {'命令\\t阶段': 直方图, ...},
+                'push': {'命令': 直方图, ...},
+                'runs': {'命令\\t结果': 执行次数, ...}
+            }
+            直方图格式为{'buckets': [各分桶的累计次数], 'sum': 合计值, 'count': 次数}
+        """
+        state = {'duration': dict(), 'phase': dict(), 'push': dict(), 'runs': dict()}
+        if os.path.exists(metrics_file + '.json'):
+            with open(metrics_file + '.json', 'r', encoding='utf-8') as f:
+                state.update(json.loads(f.read()))
+        return state
+
+    @staticmethod
+    def _observe(histograms, key, value, bucket_bounds):
+        """
+        在直方图中记录一个值
+
+        @decorators staticmethod
+
+        @param {dict} histograms - 直方图字典
+        @param {string} key - 直方图的关键字
+        @param {float} value - 记录的值
+        @param {tuple} bucket_bounds - 分桶上限
+        """
+        histogram = histograms.setdefault(
+            key, {'buckets': [0] * len(bucket_bounds), 'sum': 0, 'count': 0})
+        for _i, _bound in enumerate(bucket_bounds):
+            if value <= _bound:
+                histogram['buckets'][_i] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+    @staticmethod
+    def percentile(histogram, bucket_bounds, rate):
+        """
+        根据直方图估算百分位数（在分桶内线性插值）
+
+        @decorators staticmethod
+
+        @param {dict} histogram - 直方图
+        @param {tuple} bucket_bounds - 分桶上限
+        @param {float} rate - 百分位，例如0.95
+
+        @returns {float} - 估算值，超过最大分桶时返回最大分桶上限
+        """
+        target = histogram['count'] * rate
+        lower_bound = 0
+        lower_count = 0
+        for _i, _bound in enumerate(bucket_bounds):
+            _count = histogram['buckets'][_i]
+            if _count >= target:
+                if _count == lower_count:
+                    return _bound
+                return lower_bound + (_bound - lower_bound) * (target - lower_count) / (_count - lower_count)
+            lower_bound = _bound
+            lower_count = _count
+        return bucket_bounds[-1]
+
+    @staticmethod
+    def to_prometheus_text(state):
+        """
+        将指标状态转换为Prometheus文本格式（node exporter的textfile collector可直接采集）
+
+        @decorators staticmethod
+
+        @param {dict} state - 指标状态，@see FCMMMetrics.load_state
+
+        @returns {string} - Prometheus文本
+        """
+        lines = list()
+
+        def add_histogram(name, help_str, histograms, label_names, bucket_bounds):
+            lines.append('# HELP %s %s' % (name, help_str))
+            lines.append('# TYPE %s histogram' % (name))
+            for _key in sorted(histograms.keys()):
+                _histogram = histograms[_key]
+                _labels = ','.join(['%s="%s"' % (_name, _value) for _name, _value in
+                                    zip(label_names, _key.split('\t'))])
+                for _i, _bound in enumerate(bucket_bounds):
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (
+                        name, _labels, str(float(_bound)), _histogram['buckets'][_i]))
+                lines.append('%s_bucket{%s,le="+Inf"} %d' % (name, _labels, _histogram['count']))
+                lines.append('%s_sum{%s} %s' % (name, _labels, repr(float(_histogram['sum']))))
+                lines.append('%s_count{%s} %d' % (name, _labels, _histogram['count']))
+
+        add_histogram('fcmm_command_duration_seconds', 'Duration of fcmm commands.',
+                      state['duration'], ('command', ), FCMMMetrics.DURATION_BUCKETS)
+        add_histogram('fcmm_phase_duration_seconds',
+                      'Duration of fcmm command phases (sync, backup, branch, push).',
+                      state['phase'], ('command', 'phase'), FCMMMetrics.DURATION_BUCKETS)
+        add_histogram('fcmm_command_pushes', 'Number of git pushes per fcmm command.',
+                      state['push'], ('command', ), FCMMMetrics.PUSH_BUCKETS)
+        lines.append('# HELP fcmm_command_runs_total Number of fcmm command runs by result.')
+        lines.append('# TYPE fcmm_command_runs_total counter')
+        for _key in sorted(state['runs'].keys()):
+            _cmd, _result = _key.split('\t')
+            lines.append('fcmm_command_runs_total{command="%s",result="%s"} %d' % (
+                _cmd, _result, state['runs'][_key]))
+        return '\n'.join(lines) + '\n'
+
+
+if __name__ == '__main__':
+    # 当程序自己独立运行时执行的操作
+    # 打印版本信息
+    print(('模块名：%s  -  %s\n'
+           '作者：%s\n'
+           '发布日期：%s\n'
+           '版本：%s' % (__MOUDLE__, __DESCRIPT__, __AUTHOR__, __PUBLISH__, __VERSION__)))
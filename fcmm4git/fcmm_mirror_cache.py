@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+FCMM远程仓库镜像缓存模块，按远程仓库url缓存镜像，重复克隆时只进行增量获取
+@module fcmm_mirror_cache
+@file fcmm_mirror_cache.py
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+from snakerlib.generic import FileTools
+from fcmm_tools import FCMMTools
+from fcmm_git_tools import FCMMGitTools
+from fcmm_lock import FCMMRepoLock
+
+
+__MOUDLE__ = 'fcmm_mirror_cache'  # 模块名
+__DESCRIPT__ = 'FCMM远程仓库镜像缓存'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = '黎慧剑'  # 作者
+__PUBLISH__ = '2018.07.19'  # 发布日期
+
+
+class FCMMMirrorCache(object):
+    """
+    FCMM远程仓库镜像缓存类
+    每个远程仓库在缓存目录下对应一个git clone --mirror的镜像（目录名为规范化url的哈希），
+    镜像目录下的fcmm-cache.json记录url、大小及最后使用时间，用于LRU及容量淘汰；
+    镜像的更新及淘汰通过仓库锁与其他fcmm进程互斥
+    注：只用于init克隆远程仓库，其他命令在已有本地仓库中直接fetch，不使用镜像缓存
+    """
+
+    # 镜像信息文件名
+    _info_file_name = 'fcmm-cache.json'
+
+    # scp格式的url，例如git@github.com:snakeclub/fcmm4git.git
+    _scp_url_re = re.compile(r'^([^/@:]+@)?([^/:]+):(?!//)(.*)$')
+
+    @staticmethod
+    def normalize_url(url):
+        """
+        规范化远程仓库url（同一仓库的不同写法得到相同结果）
+        处理内容：去除首尾空白、末尾的'/'及'.git'，scp格式转换为ssh://格式，协议及主机名转为小写
+
+        @decorators staticmethod
+
+        @param {string} url - 远程仓库url
+
+        @returns {string} - 规范化后的url
+        """
+        url = url.strip().rstrip('/')
+        if url.endswith('.git'):
+            url = url[0:-4]
+        if '://' not in url and not os.path.exists(url):
+            match = FCMMMirrorCache._scp_url_re.match(url)
+            if match is not None:
+                url = 'ssh://%s%s/%s' % (match.group(1) or '', match.group(2), match.group(3))
+        _index = url.find('://')
+        if _index >= 0:
+            _end = url.find('/', _index + 3)
+            if _end < 0:
+                _end = len(url)
+            url = url[0:_end].lower() + url[_end:]
+        return url
+
+    @staticmethod
+    def get_mirror_path(cache_path, url):
+        """
+        获取远程仓库对应的镜像目录
+
+        @decorators staticmethod
+
+        @param {string} cache_path - 缓存目录
+        @param {string} url - 远程仓库url
+
+        @returns {string} - 镜像目录路径
+        """
+        key = hashlib.sha1(FCMMMirrorCache.normalize_url(url).encode(encoding='utf-8')).hexdigest()
+        return os.path.join(cache_path, key[0:16] + '.git')
+
+    @staticmethod
+    def clone_remote_repo(url, path, cache_path, lock_path, max_count=20, max_size=10240,
+                          lock_timeout=600):
+        """
+        通过镜像缓存克隆远程库到本地（镜像不存在时克隆镜像，已存在时增量获取，再从镜像本地克隆），
+        克隆后origin指向原远程库url，并按容量淘汰其他镜像
+
+        @decorators staticmethod
+
+        @param {string} url - 远程库的地址
+        @param {string} path - 本地主路径（不含repo目录），repo目录名与FCMMGitTools.clone_remote_repo一致
+        @param {string} cache_path - 缓存目录
+        @param {string} lock_path - 锁文件目录
+        @param {int} max_count=20 - 最多缓存的镜像数量
+        @param {float} max_size=10240 - 缓存的最大容量（MB）
+        @param {float} lock_timeout=600 - 等待镜像锁的超时时间（秒）
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 要返回显示的内容
+        """
+        if not os.path.exists(cache_path):
+            os.makedirs(cache_path, exist_ok=True)
+        mirror_path = FCMMMirrorCache.get_mirror_path(cache_path, url)
+        repo_path = os.path.join(path, FCMMGitTools.get_remote_repo_name(url))
+        with FCMMRepoLock(lock_path, mirror_path, shared=False, timeout=lock_timeout):
+            if os.path.exists(os.path.join(mirror_path, FCMMMirrorCache._info_file_name)):
+                res = FCMMTools.run_sys_cmd('git -C "%s" fetch --prune origin' % (mirror_path))
+            else:
+                if os.path.exists(mirror_path):
+                    # 上次克隆未完成
+                    FileTools.remove_dir(mirror_path)
+                res = FCMMTools.run_sys_cmd('git clone --mirror %s "%s"' % (url, mirror_path))
+            if res[0] != 0:
+                return res
+
+            # 更新镜像信息
+            size = 0
+            res = FCMMTools.run_sys_cmd_with_output('git count-objects -v', cwd=mirror_path)
+            for line in res[1].splitlines():
+                _items = line.split(':')
+                if _items[0] in ('size', 'size-pack'):
+                    size = size + int(_items[1])
+            FCMMMirrorCache._save_info(mirror_path, {'url': url, 'size': size, 'last_used': time.time()})
+
+            # 从镜像克隆（本地克隆，对象通过硬链接共享），origin改回远程库url
+            res = FCMMTools.run_sys_cmd_list([
+                'git clone "%s" "%s"' % (mirror_path, repo_path),
+                'git -C "%s" remote set-url origin %s' % (repo_path, url)
+            ])
+            if res[0] != 0:
+                return res
+
+        FCMMMirrorCache.evict(cache_path, lock_path, max_count=max_count, max_size=max_size,
+                              keep_path=mirror_path)
+        return [0, '']
+
+    @staticmethod
+    def _save_info(mirror_path, info):
+        """
+        保存镜像信息（先写临时文件再替换，淘汰镜像时不持有镜像锁读取，不会读到写了一半的文件）
+
+        @decorators staticmethod
+
+        @param {string} mirror_path - 镜像目录
+        @param {dict} info - 镜像信息{'url': 远程仓库url, 'size': 大小(KB), 'last_used': 最后使用时间}
+        """
+        info_file = os.path.join(mirror_path, FCMMMirrorCache._info_file_name)
+        FCMMTools.save_to_json_file(info_file, info, atomic=True)
+
+    @staticmethod
+    def evict(cache_path, lock_path, max_count=20, max_size=10240, keep_path=None):
+        """
+        按最后使用时间淘汰镜像，直到数量及容量都不超过限制（正在被使用的镜像不淘汰）
+
+        @decorators staticmethod
+
+        @param {string} cache_path - 缓存目录
+        @param {string} lock_path - 锁文件目录
+        @param {int} max_count=20 - 最多缓存的镜像数量
+        @param {float} max_size=10240 - 缓存的最大容量（MB）
+        @param {string} keep_path=None - 不淘汰的镜像目录（本次使用的镜像）
+
+        @returns {string[]} - 被淘汰的镜像目录清单
+        """
+        mirror_list = list()
+        total_size = 0
+        for _entry in os.scandir(cache_path):
+            _info_file = os.path.join(_entry.path, FCMMMirrorCache._info_file_name)
+            if not _entry.is_dir() or not os.path.exists(_info_file):
+                continue
+            try:
+                with open(_info_file, 'r', encoding='utf-8') as f:
+                    _info = json.loads(f.read())
+                _item = (float(_info['last_used']), float(_info['size']), _entry.path)
+            except (OSError, ValueError, KeyError, TypeError):
+                # 信息文件损坏或已被删除，跳过该镜像（下次使用时会重新生成）
+                continue
+            total_size = total_size + _item[1]
+            mirror_list.append(_item)
+        mirror_list.sort()
+
+        evicted = list()
+        count = len(mirror_list)
+        for _last_used, _size, _path in mirror_list:
+            if count <= max_count and total_size <= max_size * 1024:
+                break
+            if keep_path is not None and os.path.realpath(_path) == os.path.realpath(keep_path):
+                continue
+            _lock = FCMMRepoLock(lock_path, _path, shared=False, timeout=0)
+            if not _lock.acquire():
+                # 正在被其他进程使用
+                continue
+            try:
+                FileTools.remove_dir(_path)
+            finally:
+                _lock.release()
+            count = count - 1
+            total_size = total_size - _size
+            evicted.append(_path)
+        return evicted
+
+
+if __name__ == '__main__':
+    # 当程序自己独立运行时执行的操作
+    # 打印版本信息
+    print(('模块名：%s  -  %s\n'
+           '作者：%s\n'
+           '发布日期：%s\n'
+           '版本：%s' % (__MOUDLE__, __DESCRIPT__, __AUTHOR__, __PUBLISH__, __VERSION__)))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+FCMM交互模式的后台预获取模块，在等待命令输入期间保持远程仓库快照及对象为最新
+@module fcmm_prefetch
+@file fcmm_prefetch.py
+"""
+
+import threading
+from fcmm_git_tools import FCMMGitTools
+from fcmm_repo_session import RepoSession
+
+
+__MOUDLE__ = 'fcmm_prefetch'  # 模块名
+__DESCRIPT__ = 'FCMM交互模式的后台预获取'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = '黎慧剑'  # 作者
+__PUBLISH__ = '2018.07.19'  # 发布日期
+
+
+class FCMMPrefetch(threading.Thread):
+    """
+    FCMM后台预获取线程类
+    按指定间隔对当前工作目录执行预获取（@see FCMMGitTools.prefetch_remote），网络访问不持有lock，
+    只在使预获取结果生效（替换快照及更新远程跟踪分支）时持有；命令执行期间应持有lock，
+    预获取期间有命令执行过时丢弃本次结果（命令可能已修改远程仓库），重新预获取
+    """
+
+    def __init__(self, work_dir, interval=60, ref_index=None):
+        """
+        构造函数
+
+        @param {string} work_dir - 初始的工作目录
+        @param {float} interval=60 - 预获取间隔（秒）
+        @param {FCMMRefIndex} ref_index=None - 预获取后要更新的引用名索引
+        """
+        threading.Thread.__init__(self, name='fcmm-prefetch', daemon=True)
+        self.lock = threading.Lock()
+        self._work_dir = work_dir
+        self._interval = interval
+        self._ref_index = ref_index
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        # 命令执行完成的次数，用于判断预获取期间是否有命令执行过
+        self._cmd_seq = 0
+
+    def notify(self, work_dir):
+        """
+        命令执行完成后（释放lock前）通知当前工作目录，如果该目录没有快照（切换了目录或命令修改了远程仓库）则立即预获取
+
+        @param {string} work_dir - 当前工作目录
+        """
+        self._work_dir = work_dir
+        self._cmd_seq += 1
+        session = RepoSession.get_cached(work_dir)
+        if session is None or session.remote_ref_snapshot is None:
+            self._wake_event.set()
+
+    def stop(self):
+        """
+        停止预获取线程
+        """
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def run(self):
+        """
+        线程执行函数
+        """
+        while not self._stop_event.is_set():
+            work_dir = self._work_dir
+            cmd_seq = self._cmd_seq
+            try:
+                snapshot = FCMMGitTools.prefetch_remote(work_dir)
+                if snapshot is not None:
+                    with self.lock:
+                        if (cmd_seq == self._cmd_seq and
+                                FCMMGitTools.apply_prefetch(work_dir, snapshot) and
+                                self._ref_index is not None):
+                            self._ref_index.update_from_repo(work_dir)
+            except Exception:
+                # 预获取失败不影响命令执行，命令会自行同步获取
+                pass
+            self._wake_event.wait(self._interval)
+            self._wake_event.clear()
+
+
+if __name__ == '__main__':
+    # 当程序自己独立运行时执行的操作
+    # 打印版本信息
+    print(('模块名：%s  -  %s\n'
+           '作者：%s\n'
+           '发布日期：%s\n'
+           '版本：%s' % (__MOUDLE__, __DESCRIPT__, __AUTHOR__, __PUBLISH__, __VERSION__)))
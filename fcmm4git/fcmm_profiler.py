@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+FCMM性能分析模块，对命令执行进行性能分析，输出pstats及火焰图使用的折叠栈文件
+@module fcmm_profiler
+@file fcmm_profiler.py
+"""
+
+import os
+import time
+import pstats
+import cProfile
+
+
+__MOUDLE__ = 'fcmm_profiler'  # 模块名
+__DESCRIPT__ = 'FCMM性能分析'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = '黎慧剑'  # 作者
+__PUBLISH__ = '2018.07.19'  # 发布日期
+
+
+class FCMMProfiler(object):
+    """
+    FCMM性能分析类
+    通过cProfile（确定性分析）执行函数，每次执行输出两个文件：
+        <名称>.<时间戳>.pstats - 可通过pstats、snakeviz等工具查看
+        <名称>.<时间戳>.collapsed - 折叠栈格式（每行为“栈;栈;栈 微秒数”），可通过flamegraph.pl、speedscope等生成火焰图
+    折叠栈根据cProfile的调用关系按耗时比例还原，超过最大深度或递归调用的部分合并到上层
+    """
+
+    # 折叠栈的最大深度
+    _max_depth = 64
+
+    @staticmethod
+    def run(save_path, name, fun, *args, **kwargs):
+        """
+        执行函数并进行性能分析
+
+        @decorators staticmethod
+
+        @param {string} save_path - 分析结果的保存目录
+        @param {string} name - 分析结果的文件名前缀（例如命令名）
+        @param {function} fun - 要执行的函数
+        @param {tuple} args - 函数的位置参数
+        @param {dict} kwargs - 函数的关键字参数
+
+        @returns {tuple} - (函数返回值, 分析结果文件的路径前缀)
+        """
+        profiler = cProfile.Profile()
+        try:
+            result = profiler.runcall(fun, *args, **kwargs)
+        finally:
+            os.makedirs(save_path, exist_ok=True)
+            file_prefix = os.path.join(save_path, '%s.%s' % (
+                name, time.strftime('%Y%m%d%H%M%S', time.localtime())))
+            profiler.dump_stats(file_prefix + '.pstats')
+            with open(file_prefix + '.collapsed', 'w', encoding='utf-8') as f:
+                f.write('\n'.join(FCMMProfiler.collapse_stacks(pstats.Stats(profiler))) + '\n')
+        return result, file_prefix
+
+    @staticmethod
+    def collapse_stacks(stats):
+        """
+        将pstats的调用关系转换为折叠栈
+
+        @decorators staticmethod
+
+        @param {pstats.Stats} stats - 性能分析数据
+
+        @returns {string[]} - 折叠栈清单，每行格式为“栈;栈;栈 微秒数”
+        """
+        # 建立被调用关系：key为调用方，value为{被调用方: (本调用方下的自身耗时, 累计耗时)}
+        callees = dict()
+        for _fun, (_cc, _nc, _tt, _ct, _callers) in stats.stats.items():
+            for _caller, _edge in _callers.items():
+                callees.setdefault(_caller, dict())[_fun] = (_edge[2], _edge[3])
+
+        samples = dict()
+
+        def walk(fun, stack, tt, ct):
+            key = ';'.join(stack)
+            samples[key] = samples.get(key, 0) + tt
+            total_ct = stats.stats[fun][3]
+            if total_ct <= 0 or len(stack) >= FCMMProfiler._max_depth:
+                return
+            scale = ct / total_ct
+            for _callee, (_edge_tt, _edge_ct) in callees.get(fun, dict()).items():
+                _label = FCMMProfiler._label(_callee)
+                if _label in stack or _edge_ct * scale < 0.000001:
+                    # 递归调用或耗时不足1微秒，不再展开
+                    continue
+                walk(_callee, stack + [_label], _edge_tt * scale, _edge_ct * scale)
+
+        for _fun, (_cc, _nc, _tt, _ct, _callers) in stats.stats.items():
+            if len(_callers) == 0:
+                walk(_fun, [FCMMProfiler._label(_fun)], _tt, _ct)
+
+        lines = list()
+        for _key in sorted(samples.keys()):
+            _micro_seconds = int(samples[_key] * 1000000)
+            if _micro_seconds > 0:
+                lines.append('%s %d' % (_key, _micro_seconds))
+        return lines
+
+    @staticmethod
+    def _label(fun):
+        """
+        获取函数在折叠栈中的显示名
+
+        @decorators staticmethod
+
+        @param {tuple} fun - pstats的函数标识(文件名, 行号, 函数名)
+
+        @returns {string} - 显示名，格式为“函数名 (文件名:行号)”
+        """
+        file_name, line_no, fun_name = fun
+        if file_name == '~':
+            # 内置函数
+            label = fun_name
+        else:
+            label = '%s (%s:%d)' % (fun_name, os.path.basename(file_name), line_no)
+        # 折叠栈以';'分隔栈帧，以最后一个空格分隔耗时
+        return label.replace(';', ',')
+
+
+if __name__ == '__main__':
+    # 当程序自己独立运行时执行的操作
+    # 打印版本信息
+    print(('模块名：%s  -  %s\n'
+           '作者：%s\n'
+           '发布日期：%s\n'
+           '版本：%s' % (__MOUDLE__, __DESCRIPT__, __AUTHOR__, __PUBLISH__, __VERSION__)))
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+FCMM引用名索引模块，为命令交互模式的分支、标签及版本号参数提供按前缀的自动完成
+@module fcmm_ref_index
+@file fcmm_ref_index.py
+"""
+
+import bisect
+from prompt_toolkit.completion import Completer, Completion
+from fcmm_tools import FCMMTools
+from fcmm_repo_session import RepoSession
+
+
+__MOUDLE__ = 'fcmm_ref_index'  # 模块名
+__DESCRIPT__ = 'FCMM引用名索引'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = '黎慧剑'  # 作者
+__PUBLISH__ = '2018.07.19'  # 发布日期
+
+
+class FCMMRefIndex(object):
+    """
+    FCMM引用名索引类
+    按类型（branch-分支名，version-标签及版本号）维护排序数组，通过二分查找按前缀获取候选值；
+    排序数组为不可修改的tuple，更新时整体替换为新的数组，后台线程更新时正在查询的数组不受影响
+    """
+
+    # 版本号参数额外支持的选择器，@see FCMMVersionIndex.resolve
+    VERSION_SELECTORS = ('latest', 'latest-d', 'latest-v')
+
+    def __init__(self):
+        """
+        构造函数
+        """
+        self._names = {'branch': tuple(), 'version': tuple()}
+
+    def names(self, kind):
+        """
+        获取指定类型当前的排序数组
+
+        @param {string} kind - 类型，branch或version
+
+        @returns {tuple} - 排序后的名字清单（更新后不会变化）
+        """
+        return self._names[kind]
+
+    def update(self, kind, name_list):
+        """
+        更新指定类型的名字清单（名字没有变化时不替换数组）
+
+        @param {string} kind - 类型，branch或version
+        @param {iterable} name_list - 最新的全部名字
+        """
+        new_set = set(name_list)
+        if len(new_set) == len(self._names[kind]) and new_set.issuperset(self._names[kind]):
+            return
+        self._names[kind] = tuple(sorted(new_set))
+
+    def complete(self, kind, prefix, limit=None):
+        """
+        按前缀获取候选值
+
+        @param {string} kind - 类型，branch或version
+        @param {string} prefix - 已输入的前缀
+        @param {int} limit=None - 最多返回的数量，不传入代表返回全部
+
+        @returns {string[]} - 排序后的候选值清单
+        """
+        names = self._names[kind]  # 只读取一次，更新时替换的新数组不影响本次查询
+        start = bisect.bisect_left(names, prefix)
+        end = bisect.bisect_left(names, prefix + '\U0010ffff', lo=start)
+        if limit is not None:
+            end = min(end, start + limit)
+        return list(names[start:end])
+
+    def update_from_repo(self, work_dir):
+        """
+        从本地引用及已缓存的远程快照更新索引（不访问网络）
+
+        @param {string} work_dir - 工作目录
+        """
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git for-each-ref --format="%(refname)" refs/heads refs/remotes/origin refs/tags',
+            cwd=work_dir)
+        if res[0] != 0:
+            # 不是git仓库，清空索引
+            self.update('branch', [])
+            self.update('version', [])
+            return
+        branch_set = set()
+        tag_set = set(FCMMRefIndex.VERSION_SELECTORS)
+        for line in res[1].splitlines():
+            if line.startswith('refs/heads/'):
+                branch_set.add(line[11:])
+            elif line.startswith('refs/remotes/origin/'):
+                if line != 'refs/remotes/origin/HEAD':
+                    branch_set.add(line[20:])
+            elif line.startswith('refs/tags/'):
+                tag_set.add(line[10:])
+        session = RepoSession.get_cached(work_dir)
+        snapshot = None if session is None else session.remote_ref_snapshot
+        if snapshot is not None:
+            branch_set.update(snapshot['heads'].keys())
+            tag_set.update(snapshot['tags'].keys())
+        self.update('branch', branch_set)
+        self.update('version', tag_set)
+
+
+class FCMMRefCompleter(Completer):
+    """
+    命令交互模式的自动完成类
+    补全命令名、命令参数名及参数值；ref_complete_para中的参数值通过引用名索引按前缀查找（二分查找，
+    不遍历全部引用），其他参数值从cmd_para配置的候选值中按前缀过滤
+    """
+
+    def __init__(self, cmd_para, ref_para, ref_index, limit=100):
+        """
+        构造函数
+
+        @param {dict} cmd_para - fcmm.json中的cmd_para配置
+        @param {dict} ref_para - 按引用名补全的参数，key为命令，value为{参数名: 类型}
+            @see FCMMRefCompleter.get_ref_para
+        @param {FCMMRefIndex} ref_index - 引用名索引
+        @param {int} limit=100 - 引用名最多显示的候选值数量
+        """
+        Completer.__init__(self)
+        self._cmd_para = cmd_para
+        self._ref_para = ref_para
+        self._ref_index = ref_index
+        self._limit = limit
+
+    @staticmethod
+    def get_ref_para(config):
+        """
+        根据配置获取各命令按引用名补全的参数
+
+        @decorators staticmethod
+
+        @param {dict} config - fcmm的配置对象，使用ref_complete_para、ref_complete_skip及cmd_para
+
+        @returns {dict} - key为命令，value为{参数名: 类型(branch/version)}；
+            只包含cmd_para中候选值为空数组且不在ref_complete_skip中的参数
+        """
+        ref_para = dict()
+        for _cmd, _cmd_para in config['cmd_para'].items():
+            _long_para = _cmd_para.get('long_para')
+            if not isinstance(_long_para, dict):
+                continue
+            _skip = config['ref_complete_skip'].get(_cmd, list())
+            _para_kind = dict()
+            for _kind, _para_list in config['ref_complete_para'].items():
+                for _para in _para_list:
+                    if _long_para.get(_para) == [] and _para not in _skip:
+                        _para_kind[_para] = _kind
+            if len(_para_kind) > 0:
+                ref_para[_cmd] = _para_kind
+        return ref_para
+
+    def get_candidates(self, words):
+        """
+        获取当前输入的候选值
+
+        @param {string[]} words - 按空格拆分的已输入内容，最后一个为正在输入的内容
+
+        @returns {string[]} - 候选值清单
+        """
+        word = words[-1]
+        if len(words) == 1:
+            return sorted([_cmd for _cmd in self._cmd_para.keys() if _cmd.startswith(word)])
+        long_para = self._cmd_para.get(words[0], dict()).get('long_para')
+        if not isinstance(long_para, dict):
+            return []
+        if word.startswith('-'):
+            return ['-' + _para for _para in long_para.keys() if ('-' + _para).startswith(word)]
+        if not words[-2].startswith('-'):
+            return []
+        para = words[-2][1:]
+        kind = self._ref_para.get(words[0], dict()).get(para)
+        if kind is not None:
+            return self._ref_index.complete(kind, word, limit=self._limit)
+        values = long_para.get(para)
+        if isinstance(values, list):
+            return [_value for _value in values if _value.startswith(word)]
+        return []
+
+    def get_completions(self, document, complete_event):
+        """
+        prompt_toolkit的自动完成接口
+
+        @param {prompt_toolkit.document.Document} document - 当前输入的文档
+        @param {prompt_toolkit.completion.CompleteEvent} complete_event - 自动完成事件
+        """
+        words = document.text_before_cursor.lstrip().split(' ')
+        for _candidate in self.get_candidates(words):
+            yield Completion(_candidate, start_position=-len(words[-1]))
+
+
+if __name__ == '__main__':
+    # 当程序自己独立运行时执行的操作
+    # 打印版本信息
+    print(('模块名：%s  -  %s\n'
+           '作者：%s\n'
+           '发布日期：%s\n'
+           '版本：%s' % (__MOUDLE__, __DESCRIPT__, __AUTHOR__, __PUBLISH__, __VERSION__)))
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+FCMM仓库会话模块，在一个命令或交互会话期间持有仓库对象及仓库相关的缓存信息
+@module fcmm_repo_session
+@file fcmm_repo_session.py
+"""
+
+import os
+import functools
+import threading
+import subprocess
+from git import Repo
+from fcmm_tools import FCMMTools
+
+
+__MOUDLE__ = 'fcmm_repo_session'  # 模块名
+__DESCRIPT__ = 'FCMM仓库会话'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = '黎慧剑'  # 作者
+__PUBLISH__ = '2018.07.19'  # 发布日期
+
+
+class RepoSession(object):
+    """
+    FCMM仓库会话类（替代原repo信息字典）
+    持有git.Repo对象、远程仓库快照、git用户名及.fcmm4git配置，同一工作目录在进程内共用一个会话；
+    本地分支、标签、当前工作分支及.fcmm4git配置在修改仓库的处理后需调用invalidate失效，
+    修改仓库的FCMMGitTools函数通过RepoSession.mutating装饰器自动失效；
+    缓存值整体替换（不修改已返回的字典），失效与读取可以在不同线程中同时进行
+    """
+
+    __slots__ = ('work_dir', 'parent_dir', 'repo', 'remote_ref_snapshot',
+                 '_user_name', '_fcmm_config', '_active_branch', '_branches', '_tags')
+
+    # 未装载的缓存值标识（.fcmm4git配置不存在时缓存值为None）
+    _UNSET = object()
+
+    # 会话缓存，key为工作目录的真实路径（只缓存git仓库的会话）
+    _sessions = dict()
+    _lock = threading.Lock()
+
+    def __init__(self, work_dir):
+        """
+        构造函数
+
+        @param {string} work_dir - 工作目录
+        """
+        self.work_dir = work_dir
+        temp_dir = work_dir.rstrip('\\/')
+        _index = temp_dir.replace('\\', '/').rfind('/')
+        self.parent_dir = temp_dir[0: _index]
+        try:
+            self.repo = Repo(work_dir)
+        except Exception as e:
+            # 忽略异常，通过repo是否为None来进行后续处理
+            self.repo = None
+        # 远程仓库快照，@see FCMMGitTools.get_remote_ref_snapshot
+        self.remote_ref_snapshot = None
+        self._user_name = None
+        self.invalidate()
+
+    #############################
+    # 会话缓存
+    #############################
+
+    @staticmethod
+    def get(work_dir):
+        """
+        获取工作目录的会话（已有缓存时直接返回）
+
+        @decorators staticmethod
+
+        @param {string} work_dir - 工作目录
+
+        @returns {RepoSession} - 仓库会话，不是git仓库时repo为None（不缓存）
+        """
+        key = os.path.realpath(work_dir)
+        with RepoSession._lock:
+            session = RepoSession._sessions.get(key)
+            if session is None:
+                session = RepoSession(work_dir)
+                if session.repo is not None:
+                    RepoSession._sessions[key] = session
+            return session
+
+    @staticmethod
+    def get_cached(work_dir):
+        """
+        获取已缓存的会话（不新建）
+
+        @decorators staticmethod
+
+        @param {string} work_dir - 工作目录
+
+        @returns {RepoSession} - 仓库会话，没有缓存返回None
+        """
+        with RepoSession._lock:
+            return RepoSession._sessions.get(os.path.realpath(work_dir))
+
+    @staticmethod
+    def all_sessions():
+        """
+        获取全部已缓存的会话
+
+        @decorators staticmethod
+
+        @returns {RepoSession[]} - 会话清单
+        """
+        with RepoSession._lock:
+            return list(RepoSession._sessions.values())
+
+    @staticmethod
+    def drop(work_dir=None):
+        """
+        删除会话缓存并关闭仓库对象（仓库目录被删除或整体替换后应调用）
+
+        @decorators staticmethod
+
+        @param {string} work_dir=None - 要删除的工作目录，不传入代表删除全部会话
+        """
+        with RepoSession._lock:
+            if work_dir is None:
+                session_list = list(RepoSession._sessions.values())
+                RepoSession._sessions.clear()
+            else:
+                session_list = [RepoSession._sessions.pop(os.path.realpath(work_dir), None)]
+        for _session in session_list:
+            if _session is not None and _session.repo is not None:
+                _session.repo.close()
+
+    @staticmethod
+    def mutating(fun):
+        """
+        修改仓库的函数的装饰器，函数执行后使第一个参数（仓库会话）的本地仓库缓存失效
+
+        @decorators staticmethod
+
+        @param {function} fun - 被装饰的函数，第一个参数为RepoSession
+
+        @returns {function} - 装饰后的函数
+        """
+        @functools.wraps(fun)
+        def wrapper(repo_info, *args, **kwargs):
+            try:
+                return fun(repo_info, *args, **kwargs)
+            finally:
+                repo_info.invalidate()
+        return wrapper
+
+    #############################
+    # 会话信息
+    #############################
+
+    def invalidate(self):
+        """
+        使本地仓库的缓存（分支、标签、当前工作分支及.fcmm4git配置）失效
+        远程仓库快照及git用户名不在此失效
+        """
+        self._fcmm_config = RepoSession._UNSET
+        self._active_branch = None
+        self._branches = None
+        self._tags = None
+
+    def get_user_name(self, encoding='GBK'):
+        """
+        获取仓库的git用户名（会话期间只获取一次）
+
+        @param {string} encoding='GBK' - 命令终端编码
+
+        @returns {string} - 用户名，获取失败返回''
+        """
+        if self._user_name is None:
+            res = subprocess.run('git config user.name', shell=True, cwd=self.work_dir,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            if res.returncode != 0:
+                return ''
+            self._user_name = res.stdout.decode(encoding=encoding).rstrip('\n\r')
+        return self._user_name
+
+    def get_fcmm_config(self):
+        """
+        获取工作目录中的.fcmm4git配置信息
+
+        @returns {dict} - 返回JSON配置信息对象，如果配置文件不存在，返回None
+        """
+        fcmm_config = self._fcmm_config
+        if fcmm_config is RepoSession._UNSET:
+            fcmm_config = FCMMTools.get_fcmm_config(self.work_dir)
+            self._fcmm_config = fcmm_config
+        return fcmm_config
+
+    def get_active_branch(self):
+        """
+        获取当前工作分支
+
+        @returns {string} - 分支名称
+        """
+        active_branch = self._active_branch
+        if active_branch is None:
+            active_branch = self.repo.active_branch.name
+            self._active_branch = active_branch
+        return active_branch
+
+    def get_branches(self):
+        """
+        获取本地分支（直接读取引用文件，不启动git进程）
+
+        @returns {dict} - key为分支名，value为commit id
+        """
+        branches = self._branches
+        if branches is None:
+            branches = {_branch.name: _branch.commit.hexsha for _branch in self.repo.branches}
+            self._branches = branches
+        return branches
+
+    def get_tags(self):
+        """
+        获取本地标签（标签指向的commit在使用时才解析）
+
+        @returns {dict} - key为标签名，value为git.TagReference对象
+        """
+        tags = self._tags
+        if tags is None:
+            tags = {_tag.name: _tag for _tag in self.repo.tags}
+            self._tags = tags
+        return tags
+
+
+if __name__ == '__main__':
+    # 当程序自己独立运行时执行的操作
+    # 打印版本信息
+    print(('模块名：%s  -  %s\n'
+           '作者：%s\n'
+           '发布日期：%s\n'
+           '版本：%s' % (__MOUDLE__, __DESCRIPT__, __AUTHOR__, __PUBLISH__, __VERSION__)))
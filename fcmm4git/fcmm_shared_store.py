@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+FCMM共享对象库模块，同一台机器上同一远程仓库的多个本地仓库通过git alternates共享对象
+@module fcmm_shared_store
+@file fcmm_shared_store.py
+"""
+
+import os
+import json
+import hashlib
+from fcmm_tools import FCMMTools
+from fcmm_lock import FCMMRepoLock
+from fcmm_mirror_cache import FCMMMirrorCache
+
+
+__MOUDLE__ = 'fcmm_shared_store'  # 模块名
+__DESCRIPT__ = 'FCMM共享对象库'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = '黎慧剑'  # 作者
+__PUBLISH__ = '2018.07.19'  # 发布日期
+
+
+class FCMMSharedStore(object):
+    """
+    FCMM共享对象库类
+    每个远程仓库在共享库目录下对应一个裸仓库（目录名为规范化url的哈希，@see FCMMMirrorCache.normalize_url），
+    加入共享库的本地仓库登记在裸仓库的fcmm-clients.json中，并在裸仓库的refs/clients/<id>/下保存各本地仓库引用的副本
+    （包括本地reflog中的提交），保证本地仓库已有引用需要的对象在共享库中可达；
+    gc默认不删除不可达对象，避免清除本地仓库正在fetch（尚未同步引用副本）所依赖的对象；
+    共享库不会被自动淘汰，本地仓库删除后在下一次gc时注销
+    """
+
+    # 本地仓库登记文件名
+    _clients_file_name = 'fcmm-clients.json'
+
+    @staticmethod
+    def get_store_path(store_root, url):
+        """
+        获取远程仓库对应的共享库目录
+
+        @decorators staticmethod
+
+        @param {string} store_root - 共享库根目录
+        @param {string} url - 远程仓库url
+
+        @returns {string} - 共享库目录路径
+        """
+        key = hashlib.sha1(FCMMMirrorCache.normalize_url(url).encode(encoding='utf-8')).hexdigest()
+        return os.path.join(store_root, key[0:16] + '.git')
+
+    @staticmethod
+    def get_client_id(work_dir):
+        """
+        获取本地仓库在共享库中的标识
+
+        @decorators staticmethod
+
+        @param {string} work_dir - 本地仓库的工作目录
+
+        @returns {string} - 标识
+        """
+        key = os.path.normcase(os.path.realpath(work_dir)).encode(encoding='utf-8')
+        return hashlib.sha1(key).hexdigest()[0:16]
+
+    @staticmethod
+    def _load_clients(store_path):
+        """
+        获取共享库登记的本地仓库
+
+        @decorators staticmethod
+
+        @param {string} store_path - 共享库目录
+
+        @returns {dict} - key为本地仓库标识，value为工作目录
+        """
+        clients_file = os.path.join(store_path, FCMMSharedStore._clients_file_name)
+        if not os.path.exists(clients_file):
+            return dict()
+        with open(clients_file, 'r', encoding='utf-8') as f:
+            return json.loads(f.read())
+
+    @staticmethod
+    def _sync_client_refs(store_path, client_id, work_dir):
+        """
+        将本地仓库的全部引用（含对象）复制到共享库的refs/clients/<id>/下
+
+        @decorators staticmethod
+
+        @param {string} store_path - 共享库目录
+        @param {string} client_id - 本地仓库标识
+        @param {string} work_dir - 本地仓库的工作目录
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 要返回显示的内容
+        """
+        res = FCMMTools.run_sys_cmd(
+            'git -C "%s" fetch -q --no-tags --prune "%s" "+refs/*:refs/clients/%s/*"' % (
+                store_path, work_dir, client_id))
+        if res[0] != 0:
+            return res
+        return FCMMSharedStore._pin_client_reflog(store_path, client_id, work_dir)
+
+    @staticmethod
+    def _pin_client_reflog(store_path, client_id, work_dir):
+        """
+        将本地仓库reflog中的提交固定到共享库的refs/clients/<id>/fcmm-reflog/下
+        只被reflog引用的对象（如reset/rebase前的提交）可能已移入共享库，不固定的话共享库gc时会被清除；
+        共享库中不存在的提交仍保存在本地仓库自己的对象库中（repack会保留reflog引用的对象），无需固定
+
+        @decorators staticmethod
+
+        @param {string} store_path - 共享库目录
+        @param {string} client_id - 本地仓库标识
+        @param {string} work_dir - 本地仓库的工作目录
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 要返回显示的内容
+        """
+        res = FCMMTools.run_sys_cmd_with_output('git log -g --all --format=%H', cwd=work_dir)
+        if res[0] != 0:
+            return [res[0], res[1]]
+        commit_list = sorted(set([_line for _line in res[1].splitlines() if _line != '']))
+        if len(commit_list) == 0:
+            return [0, '']
+
+        # 共享库中不存在的提交输出为"<commit> missing"
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git cat-file --batch-check="%(objectname)"', cwd=store_path,
+            input_str='\n'.join(commit_list) + '\n')
+        if res[0] != 0:
+            return [res[0], res[1]]
+        stdin_str = ''.join([
+            'update refs/clients/%s/fcmm-reflog/%s %s\n' % (client_id, _line, _line)
+            for _line in res[1].splitlines() if _line != '' and ' ' not in _line
+        ])
+        if stdin_str == '':
+            return [0, '']
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git update-ref --stdin', cwd=store_path, input_str=stdin_str)
+        return [res[0], res[1]]
+
+    @staticmethod
+    def attach(store_root, url, work_dir, lock_path, lock_timeout=600):
+        """
+        将本地仓库加入共享库：对象复制到共享库，登记alternates后重新打包，本地只保留共享库中没有的对象
+
+        @decorators staticmethod
+
+        @param {string} store_root - 共享库根目录
+        @param {string} url - 远程仓库url
+        @param {string} work_dir - 本地仓库的工作目录
+        @param {string} lock_path - 锁文件目录
+        @param {float} lock_timeout=600 - 等待共享库锁的超时时间（秒）
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 要返回显示的内容
+        """
+        res = FCMMTools.run_sys_cmd_with_output('git rev-parse --absolute-git-dir', cwd=work_dir)
+        if res[0] != 0:
+            return [res[0], 'not a git repository: %s' % (work_dir)]
+        alternates_file = os.path.join(res[1].strip(), 'objects', 'info', 'alternates')
+
+        store_path = FCMMSharedStore.get_store_path(store_root, url)
+        client_id = FCMMSharedStore.get_client_id(work_dir)
+        with FCMMRepoLock(lock_path, store_path, shared=False, timeout=lock_timeout):
+            if not os.path.exists(store_path):
+                res = FCMMTools.run_sys_cmd('git init -q --bare "%s"' % (store_path))
+                if res[0] != 0:
+                    return res
+            res = FCMMSharedStore._sync_client_refs(store_path, client_id, work_dir)
+            if res[0] != 0:
+                return res
+            clients = FCMMSharedStore._load_clients(store_path)
+            clients[client_id] = os.path.realpath(work_dir)
+            FCMMTools.save_to_json_file(
+                os.path.join(store_path, FCMMSharedStore._clients_file_name), clients)
+
+            # 登记alternates，重新打包时去除共享库已有的对象
+            # 需在锁内完成，否则并发的gc可能在本地仓库去除对象后、引用副本刷新前清除这些对象
+            with open(alternates_file, 'w', encoding='utf-8') as f:
+                f.write(os.path.join(os.path.realpath(store_path), 'objects').replace('\\', '/') + '\n')
+            return FCMMTools.run_sys_cmd('git -C "%s" repack -a -d -l -q' % (work_dir))
+
+    @staticmethod
+    def gc(store_path, lock_path, prune_expire='never', lock_timeout=600, cruft=False):
+        """
+        安全地对共享库进行gc
+        先注销已删除的本地仓库，并刷新其他本地仓库的引用副本（保证本地仓库需要的对象都可达），再执行gc；
+        本地仓库fetch时不获取共享库锁（用户也可能直接执行git fetch），fetch协商时已存在于共享库的对象不会再下载，
+        这些对象在新引用同步到共享库前是不可达的，因此默认不删除不可达对象（prune_expire为'never'）
+
+        @decorators staticmethod
+
+        @param {string} store_path - 共享库目录
+        @param {string} lock_path - 锁文件目录
+        @param {string} prune_expire='never' - 不可达对象的保留期限（git gc --prune的取值），
+            'never'代表不删除对象；设置为其他值时需确保gc期间没有本地仓库执行fetch
+        @param {float} lock_timeout=600 - 等待共享库锁的超时时间（秒）
+        @param {bool} cruft=False - 是否将不可达对象保存到cruft包（git 2.37及以上版本支持），
+            不传入时不可达对象会以松散对象的形式保留
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 要返回显示的内容
+        """
+        with FCMMRepoLock(lock_path, store_path, shared=False, timeout=lock_timeout):
+            clients = FCMMSharedStore._load_clients(store_path)
+            for _id in list(clients.keys()):
+                if os.path.exists(clients[_id]):
+                    res = FCMMSharedStore._sync_client_refs(store_path, _id, clients[_id])
+                    if res[0] != 0:
+                        # 无法确认本地仓库需要的对象，不能安全gc
+                        return res
+                else:
+                    # 本地仓库已删除，注销并删除引用副本
+                    clients.pop(_id)
+                    FCMMTools.run_sys_cmd_with_output(
+                        'git for-each-ref --format="delete %%(refname)" refs/clients/%s/ | '
+                        'git update-ref --stdin' % (_id), cwd=store_path)
+            FCMMTools.save_to_json_file(
+                os.path.join(store_path, FCMMSharedStore._clients_file_name), clients)
+            return FCMMTools.run_sys_cmd(
+                'git -C "%s" gc -q%s --prune=%s' % (store_path, ' --cruft' if cruft else '', prune_expire))
+
+    @staticmethod
+    def gc_all(store_root, lock_path, prune_expire='never', lock_timeout=600, cruft=False):
+        """
+        对共享库根目录下的全部共享库进行gc
+
+        @decorators staticmethod
+
+        @param {string} store_root - 共享库根目录
+        @param {string} lock_path - 锁文件目录
+        @param {string} prune_expire='never' - 不可达对象的保留期限，@see FCMMSharedStore.gc
+        @param {float} lock_timeout=600 - 等待共享库锁的超时时间（秒）
+        @param {bool} cruft=False - 是否将不可达对象保存到cruft包，@see FCMMSharedStore.gc
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 要返回显示的内容
+        """
+        if not os.path.exists(store_root):
+            return [0, '']
+        for _entry in os.scandir(store_root):
+            if _entry.is_dir() and _entry.name.endswith('.git'):
+                res = FCMMSharedStore.gc(_entry.path, lock_path, prune_expire, lock_timeout, cruft)
+                if res[0] != 0:
+                    return res
+        return [0, '']
+
+
+if __name__ == '__main__':
+    # 当程序自己独立运行时执行的操作
+    # 打印版本信息
+    print(('模块名：%s  -  %s\n'
+           '作者：%s\n'
+           '发布日期：%s\n'
+           '版本：%s' % (__MOUDLE__, __DESCRIPT__, __AUTHOR__, __PUBLISH__, __VERSION__)))
@@ -9,9 +9,13 @@ fcmm的命令处理工具模块，提供fcmm的一些基础处理函数
 
 import os
 import json
+import time
 import tarfile
+import tempfile
+import threading
 import subprocess
 from snakerlib.generic import RunTools
+from fcmm_metrics import FCMMMetrics
 
 
 __MOUDLE__ = 'fcmm_tools'  # 模块名
@@ -27,8 +31,50 @@ class FCMMTools(object):
     提供fcmm的一些基础处理函数
     """
 
+    # 按线程保存的输出设置，属性包括
+    #   quiet - 是否静默执行（不打印过程信息，系统命令的输出不显示）
+    _local = threading.local()
+
+    # 临时文件序号，与进程号、线程号一起保证并行写入时临时文件名不重复
+    _temp_seq_lock = threading.Lock()
+    _temp_seq = 0
+
+    @staticmethod
+    def set_quiet(quiet):
+        """
+        设置当前线程是否静默执行（嵌入调用时使用，不影响其他线程）
+
+        @decorators staticmethod
+
+        @param {bool} quiet - 是否静默执行
+        """
+        FCMMTools._local.quiet = quiet
+
+    @staticmethod
+    def is_quiet():
+        """
+        判断当前线程是否静默执行
+
+        @decorators staticmethod
+
+        @returns {bool} - 是否静默执行
+        """
+        return getattr(FCMMTools._local, 'quiet', False)
+
+    @staticmethod
+    def echo(msg):
+        """
+        打印过程信息（静默执行时不打印）
+
+        @decorators staticmethod
+
+        @param {string} msg - 要打印的信息
+        """
+        if not FCMMTools.is_quiet():
+            print(msg)
+
     @staticmethod
-    def save_to_json_file(file_path, json_obj):
+    def save_to_json_file(file_path, json_obj, atomic=False):
         """
         将dict对象写入json文件
 
@@ -36,11 +82,52 @@ class FCMMTools(object):
 
         @param {string} file_path - 要保存的文件路径（含文件名）
         @param {dict} json_obj - 要写入的对象
+        @param {bool} atomic=False - 是否原子写入，@see FCMMTools.save_to_file_atomic
         """
+        if atomic:
+            FCMMTools.save_to_file_atomic(file_path, json.dumps(json_obj, indent=2))
+            return
         with open(file=file_path, mode='w', encoding='utf-8') as fp:
             fp.write(json.dumps(json_obj, indent=2))
 
     @staticmethod
+    def get_temp_file_name(file_path):
+        """
+        获取指定文件对应的临时文件名（文件名后加进程号、线程号及序号），并行写入时不会重复
+
+        @decorators staticmethod
+
+        @param {string} file_path - 文件路径（含文件名）
+
+        @returns {string} - 临时文件路径，例如xxx.json.1234.5678.1.tmp
+        """
+        with FCMMTools._temp_seq_lock:
+            FCMMTools._temp_seq += 1
+            seq = FCMMTools._temp_seq
+        return '%s.%d.%d.%d.tmp' % (file_path, os.getpid(), threading.get_ident(), seq)
+
+    @staticmethod
+    def save_to_file_atomic(file_path, text):
+        """
+        原子写入文本文件：先写同目录的临时文件再通过os.replace替换，
+        并行读取的进程不会读到写了一半的文件；写入失败时删除临时文件
+
+        @decorators staticmethod
+
+        @param {string} file_path - 要保存的文件路径（含文件名）
+        @param {string} text - 要写入的文本
+        """
+        temp_file = FCMMTools.get_temp_file_name(file_path)
+        try:
+            with open(file=temp_file, mode='w', encoding='utf-8') as fp:
+                fp.write(text)
+            os.replace(temp_file, file_path)
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+
+    @staticmethod
+    @FCMMMetrics.phase('backup')
     def backup_to_tar(src_path, save_path, save_name):
         """
         将指定目录打包成压缩包
@@ -51,43 +138,100 @@ class FCMMTools(object):
         @param {[type]} save_path - 保存路径
         @param {[type]} save_name - 保存文件名
         """
-        with tarfile.open(save_path.rstrip('\\/') + '/' + save_name, "w:gz") as tar:
+        tar_file = save_path.rstrip('\\/') + '/' + save_name
+        with tarfile.open(tar_file, "w:gz") as tar:
             tar.add(src_path, arcname=os.path.basename(src_path))
+        FCMMMetrics.record_backup(tar_file)
+
+    @staticmethod
+    def create_temp_workspace(temp_path, prefix='fcmm-'):
+        """
+        在临时目录下创建本次执行独立使用的工作目录（多个fcmm进程并行执行时不会相互影响）
+
+        @decorators staticmethod
+
+        @param {string} temp_path - 临时目录
+        @param {string} prefix='fcmm-' - 目录名前缀
+
+        @returns {string} - 创建的工作目录路径（使用后应由调用方删除）
+        """
+        return tempfile.mkdtemp(prefix=prefix, dir=temp_path)
 
     @staticmethod
-    def run_sys_cmd(cmd_str):
+    def run_sys_cmd(cmd_str, cwd=None):
         """
         执行操作系统命令（只判断成功与否，不处理返回信息）
 
         @decorators staticmethod
 
         @param {string} cmd_str - 要执行的命令
+        @param {string} cwd=None - 命令执行的工作目录，不传入代表当前目录
 
         @returns {list} - 执行结果[returncode, msgstring]
             returncode - 0代表成功，其他代表失败
-            msgstring - 要返回显示的内容
+            msgstring - 要返回显示的内容（静默执行时为命令的错误输出）
         """
-        print('execute sys cmd: %s' % (cmd_str))
-        complete_info = subprocess.run(cmd_str, shell=True)
-        return [complete_info.returncode, '']
+        if not FCMMTools.is_quiet():
+            print('execute sys cmd: %s' % (cmd_str))
+            begin_time = time.time()
+            complete_info = subprocess.run(cmd_str, shell=True, cwd=cwd)
+            FCMMMetrics.record_git(cmd_str, time.time() - begin_time)
+            return [complete_info.returncode, '']
+
+        # 静默执行，丢弃标准输出，错误输出作为返回信息
+        begin_time = time.time()
+        complete_info = subprocess.run(cmd_str, shell=True, cwd=cwd,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        FCMMMetrics.record_git(cmd_str, time.time() - begin_time)
+        return [complete_info.returncode, complete_info.stderr.decode(errors='replace')]
 
     @staticmethod
-    def run_sys_cmd_list(cmd_list):
+    def run_sys_cmd_list(cmd_list, cwd=None):
         """
         执行多个操作系统命令
 
         @decorators staticmethod -
 
         @param {string[]} cmd_list - 操作系统命令列表
+        @param {string} cwd=None - 命令执行的工作目录，不传入代表当前目录
 
         @returns {list} - 执行结果[returncode, msgstring]
             returncode - 0代表成功，其他代表失败
             msgstring - 要返回显示的内容
         """
         for _cmd in cmd_list:
-            res = FCMMTools.run_sys_cmd(_cmd)
+            res = FCMMTools.run_sys_cmd(_cmd, cwd=cwd)
             if res[0] != 0:
                 return res
+        return [0, '']
+
+    @staticmethod
+    def run_sys_cmd_with_output(cmd_str, cwd=None, encoding='utf-8', input_str=None):
+        """
+        执行操作系统命令并获取命令的标准输出（用于需要解析结果的git命令）
+
+        @decorators staticmethod
+
+        @param {string|string[]} cmd_str - 要执行的命令，传入参数列表时不经过shell直接执行（参数无需转义）
+        @param {string} cwd=None - 命令执行的工作目录，不传入代表当前目录
+        @param {string} encoding='utf-8' - 命令输出的编码
+        @param {string} input_str=None - 要送入命令标准输入的内容
+
+        @returns {list} - 执行结果[returncode, msgstring]
+            returncode - 0代表成功，其他代表失败
+            msgstring - 命令的标准输出内容
+        """
+        input_bytes = None
+        if input_str is not None:
+            input_bytes = input_str.encode(encoding=encoding)
+        is_shell = isinstance(cmd_str, str)
+        begin_time = time.time()
+        complete_info = subprocess.run(cmd_str, shell=is_shell, cwd=cwd, input=input_bytes,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        FCMMMetrics.record_git(cmd_str if is_shell else ' '.join(cmd_str),
+                               time.time() - begin_time)
+        return [complete_info.returncode,
+                complete_info.stdout.decode(encoding=encoding, errors='replace')]
 
     @staticmethod
     def get_fcmm_config(work_dir=''):
@@ -213,7 +357,9 @@ class FCMMTools(object):
             if para_list[para] is not None:
                 if dict_cmd_para[_key] is None or dict_cmd_para[_key] == '':
                     return [1, FCMMTools.get_i18n_tips(config, 'para_must_has_value', _key)]
-                elif len(para_list[para]) > 0 and dict_cmd_para[_key] not in para_list[para]:
+                elif (len(config['cmd_para'][cmd]['long_para'][para]) > 0 and
+                        dict_cmd_para[_key] not in config['cmd_para'][cmd]['long_para'][para]):
+                    # 只按配置文件中的候选值限制（自动完成的候选值不作限制）
                     return [1, FCMMTools.get_i18n_tips(config, 'para_value_not_support', _key, dict_cmd_para[_key])]
 
         return [0, '']
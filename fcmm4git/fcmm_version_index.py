@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+FCMM版本号索引模块，将版本标签解析为可排序的关键字，支持按版本顺序进行查询
+@module fcmm_version_index
+@file fcmm_version_index.py
+"""
+
+import re
+import bisect
+
+
+__MOUDLE__ = 'fcmm_version_index'  # 模块名
+__DESCRIPT__ = 'FCMM版本号索引'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = '黎慧剑'  # 作者
+__PUBLISH__ = '2018.07.19'  # 发布日期
+
+
+class FCMMVersionIndex(object):
+    """
+    FCMM版本号索引类
+    支持两种版本号格式：
+        v1.0.1 - 按数字段排序的版本号，关键字为('v', (1, 0, 1))
+        d20180620-1 - 按日期及序号排序的版本号，关键字为('d', (20180620, 1))
+    无法解析的标签不纳入索引
+    """
+
+    # 版本号格式的正则表达式
+    _num_version_re = re.compile(r'^[vV](\d+(\.\d+)*)$')
+    _date_version_re = re.compile(r'^[dD](\d{8})(-(\d+))?$')
+
+    # 选择器格式：latest，或 版本号~N（版本号之前的第N个版本，N默认为1）
+    _selector_re = re.compile(r'^(.+)~(\d*)$')
+
+    @staticmethod
+    def parse_version(version):
+        """
+        将版本号解析为可排序的关键字
+
+        @decorators staticmethod
+
+        @param {string} version - 版本号，例如v1.0.1或d20180620-1
+
+        @returns {tuple} - 排序关键字，例如('v', (1, 0, 1))，无法解析返回None
+        """
+        match = FCMMVersionIndex._num_version_re.match(version)
+        if match is not None:
+            return ('v', tuple([int(_num) for _num in match.group(1).split('.')]))
+        match = FCMMVersionIndex._date_version_re.match(version)
+        if match is not None:
+            return ('d', (int(match.group(1)), int(match.group(3) or 0)))
+        return None
+
+    def __init__(self, tag_list):
+        """
+        构造函数
+
+        @param {iterable} tag_list - 标签名清单，无法解析为版本号的标签将被忽略
+        """
+        items = list()
+        for _tag in tag_list:
+            _key = FCMMVersionIndex.parse_version(_tag)
+            if _key is not None:
+                items.append((_key, _tag))
+        items.sort()
+        self._keys = [_item[0] for _item in items]
+        self._tags = [_item[1] for _item in items]
+
+    def __len__(self):
+        """
+        索引中的版本数量
+        """
+        return len(self._tags)
+
+    def versions(self):
+        """
+        获取排序后的全部版本号
+
+        @returns {string[]} - 版本号清单（从旧到新）
+        """
+        return list(self._tags)
+
+    def latest(self, scheme=None):
+        """
+        获取最新版本
+
+        @param {string} scheme=None - 版本号格式，'v'或'd'，不传入代表全部版本
+            注：两种格式的版本号之间没有可比较的先后关系，索引中同时存在两种格式时必须指定格式
+
+        @returns {string} - 最新的版本号，没有版本（或未指定格式且两种格式同时存在）返回None
+        """
+        if scheme is None:
+            if len(self._keys) == 0 or self._keys[0][0] != self._keys[-1][0]:
+                return None
+            return self._tags[-1]
+        pos = bisect.bisect_left(self._keys, (scheme, (float('inf'), )))
+        if pos == 0 or self._keys[pos - 1][0] != scheme:
+            return None
+        return self._tags[pos - 1]
+
+    def predecessor(self, version, step=1):
+        """
+        获取指定版本之前的版本（同一格式内比较）
+
+        @param {string} version - 版本号，可以是不存在的版本（例如d20180620代表该日期之前的版本）
+        @param {int} step=1 - 往前的版本数
+
+        @returns {string} - 之前的版本号，不存在返回None
+        """
+        key = FCMMVersionIndex.parse_version(version)
+        if key is None:
+            return None
+        pos = bisect.bisect_left(self._keys, key) - step
+        if pos < 0 or self._keys[pos][0] != key[0]:
+            return None
+        return self._tags[pos]
+
+    def between_dates(self, start_date, end_date):
+        """
+        获取两个日期之间（含）的日期格式版本
+
+        @param {string} start_date - 开始日期，格式为YYYYMMDD
+        @param {string} end_date - 结束日期，格式为YYYYMMDD
+
+        @returns {string[]} - 版本号清单（从旧到新）
+        """
+        start_pos = bisect.bisect_left(self._keys, ('d', (int(start_date), )))
+        end_pos = bisect.bisect_left(self._keys, ('d', (int(end_date) + 1, )))
+        return self._tags[start_pos:end_pos]
+
+    def resolve(self, selector):
+        """
+        将版本选择器解析为实际的版本号
+
+        @param {string} selector - 版本选择器，支持：
+            latest - 最新版本（同时存在两种格式的版本号时无法匹配）
+            latest-v、latest-d - 指定格式的最新版本
+            版本号~N - 版本号之前的第N个版本，N默认为1，例如v1.0.1~、d20180620~2
+            其他 - 原样返回
+
+        @returns {string} - 版本号，选择器无法匹配返回None
+        """
+        if selector == 'latest':
+            return self.latest()
+        if selector in ('latest-v', 'latest-d'):
+            return self.latest(selector[-1])
+        match = FCMMVersionIndex._selector_re.match(selector)
+        if match is not None and FCMMVersionIndex.parse_version(match.group(1)) is not None:
+            return self.predecessor(match.group(1), int(match.group(2) or 1))
+        return selector
+
+
+if __name__ == '__main__':
+    # 当程序自己独立运行时执行的操作
+    # 打印版本信息
+    print(('模块名：%s  -  %s\n'
+           '作者：%s\n'
+           '发布日期：%s\n'
+           '版本：%s' % (__MOUDLE__, __DESCRIPT__, __AUTHOR__, __PUBLISH__, __VERSION__)))
@@ -84,7 +84,7 @@ class TestFcmm(unittest.TestCase):
         # 清空文件夹
         subprocess.run('git rm * -r', shell=True)
         repo_info = fcmm_git_cmd.FcmmGitCmd.get_repo_info(repo_dir)
-        if repo_info['repo'].is_dirty():
+        if repo_info.repo.is_dirty():
             # 有修改，要提交及上传
             self.assertTrue(
                 subprocess.run(
@@ -121,7 +121,7 @@ class TestFcmm(unittest.TestCase):
         # 分支信息
         repo_info = fcmm_git_cmd.FcmmGitCmd.get_repo_info(local_repo_path)
         has_pkg = False
-        for branch in repo_info['repo'].branches:
+        for branch in repo_info.repo.branches:
             if branch.name == 'lb-pkg':
                 has_pkg = True
                 break
@@ -150,7 +150,7 @@ class TestFcmm(unittest.TestCase):
         # 分支信息
         repo_info = fcmm_git_cmd.FcmmGitCmd.get_repo_info(local_repo_path)
         has_pkg = False
-        for branch in repo_info['repo'].branches:
+        for branch in repo_info.repo.branches:
             if branch.name == 'lb-pkg':
                 has_pkg = True
                 break
@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+import unittest
+import sys
+import os
+import json
+import io
+import shutil
+import contextlib
+import subprocess
+sys.path.append('../fcmm4git/')
+import fcmm
+from fcmm_tools import FCMMTools
+from fcmm_git_cmd import FCMMGitCmd
+from fcmm_git_tools import FCMMGitTools
+from fcmm_api import FCMMApi
+from snakerlib.generic import FileTools, RunTools
+
+
+__MOUDLE__ = 'test_fcmm_git_budget'  # 模块名
+__DESCRIPT__ = 'FCMM命令git操作预算测试'  # 模块描述
+__VERSION__ = '0.1.0'  # 版本
+__AUTHOR__ = '黎慧剑'  # 作者
+__PUBLISH__ = '2018.07.19'  # 发布日期
+
+
+# 临时测试目录
+TEST_PATH = os.path.realpath('./temptest/') + '/'
+
+# 各命令的git操作预算，超过预算则测试失败
+#   spawn - 直接启动的git进程数（不含git内部启动的子进程）
+#   fetch - 与远程仓库交互获取信息的次数（fetch/clone/ls-remote，含pull内部的fetch及从镜像缓存的本地克隆）
+#   push - 推送次数
+#   checkout - 切换工作目录的次数（checkout/switch）
+GIT_BUDGET = {
+    'init': {'spawn': 16, 'fetch': 2, 'push': 2, 'checkout': 6},
+    'add-dev': {'spawn': 7, 'fetch': 1, 'push': 1, 'checkout': 0},
+    'add-temp': {'spawn': 7, 'fetch': 1, 'push': 1, 'checkout': 0},
+    'add-temp-bare': {'spawn': 9, 'fetch': 1, 'push': 1, 'checkout': 0},
+    'add-pkg': {'spawn': 10, 'fetch': 1, 'push': 2, 'checkout': 1},
+    'release': {'spawn': 12, 'fetch': 2, 'push': 1, 'checkout': 0},
+    'diff': {'spawn': 8, 'fetch': 1, 'push': 0, 'checkout': 0},
+    'check': {'spawn': 6, 'fetch': 1, 'push': 0, 'checkout': 0},
+    'check-all': {'spawn': 9, 'fetch': 2, 'push': 0, 'checkout': 0},
+    'merge': {'spawn': 8, 'fetch': 2, 'push': 1, 'checkout': 0},
+    # 来源lb-pkg已被他人修改，通用初始化同步本地lb-pkg时多一次获取
+    'merge-ff': {'spawn': 11, 'fetch': 3, 'push': 1, 'checkout': 0},
+    'merge-3way': {'spawn': 14, 'fetch': 3, 'push': 1, 'checkout': 0},
+    'status': {'spawn': 16, 'fetch': 0, 'push': 0, 'checkout': 0}
+}
+
+
+class TestFcmmGitBudget(unittest.TestCase):
+    """
+    FCMM命令git操作预算测试类
+    通过本地file://裸仓库作为远程仓库执行各命令，利用GIT_TRACE2_EVENT统计git的操作次数
+    """
+
+    def setUp(self):
+        """
+        启动测试执行的初始化
+        """
+        self.current_path = os.path.realpath('')
+        if os.path.exists(TEST_PATH):
+            FileTools.remove_dir(TEST_PATH)
+
+        FileTools.create_dir(TEST_PATH)
+
+        shutil.copyfile('../fcmm4git/fcmm.json', 'fcmm.json')
+
+        fcmm.fcmm_init()
+
+        # 提交需要的用户信息
+        for _key in ('GIT_AUTHOR_NAME', 'GIT_COMMITTER_NAME'):
+            os.environ[_key] = 'fcmm4git'
+        for _key in ('GIT_AUTHOR_EMAIL', 'GIT_COMMITTER_EMAIL'):
+            os.environ[_key] = 'fcmm4git@test'
+
+        # 建立本地的远程裸仓库
+        self.remote_url = 'file://' + TEST_PATH.replace('\\', '/') + 'remote.git'
+        subprocess.run('git init -q --bare -b master %sremote.git' % (TEST_PATH), shell=True)
+        self.local_path = TEST_PATH + 'local/'
+        FileTools.create_dir(self.local_path)
+        with open(self.local_path + 'readme.md', 'w', encoding='utf-8') as f:
+            f.write('fcmm4git git budget test')
+        return
+
+    def tearDown(self):
+        """
+        结束测试执行的销毁
+        """
+        os.environ.pop('GIT_TRACE2_EVENT', None)
+        os.chdir(self.current_path)
+        FileTools.remove_dir(TEST_PATH)
+        FileTools.remove_file('fcmm.json')
+        return
+
+    def run_with_budget(self, budget_name, cmd, cmd_para, expected_code=0):
+        """
+        执行命令并检查git操作是否超出预算
+
+        @param {string} budget_name - 预算名
+        @param {string} cmd - 要执行的命令
+        @param {string} cmd_para - 命令参数
+        @param {int} expected_code=0 - 命令预期的返回码
+
+        @returns {dict} - git操作次数，key为spawn/fetch/push/checkout
+        """
+        trace_file = TEST_PATH + 'trace.%s.json' % (budget_name)
+        os.environ['GIT_TRACE2_EVENT'] = trace_file
+        try:
+            res = FCMMGitCmd.main_cmd_fun(cmd=cmd, cmd_para=cmd_para, work_dir=self.local_path)
+        finally:
+            os.environ.pop('GIT_TRACE2_EVENT', None)
+        self.assertEqual(os.getcwd(), self.current_path, '命令不改变进程的当前目录')
+        self.assertEqual(res[0], expected_code, '%s返回码不符合预期: %s' % (budget_name, res[1]))
+
+        counts = {'spawn': 0, 'fetch': 0, 'push': 0, 'checkout': 0}
+        if os.path.exists(trace_file):
+            with open(trace_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    event = json.loads(line)
+                    if event['event'] == 'start' and '/' not in event['sid']:
+                        counts['spawn'] += 1
+                    elif event['event'] == 'cmd_name':
+                        if event['name'] in ('fetch', 'clone', 'ls-remote'):
+                            counts['fetch'] += 1
+                        elif event['name'] == 'push':
+                            counts['push'] += 1
+                        elif event['name'] in ('checkout', 'switch'):
+                            counts['checkout'] += 1
+
+        print('git operations of %s: %s' % (budget_name, str(counts)))
+        for _key, _value in GIT_BUDGET[budget_name].items():
+            self.assertLessEqual(
+                counts[_key], _value,
+                '%s超出git操作预算: %s = %d > %d' % (budget_name, _key, counts[_key], _value)
+            )
+        return counts
+
+    def run_git(self, cmd_str, cwd):
+        """
+        在指定目录执行git命令并返回标准输出
+
+        @param {string} cmd_str - 要执行的命令
+        @param {string} cwd - 命令执行的目录
+
+        @returns {string} - 命令的标准输出（去除首尾空白）
+        """
+        complete_info = subprocess.run(cmd_str, shell=True, cwd=cwd, stdout=subprocess.PIPE)
+        return complete_info.stdout.decode(errors='replace').strip()
+
+    def push_from_other_clone(self, branch_name, file_name=None, text=''):
+        """
+        通过另一个本地克隆在远程分支上新增一个提交（模拟其他人修改远程仓库）
+
+        @param {string} branch_name - 远程分支名
+        @param {string} file_name=None - 要写入的文件名，不传入代表提交空的修改
+        @param {string} text='' - 写入文件的内容
+
+        @returns {string} - 新提交的commit id
+        """
+        other_path = TEST_PATH + 'other'
+        if not os.path.exists(other_path):
+            self.run_git('git clone -q %s other' % (self.remote_url), TEST_PATH)
+        self.run_git('git fetch -q origin', other_path)
+        self.run_git('git checkout -q -B %s origin/%s' % (branch_name, branch_name), other_path)
+        if file_name is not None:
+            with open(os.path.join(other_path, file_name), 'w', encoding='utf-8') as f:
+                f.write(text)
+            self.run_git('git add -A', other_path)
+        self.run_git('git commit -q --allow-empty -m "other change on %s"' % (branch_name),
+                     other_path)
+        self.run_git('git push -q origin %s' % (branch_name), other_path)
+        return self.run_git('git rev-parse HEAD', other_path)
+
+    def test_git_budget(self):
+        """
+        测试各命令的git操作预算
+        """
+        self.run_with_budget('init', 'init', '-b local -url %s -v v0.0.1 -f' % (self.remote_url))
+        self.run_with_budget('add-dev', 'add-dev', '-n budget01 -t req')
+        self.run_with_budget('add-temp', 'add-temp', '-n budget')
+        self.run_with_budget('add-temp-bare', 'add-temp', '-n budget-bare -b')
+        self.run_with_budget('check', 'check', '-n tb-req-budget01')
+        # -b创建的空白临时分支tb-dev-budget-bare不是基于最新版本，check -all返回1
+        self.run_with_budget('check-all', 'check', '-all', expected_code=1)
+        res = FCMMGitCmd.main_cmd_fun(cmd='check', cmd_para='-all -t nosuchcommit',
+                                      work_dir=self.local_path)
+        self.assertEqual(res, [1, FCMMTools.get_i18n_tips(
+            RunTools.get_global_var('config'), 'commit_not_exists', 'nosuchcommit')], '校验commit标签')
+        self.run_with_budget('merge', 'merge', '-d tb-req-budget01')
+        self.run_with_budget('add-pkg', 'add-pkg', '-f')
+        self.run_with_budget('release', 'release', '-v v0.0.2')
+        self.run_with_budget('diff', 'diff', '-f v0.0.1 -t v0.0.2')
+        self.run_with_budget('status', 'status', '')
+
+    def test_merge(self):
+        """
+        merge：快进、三方合并及冲突，均不修改本地工作目录
+        """
+        self.run_with_budget('init', 'init', '-b local -url %s -v v0.0.1 -f' % (self.remote_url))
+        self.run_with_budget('add-dev', 'add-dev', '-n merge01 -t req')
+        head = self.run_git('git rev-parse HEAD', self.local_path)
+
+        def get_remote_commit(branch_name):
+            return self.run_git('git ls-remote origin refs/heads/%s' % (branch_name),
+                                self.local_path).split()[0]
+
+        def assert_worktree_untouched(desc):
+            self.assertEqual(self.run_git('git rev-parse HEAD', self.local_path), head,
+                             '%s不切换分支' % (desc))
+            self.assertEqual(self.run_git('git status --porcelain', self.local_path), '',
+                             '%s不修改工作目录' % (desc))
+
+        # 来源分支前进，目标分支可以快进
+        pkg_commit = self.push_from_other_clone('lb-pkg', 'pkg.txt', 'pkg\n')
+        self.run_with_budget('merge-ff', 'merge', '-d tb-req-merge01')
+        self.assertEqual(get_remote_commit('tb-req-merge01'), pkg_commit, '快进到来源分支')
+        assert_worktree_untouched('快进')
+
+        # 两个分支都有修改，三方合并生成合并提交
+        dev_commit = self.push_from_other_clone('tb-req-merge01', 'dev.txt', 'dev\n')
+        pkg_commit = self.push_from_other_clone('lb-pkg', 'pkg.txt', 'pkg\npkg2\n')
+        self.run_with_budget('merge-3way', 'merge', '-d tb-req-merge01')
+        merge_commit = get_remote_commit('tb-req-merge01')
+        self.run_git('git fetch -q origin', self.local_path)
+        self.assertEqual(self.run_git('git rev-parse %s^@' % (merge_commit), self.local_path).split(),
+                         [dev_commit, pkg_commit], '合并提交的父提交')
+        self.assertEqual(self.run_git('git show %s:pkg.txt' % (merge_commit), self.local_path),
+                         'pkg\npkg2', '合并结果包含来源分支的修改')
+        self.assertEqual(self.run_git('git show %s:dev.txt' % (merge_commit), self.local_path),
+                         'dev', '合并结果包含目标分支的修改')
+        assert_worktree_untouched('三方合并')
+
+        # 同一文件修改冲突，只报告冲突文件，不推送
+        self.push_from_other_clone('tb-req-merge01', 'pkg.txt', 'dev change\n')
+        self.push_from_other_clone('lb-pkg', 'pkg.txt', 'pkg change\n')
+        dest_commit = get_remote_commit('tb-req-merge01')
+        res = FCMMGitCmd.main_cmd_fun(cmd='merge', cmd_para='-d tb-req-merge01',
+                                      work_dir=self.local_path)
+        self.assertEqual(res[0], 1, '存在冲突时返回失败')
+        self.assertIn('pkg.txt', res[1], '报告冲突文件')
+        self.assertEqual(get_remote_commit('tb-req-merge01'), dest_commit, '冲突时不推送')
+        assert_worktree_untouched('冲突')
+
+    def test_rewritten_remote_branch(self):
+        """
+        远程分支被改写（非快进）后更新本地的非当前分支：没有未推送的提交时直接更新，否则提示分叉
+        """
+        self.run_with_budget('init', 'init', '-b local -url %s -v v0.0.1 -f' % (self.remote_url))
+        self.run_with_budget('add-dev', 'add-dev', '-n rewrite01 -t req')
+        other_path = TEST_PATH + 'other'
+        self.run_git('git clone -q %s other' % (self.remote_url), TEST_PATH)
+
+        def rewrite_remote_branch(message):
+            self.run_git('git checkout -q -B tb-req-rewrite01 origin/lb-pkg', other_path)
+            self.run_git('git commit -q --allow-empty -m "%s"' % (message), other_path)
+            self.run_git('git push -q -f origin tb-req-rewrite01', other_path)
+            return self.run_git('git rev-parse HEAD', other_path)
+
+        self.push_from_other_clone('tb-req-rewrite01')
+        FCMMGitCmd.main_cmd_fun(cmd='check', cmd_para='-n tb-req-rewrite01', work_dir=self.local_path)
+        new_commit = rewrite_remote_branch('rewrite 1')
+        res = FCMMGitCmd.main_cmd_fun(cmd='check', cmd_para='-n tb-req-rewrite01',
+                                      work_dir=self.local_path)
+        self.assertEqual(res[0], 0, '远程分支被改写后检查: %s' % (res[1]))
+        self.assertEqual(self.run_git('git rev-parse tb-req-rewrite01', self.local_path), new_commit,
+                         '本地分支更新为改写后的远程版本')
+
+        # 本地分支有未推送的提交，不覆盖
+        local_commit = self.run_git(
+            'git commit-tree tb-req-rewrite01^{tree} -p tb-req-rewrite01 -m "local"', self.local_path)
+        self.run_git('git update-ref refs/heads/tb-req-rewrite01 %s' % (local_commit), self.local_path)
+        rewrite_remote_branch('rewrite 2')
+        res = FCMMGitCmd.main_cmd_fun(cmd='check', cmd_para='-n tb-req-rewrite01',
+                                      work_dir=self.local_path)
+        self.assertNotEqual(res[0], 0, '本地分支有未推送的提交时返回失败')
+        self.assertEqual(res[1], FCMMTools.get_i18n_tips(
+            RunTools.get_global_var('config'), 'local_branch_diverged', 'tb-req-rewrite01'), '分叉提示')
+        self.assertEqual(self.run_git('git rev-parse tb-req-rewrite01', self.local_path), local_commit,
+                         '不覆盖本地的提交')
+
+    def test_release_move_pkg(self):
+        """
+        master前进后定版发布：标签、lb-pkg及其备份分支通过一次推送提交
+        """
+        self.run_with_budget('init', 'init', '-b local -url %s -v v0.0.1 -f' % (self.remote_url))
+        old_pkg = self.run_git('git ls-remote origin refs/heads/lb-pkg', self.local_path).split()[0]
+        master_commit = self.push_from_other_clone('master')
+        self.assertNotEqual(old_pkg, master_commit, 'master已前进')
+
+        counts = self.run_with_budget('release', 'release', '-v v0.0.2')
+        self.assertEqual(counts['push'], 1, '只推送一次')
+        remote_refs = dict()
+        for _line in self.run_git('git ls-remote origin', self.local_path).splitlines():
+            _commit, _ref = _line.split('\t')
+            remote_refs[_ref] = _commit
+        self.assertEqual(remote_refs['refs/tags/v0.0.2^{}'], master_commit, '标签指向master')
+        self.assertEqual(remote_refs['refs/heads/lb-pkg'], master_commit, 'lb-pkg移动到master')
+        backup_list = [_ref for _ref in remote_refs.keys()
+                       if _ref.startswith('refs/heads/tb-bak-lb-pkg-')]
+        self.assertEqual(len(backup_list), 1, '备份原lb-pkg')
+        self.assertEqual(remote_refs[backup_list[0]], old_pkg, '备份分支指向原lb-pkg')
+
+    def test_release_lease_rejected(self):
+        """
+        获取快照后远程lb-pkg被他人修改：推送被拒绝，本地创建的标签及备份分支被删除
+        """
+        self.run_with_budget('init', 'init', '-b local -url %s -v v0.0.1 -f' % (self.remote_url))
+        self.push_from_other_clone('master')
+        # 只读命令获取的快照在有效期内被release复用
+        RunTools.get_global_var('config')['remote_refs_ttl'] = '600'
+        res = FCMMGitCmd.main_cmd_fun(cmd='check', cmd_para='-n master', work_dir=self.local_path)
+        self.assertEqual(res[0], 0, 'check执行失败: %s' % (res[1]))
+        other_pkg = self.push_from_other_clone('lb-pkg')
+
+        res = FCMMGitCmd.main_cmd_fun(cmd='release', cmd_para='-v v0.0.2', work_dir=self.local_path)
+        self.assertNotEqual(res[0], 0, '远程lb-pkg已修改，推送被拒绝')
+        self.assertEqual(self.run_git('git tag -l v0.0.2', self.local_path), '', '删除本地标签')
+        self.assertEqual(self.run_git('git branch --list "tb-bak-lb-pkg-*"', self.local_path), '',
+                         '删除本地备份分支')
+        self.assertEqual(self.run_git('git ls-remote origin refs/tags/v0.0.2', self.local_path), '',
+                         '远程未创建标签')
+        self.assertEqual(
+            self.run_git('git ls-remote origin refs/heads/lb-pkg', self.local_path).split()[0],
+            other_pkg, '远程lb-pkg保持他人的修改')
+        self.assertEqual(
+            self.run_git('git ls-remote origin "refs/heads/tb-bak-lb-pkg-*"', self.local_path), '',
+            '远程未创建备份分支')
+
+    def test_init_large_file(self):
+        """
+        init -l lfs：大的二进制文件以指针提交，并登记到.fcmm4git
+        """
+        config = RunTools.get_global_var('config')
+        config['large_file']['max_size'] = '0.001'
+        config['large_file']['store_path'] = TEST_PATH + 'lfs-store'
+        with open(self.local_path + 'large.bin', 'wb') as f:
+            f.write(b'\0\1' * 2000)
+
+        res = FCMMGitCmd.main_cmd_fun(
+            cmd='init', cmd_para='-b local -url %s -v v0.0.1 -f -l lfs' % (self.remote_url),
+            work_dir=self.local_path)
+        self.assertEqual(res[0], 0, 'init执行失败: %s' % (res[1]))
+        remote_path = TEST_PATH + 'remote.git'
+        pointer = self.run_git('git show master:large.bin', remote_path)
+        self.assertTrue(pointer.startswith('version https://git-lfs.github.com/spec/v1'),
+                        '远程仓库中为指针文件')
+        self.assertIn('size 4000', pointer, '指针登记的文件大小')
+        fcmm_config = json.loads(self.run_git('git show master:.fcmm4git', remote_path))
+        self.assertEqual(fcmm_config['large_file']['action'], 'lfs', '登记处理方式')
+        self.assertListEqual(fcmm_config['large_file']['files'], ['large.bin'], '登记以指针提交的文件')
+        self.assertEqual(self.run_git('git ls-files -v large.bin', self.local_path), 'S large.bin',
+                         '工作目录的原文件设置skip-worktree')
+        with open(self.local_path + 'large.bin', 'rb') as f:
+            self.assertEqual(f.read(), b'\0\1' * 2000, '工作目录保留原文件')
+
+    def test_prefetch(self):
+        """
+        后台预获取：只获取FCMM分支，生效前不修改远程跟踪分支
+        """
+        res = FCMMGitCmd.main_cmd_fun(
+            cmd='init', cmd_para='-b local -url %s -v v0.0.1 -f' % (self.remote_url),
+            work_dir=self.local_path)
+        self.assertEqual(res[0], 0, 'init执行失败: %s' % (res[1]))
+        dev_commit = self.push_from_other_clone('master')
+        other_path = TEST_PATH + 'other'
+        self.run_git('git push -q origin HEAD:refs/heads/tb-dev-prefetch HEAD:refs/heads/feature',
+                     other_path)
+        self.run_git('git tag v0.0.2 && git push -q origin v0.0.2', other_path)
+
+        snapshot = FCMMGitTools.prefetch_remote(self.local_path)
+        self.assertIsNotNone(snapshot, '预获取')
+        self.assertEqual(snapshot['heads']['tb-dev-prefetch'], dev_commit, '预获取的快照')
+        self.assertEqual(
+            self.run_git('git rev-parse refs/fcmm-prefetch/heads/tb-dev-prefetch', self.local_path),
+            dev_commit, '获取到预获取命名空间')
+        self.assertEqual(self.run_git('git for-each-ref refs/fcmm-prefetch/heads/feature',
+                                      self.local_path), '', '不获取非FCMM分支')
+        self.assertEqual(
+            self.run_git('git for-each-ref refs/remotes/origin/tb-dev-prefetch refs/tags/v0.0.2',
+                         self.local_path), '', '生效前不修改远程跟踪分支及标签')
+
+        self.assertTrue(FCMMGitTools.apply_prefetch(self.local_path, snapshot), '预获取生效')
+        self.assertEqual(
+            self.run_git('git rev-parse origin/tb-dev-prefetch origin/master v0.0.2^{commit}',
+                         self.local_path).split(), [dev_commit] * 3, '更新远程跟踪分支及补充标签')
+        self.assertIs(FCMMGitTools.get_repo_info(self.local_path).remote_ref_snapshot, snapshot,
+                      '替换远程仓库快照')
+
+    def test_remote_refs_fail(self):
+        """
+        无法获取远程仓库快照时不按分支不存在处理
+        """
+        res = FCMMGitCmd.main_cmd_fun(
+            cmd='init', cmd_para='-b local -url %s -v v0.0.1 -f' % (self.remote_url),
+            work_dir=self.local_path)
+        self.assertEqual(res[0], 0, 'init执行失败: %s' % (res[1]))
+        self.run_git('git remote set-url origin "file://%snot-exists.git"' % (TEST_PATH),
+                     self.local_path)
+        config = RunTools.get_global_var('config')
+        for _cmd, _para in (('add-dev', '-n fail01 -t req'), ('add-temp', '-n fail02'),
+                            ('merge', '-d tb-req-fail01')):
+            res = FCMMGitCmd.main_cmd_fun(cmd=_cmd, cmd_para=_para, work_dir=self.local_path)
+            self.assertListEqual(res, [1, config['i18n_tips']['remote_refs_fail']],
+                                 '%s获取远程快照失败' % (_cmd))
+        self.assertIsNone(
+            FCMMGitTools.check_remote_branch_exists(
+                FCMMGitTools.get_repo_info(self.local_path), 'master'),
+            '无法判断分支是否存在')
+
+    def test_api(self):
+        """
+        测试嵌入调用接口的结构化结果
+        """
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            res = FCMMApi.init(self.remote_url, version='v0.0.1', force=True,
+                               work_dir=self.local_path)
+            self.assertTrue(res.success, 'init执行失败: %s' % (res.msg))
+            self.assertTrue('refs/heads/master' in res.refs_changed.keys(), 'init引用变化')
+            self.assertEqual(res.refs_changed['refs/heads/master'][0], None, 'init新增master')
+            self.assertTrue(res.timings['total'] > 0, 'init耗时')
+
+            res = FCMMApi.add_dev('api01', 'req', work_dir=self.local_path)
+            self.assertTrue(res.success, 'add-dev执行失败: %s' % (res.msg))
+            old_sha, new_sha = res.refs_changed['refs/heads/tb-req-api01']
+            self.assertEqual(old_sha, None, 'add-dev新增分支')
+            self.assertEqual(res.refs_changed['refs/remotes/origin/tb-req-api01'][1], new_sha,
+                             'add-dev推送分支')
+            self.assertEqual(res.push_count, 1, 'add-dev推送次数')
+
+            res = FCMMApi.add_dev('api01', 'req', force=True, work_dir=self.local_path)
+            self.assertTrue(res.success, 'add-dev -f执行失败: %s' % (res.msg))
+            self.assertEqual(len(res.backups), 1, 'add-dev -f备份分支')
+            self.assertTrue(res.backups[0].startswith('tb-bak-tb-req-api01-'), 'add-dev -f备份分支')
+
+            res = FCMMApi.add_dev('api01', 'req', work_dir=self.local_path)
+            self.assertFalse(res.success, '分支已存在')
+            self.assertEqual(len(res.refs_changed), 0, '失败时引用无变化')
+
+            res = FCMMApi.add_cfg('sit', bare=True, work_dir=self.local_path)
+            self.assertTrue(res.success, 'add-cfg执行失败: %s' % (res.msg))
+            bare_sha = res.refs_changed['refs/heads/lb-cfg-sit'][1]
+            self.assertEqual(self.run_git('git ls-tree %s' % (bare_sha), self.local_path), '',
+                             'add-cfg -b创建空白分支')
+            res = FCMMApi.add_cfg('uat', clone='sit', work_dir=self.local_path)
+            self.assertTrue(res.success, 'add-cfg -c执行失败: %s' % (res.msg))
+            self.assertEqual(res.refs_changed['refs/heads/lb-cfg-uat'][1], bare_sha,
+                             'add-cfg -c复制配置分支')
+            res = FCMMApi.add_cfg('dev', work_dir=self.local_path)
+            self.assertFalse(res.success, 'add-cfg必须指定-b或-c')
+            self.assertEqual(self.run_git('git rev-parse --abbrev-ref HEAD', self.local_path),
+                             'master', 'add-cfg不切换分支')
+
+            res = FCMMApi.check(all_branch=True, work_dir=self.local_path)
+            self.assertTrue(res.success, 'check -all执行失败: %s' % (res.msg))
+            self.assertTrue('tb-req-api01' in res.msg, 'check -all结果')
+
+            res = FCMMApi.release('v0.0.2', work_dir=self.local_path)
+            self.assertTrue(res.success, 'release执行失败: %s' % (res.msg))
+            self.assertEqual(res.push_count, 1, 'release推送次数')
+            self.assertTrue('refs/tags/v0.0.2' in res.refs_changed.keys(), 'release创建标签')
+
+            res = FCMMApi.release('v0.0.1', work_dir=self.local_path)
+            self.assertFalse(res.success, '版本号不大于最新版本')
+        self.assertEqual(output.getvalue(), '', '嵌入调用不打印信息')
+        self.assertEqual(os.getcwd(), self.current_path, '命令不改变进程的当前目录')
+
+
+if __name__ == '__main__':
+    # 当程序自己独立运行时执行的操作
+    # 打印版本信息
+    print(('模块名：%s  -  %s\n'
+           '作者：%s\n'
+           '发布日期：%s\n'
+           '版本：%s' % (__MOUDLE__, __DESCRIPT__, __AUTHOR__, __PUBLISH__, __VERSION__)))
+
+    unittest.main()
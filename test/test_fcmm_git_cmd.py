@@ -5,11 +5,26 @@ import unittest
 import sys
 import os
 import shutil
+import time
+import tarfile
 sys.path.append('../fcmm4git/')
 import fcmm
+from fcmm_git_cmd import FCMMGitCmd
 from fcmm_git_tools import FCMMGitTools
 from fcmm_tools import FCMMTools
-from snakerlib.generic import FileTools
+from fcmm_version_index import FCMMVersionIndex
+from fcmm_ref_index import FCMMRefIndex, FCMMRefCompleter
+from fcmm_lock import FCMMRepoLock
+from fcmm_copier import FCMMCopier
+from fcmm_metrics import FCMMMetrics
+from fcmm_profiler import FCMMProfiler
+from fcmm_repo_session import RepoSession
+from fcmm_maintain import FCMMMaintain
+from fcmm_diff_cache import FCMMDiffCache
+from fcmm_large_file import FCMMLargeFile
+from fcmm_shared_store import FCMMSharedStore
+from fcmm_mirror_cache import FCMMMirrorCache
+from snakerlib.generic import FileTools, RunTools
 
 
 __MOUDLE__ = 'test_fcmm_git_cmd'  # 模块名
@@ -69,6 +84,16 @@ class TestFcmmGitCmd(unittest.TestCase):
         get_json_obj = FCMMTools.get_fcmm_config(TEST_PATH + 'json_file/')
 
         self.assertDictEqual(json_obj, get_json_obj, 'JSON文件处理失败')
+
+        # 原子写入：覆盖原文件，不残留临时文件
+        json_obj['key_1'] = 'value1_new'
+        FCMMTools.save_to_json_file(TEST_PATH + 'json_file/.fcmm4git', json_obj, atomic=True)
+        get_json_obj = FCMMTools.get_fcmm_config(TEST_PATH + 'json_file/')
+        self.assertDictEqual(json_obj, get_json_obj, 'JSON文件原子写入失败')
+        self.assertListEqual(os.listdir(TEST_PATH + 'json_file/'), ['.fcmm4git'], '原子写入残留临时文件')
+        self.assertNotEqual(
+            FCMMTools.get_temp_file_name('a.json'), FCMMTools.get_temp_file_name('a.json'),
+            '临时文件名重复')
         return
 
     def test_split_cmd_para(self):
@@ -138,6 +163,561 @@ class TestFcmmGitCmd(unittest.TestCase):
         print('测试参数校验通过:' + ret[1])
         self.assertTrue(ret[0] == 0, '测试参数校验通过失败：%s' % ('-v'))
 
+    def test_version_index(self):
+        """
+        FCMMVersionIndex
+        """
+        index = FCMMVersionIndex([
+            'v1.0.10', 'v1.0.2', 'v1.0', 'd20180620-1', 'd20180620-2', 'd20180701', 'd20180615-3',
+            'not-version'
+        ])
+        self.assertEqual(len(index), 7, 'FCMMVersionIndex版本数量')
+        self.assertListEqual(
+            index.versions(),
+            ['d20180615-3', 'd20180620-1', 'd20180620-2', 'd20180701', 'v1.0', 'v1.0.2', 'v1.0.10'],
+            'FCMMVersionIndex版本排序'
+        )
+        self.assertIsNone(index.latest(), 'FCMMVersionIndex.latest两种格式同时存在')
+        self.assertEqual(index.latest('v'), 'v1.0.10', 'FCMMVersionIndex.latest(v)')
+        self.assertEqual(index.latest('d'), 'd20180701', 'FCMMVersionIndex.latest(d)')
+        self.assertEqual(FCMMVersionIndex(['v1.0', 'v1.1']).latest(), 'v1.1', 'FCMMVersionIndex.latest单一格式')
+        self.assertIsNone(FCMMVersionIndex([]).latest(), 'FCMMVersionIndex.latest无版本')
+        self.assertEqual(index.predecessor('v1.0.10'), 'v1.0.2', 'FCMMVersionIndex.predecessor')
+        self.assertIsNone(index.predecessor('v1.0'), 'FCMMVersionIndex.predecessor不跨格式')
+        self.assertListEqual(
+            index.between_dates('20180620', '20180630'), ['d20180620-1', 'd20180620-2'],
+            'FCMMVersionIndex.between_dates'
+        )
+        self.assertIsNone(index.resolve('latest'), 'resolve latest两种格式同时存在')
+        self.assertEqual(index.resolve('latest-v'), 'v1.0.10', 'resolve latest-v')
+        self.assertEqual(index.resolve('latest-d'), 'd20180701', 'resolve latest-d')
+        self.assertEqual(index.resolve('d20180620~'), 'd20180615-3', 'resolve d20180620~')
+        self.assertEqual(index.resolve('d20180701~2'), 'd20180620-1', 'resolve d20180701~2')
+        self.assertEqual(index.resolve('v1.0.2'), 'v1.0.2', 'resolve原样返回')
+
+    def test_ref_index(self):
+        """
+        FCMMRefIndex
+        """
+        index = FCMMRefIndex()
+        index.update('branch', ['master', 'lb-pkg', 'tb-req-a', 'tb-fix-b'])
+        names = index.names('branch')
+        self.assertTupleEqual(names, ('lb-pkg', 'master', 'tb-fix-b', 'tb-req-a'), 'FCMMRefIndex排序')
+        self.assertListEqual(index.complete('branch', 'tb-'), ['tb-fix-b', 'tb-req-a'], 'complete')
+        self.assertListEqual(index.complete('branch', 'x'), [], 'complete无匹配')
+
+        # 大量引用的增量更新及查询性能
+        index.update('branch', ['tb-req-%05d' % _i for _i in range(50000)])
+        index.update('branch', ['tb-req-%05d' % _i for _i in range(1, 50000)] + ['tb-req-new'])
+        self.assertEqual(len(names), 4, '更新时不修改已发布的数组')
+        self.assertEqual(len(index.names('branch')), 50000, '更新数量')
+        self.assertListEqual(
+            index.complete('branch', 'tb-req-0000'), ['tb-req-%05d' % _i for _i in range(1, 10)],
+            'complete增量更新后'
+        )
+        start = time.perf_counter()
+        for _i in range(1000):
+            index.complete('branch', 'tb-req-1', limit=50)
+        self.assertLess((time.perf_counter() - start) / 1000, 0.001, 'complete超过1ms')
+
+        # 命令交互模式的自动完成
+        config = {
+            'cmd_para': {
+                'add-dev': {'long_para': {'name': [], 'type': ['req', 'fix', 'feat']}},
+                'merge': {'long_para': {'source': [], 'force': 'None'}},
+                'status': {'long_para': {'refresh': 'None'}}
+            },
+            'ref_complete_para': {'branch': ['name', 'source']},
+            'ref_complete_skip': {'add-dev': ['name']}
+        }
+        ref_para = FCMMRefCompleter.get_ref_para(config)
+        self.assertDictEqual(ref_para, {'merge': {'source': 'branch'}}, '按引用名补全的参数')
+        completer = FCMMRefCompleter(config['cmd_para'], ref_para, index, limit=3)
+        self.assertListEqual(completer.get_candidates(['m']), ['merge'], '补全命令')
+        self.assertListEqual(completer.get_candidates(['merge', '-f']), ['-force'], '补全参数名')
+        self.assertListEqual(completer.get_candidates(['merge', '-source', 'tb-req-0000']),
+                             ['tb-req-00001', 'tb-req-00002', 'tb-req-00003'], '补全分支名')
+        self.assertListEqual(completer.get_candidates(['add-dev', '-name', 'tb']), [],
+                             '标识名不补全分支名')
+        self.assertListEqual(completer.get_candidates(['add-dev', '-type', 'f']), ['fix', 'feat'],
+                             '补全配置的候选值')
+
+    def test_repo_lock(self):
+        """
+        FCMMRepoLock
+        """
+        lock_path = TEST_PATH + 'locks'
+        with FCMMRepoLock(lock_path, TEST_PATH, shared=True):
+            if os.name != 'nt':
+                self.assertTrue(
+                    FCMMRepoLock(lock_path, TEST_PATH, shared=True, timeout=0).acquire(),
+                    '共享锁可以同时获取'
+                )
+            self.assertFalse(
+                FCMMRepoLock(lock_path, TEST_PATH, shared=False, timeout=0.2).acquire(),
+                '共享锁未释放时不能获取排他锁'
+            )
+        exclusive_lock = FCMMRepoLock(lock_path, TEST_PATH, shared=False, timeout=0)
+        self.assertTrue(exclusive_lock.acquire(), '锁释放后可以获取排他锁')
+        exclusive_lock.release()
+
+    def test_copier(self):
+        """
+        FCMMCopier
+        """
+        src_path = TEST_PATH + 'copy_src/'
+        dest_path = TEST_PATH + 'copy_dest/'
+        os.makedirs(src_path + '.git/objects')
+        os.makedirs(src_path + 'a/b')
+        with open(src_path + '.git/objects/obj', 'w') as f:
+            f.write('git object')
+        with open(src_path + 'a/b/big', 'wb') as f:
+            f.write(os.urandom(3 * 1024 * 1024))
+        with open(src_path + 'readme.md', 'w') as f:
+            f.write('fcmm4git copier test')
+        os.chmod(src_path + 'readme.md', 0o640)
+        os.utime(src_path + 'readme.md', (946684800, 946684800))
+
+        res = FCMMCopier.copy_all_with_path(src_path, dest_path, '^(?!\\.git$)', workers=4)
+        self.assertEqual(res[0], 0, 'FCMMCopier执行结果')
+        self.assertFalse(os.path.exists(dest_path + '.git'), '按正则表达式排除.git')
+        with open(src_path + 'a/b/big', 'rb') as f1, open(dest_path + 'a/b/big', 'rb') as f2:
+            self.assertEqual(f1.read(), f2.read(), '文件内容一致')
+        self.assertEqual(os.stat(dest_path + 'readme.md').st_mtime, 946684800, '保留修改时间')
+        if os.name != 'nt':
+            self.assertEqual(os.stat(dest_path + 'readme.md').st_mode & 0o777, 0o640, '保留权限')
+
+    def test_metrics(self):
+        """
+        FCMMMetrics
+        """
+        metrics_file = os.path.realpath(TEST_PATH) + '/fcmm.prom'
+        for _i in range(2):
+            FCMMMetrics.begin_run('add-dev')
+            FCMMMetrics.record_git('git push origin tb-req-a', 0.3)
+            FCMMMetrics.record_git('git -c core.untrackedCache=true fetch origin', 0.2)
+            FCMMMetrics.end_run(_i, metrics_file, TEST_PATH + 'locks')
+
+        state = FCMMMetrics.load_state(metrics_file)
+        self.assertEqual(state['duration']['add-dev']['count'], 2, '命令执行次数')
+        self.assertEqual(state['push']['add-dev']['sum'], 2, '推送次数')
+        self.assertAlmostEqual(state['phase']['add-dev\tsync']['sum'], 0.4, msg='sync阶段耗时')
+        self.assertEqual(state['runs']['add-dev\tfail'], 1, '失败次数')
+        self.assertAlmostEqual(
+            FCMMMetrics.percentile(state['phase']['add-dev\tpush'], FCMMMetrics.DURATION_BUCKETS, 0.95),
+            0.4875, msg='p95估算（分桶内线性插值）'
+        )
+        with open(metrics_file, 'r', encoding='utf-8') as f:
+            text = f.read()
+        self.assertIn('fcmm_phase_duration_seconds_count{command="add-dev",phase="push"} 2', text,
+                      'Prometheus文本')
+        self.assertIn('# TYPE fcmm_command_runs_total counter', text, '计数器按样本名声明类型')
+        self.assertNotIn('# UNIT', text, '不输出Prometheus不支持的UNIT')
+        self.assertNotIn('# EOF', text, '不输出Prometheus不支持的EOF')
+
+        # 等待仓库锁超时按失败记录
+        config = RunTools.get_global_var('config')
+        config['metrics']['enable'] = 'true'
+        config['metrics']['file'] = metrics_file
+        config['lock_timeout'] = '0'
+        work_dir = os.path.realpath(TEST_PATH)
+        with FCMMRepoLock(os.path.join(config['temp_path'], 'locks'), work_dir, shared=False):
+            res = FCMMGitCmd.main_cmd_fun(cmd='add-dev', cmd_para='-n a -t req', work_dir=work_dir)
+        self.assertEqual(res[0], 1, '等待仓库锁超时')
+        self.assertEqual(FCMMMetrics.load_state(metrics_file)['runs']['add-dev\tfail'], 2,
+                         '锁超时记录为失败')
+
+    def test_profiler(self):
+        """
+        FCMMProfiler
+        """
+        res, file_prefix = FCMMProfiler.run(
+            TEST_PATH + 'profile', 'split', FCMMTools.split_cmd_para, '-n tb-req-a -f')
+        self.assertDictEqual(res, {'-n': 'tb-req-a', '-f': ''}, '返回被分析函数的结果')
+        self.assertTrue(os.path.exists(file_prefix + '.pstats'), 'pstats文件')
+        with open(file_prefix + '.collapsed', 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        self.assertTrue(
+            any(['split_cmd_para' in _line.split(';')[0] for _line in lines]), '折叠栈以被分析函数为根')
+        for _line in lines:
+            self.assertTrue(_line.rsplit(' ', 1)[1].isdigit(), '折叠栈格式: %s' % (_line))
+
+    def test_repo_session(self):
+        """
+        RepoSession
+        """
+        repo_path = os.path.realpath(TEST_PATH + 'session_repo')
+        os.makedirs(repo_path)
+        self.assertIsNone(FCMMGitTools.get_repo_info(repo_path).repo, '非git仓库')
+        self.assertIsNone(RepoSession.get_cached(repo_path), '非git仓库不缓存会话')
+        FCMMTools.run_sys_cmd_list([
+            'git -C "%s" init -q -b master' % (repo_path),
+            'git -C "%s" commit -q --allow-empty -m "init"' % (repo_path)
+        ])
+        repo_info = FCMMGitTools.get_repo_info(repo_path)
+        try:
+            self.assertIs(FCMMGitTools.get_repo_info(repo_path + '/'), repo_info, '同一目录共用会话')
+            self.assertEqual(FCMMGitTools.get_active_branch(repo_info), 'master', '当前工作分支')
+            commit_id = FCMMGitTools.get_branch_commit(repo_info, 'master')
+            FCMMTools.run_sys_cmd('git -C "%s" branch tb-req-a' % (repo_path))
+            self.assertFalse(FCMMGitTools.check_branch_exists(repo_info, 'tb-req-a'), '失效前使用缓存')
+            repo_info.invalidate()
+            self.assertTrue(FCMMGitTools.check_branch_exists(repo_info, 'tb-req-a'), '失效后重新获取')
+            self.assertEqual(repo_info.get_branches()['tb-req-a'], commit_id, '分支的commit')
+            with self.assertRaises(AttributeError):
+                repo_info.other_info = ''
+        finally:
+            RepoSession.drop(repo_path)
+        self.assertIsNone(RepoSession.get_cached(repo_path), '删除会话缓存')
+
+    def test_maintain(self):
+        """
+        FCMMMaintain
+        """
+        repo_path = os.path.realpath(TEST_PATH + 'maintain_repo')
+        git_dir = repo_path + '/.git'
+        for _key in ('GIT_AUTHOR_NAME', 'GIT_COMMITTER_NAME'):
+            os.environ[_key] = 'fcmm4git'
+        for _key in ('GIT_AUTHOR_EMAIL', 'GIT_COMMITTER_EMAIL'):
+            os.environ[_key] = 'fcmm4git@test'
+        cmd_list = ['git -C "%s" init -q -b master' % (repo_path)]
+        for _i in range(3):
+            cmd_list.append('git -C "%s" commit -q --allow-empty -m "c%d"' % (repo_path, _i))
+            cmd_list.append('git -C "%s" branch tb-bak-%d' % (repo_path, _i))
+        os.makedirs(repo_path)
+        FCMMTools.run_sys_cmd_list(cmd_list)
+
+        thresholds = {'loose_refs': '2', 'loose_objects': '2', 'max_packs': '10',
+                      'graph_stale_refs': '0'}
+        stats = FCMMMaintain.measure(git_dir)
+        self.assertEqual(stats['loose_refs'], 4, '松散引用数')
+        self.assertEqual(stats['loose_objects'], 4, '松散对象数（3个提交及空树）')
+        self.assertEqual(stats['packs'], 0, '包数量')
+        self.assertEqual(stats['commit_graph'], 'missing', 'commit-graph不存在')
+        self.assertListEqual(FCMMMaintain.plan(stats, thresholds),
+                             ['pack-refs', 'repack', 'commit-graph'], '按阈值确定任务')
+
+        res = FCMMMaintain.run(repo_path, git_dir, thresholds, dry_run=True)
+        self.assertEqual(FCMMMaintain.measure(git_dir)['loose_objects'], 4, '只显示不执行')
+        res = FCMMMaintain.run(repo_path, git_dir, thresholds)
+        self.assertEqual(res[0], 0, '执行维护: %s' % (res[1]))
+        stats = FCMMMaintain.measure(git_dir)
+        self.assertEqual((stats['loose_refs'], stats['loose_objects'], stats['packs']), (0, 0, 1),
+                         '维护后的度量值')
+        self.assertEqual(stats['commit_graph'], 'ok', '写入commit-graph')
+        self.assertListEqual(FCMMMaintain.plan(stats, thresholds), [], '维护后不再需要维护')
+
+        res = FCMMMaintain.run(repo_path, git_dir, thresholds, time_budget=0.000001, force=True)
+        self.assertIn('skipped', res[1], '超过时间预算不再开始后续任务')
+
+    def test_diff_cache(self):
+        """
+        FCMMDiffCache
+        """
+        repo_path = os.path.realpath(TEST_PATH + 'diff_repo')
+        cache_path = repo_path + '/.git/fcmm4git/diff'
+        for _key in ('GIT_AUTHOR_NAME', 'GIT_COMMITTER_NAME'):
+            os.environ[_key] = 'fcmm4git'
+        for _key in ('GIT_AUTHOR_EMAIL', 'GIT_COMMITTER_EMAIL'):
+            os.environ[_key] = 'fcmm4git@test'
+        os.makedirs(repo_path)
+        FCMMTools.run_sys_cmd('git init -q -b master', cwd=repo_path)
+        commit_list = list()
+        # 文件名包含shell特殊字符，两个范围都修改，合并时需要按文件重新比较
+        q_name = '$(echo x) q.txt'
+        for _files in ({'a.txt': 'a\n', 'b.txt': 'b\n', q_name: 'q\n'},
+                       {'b.txt': 'b\nb2\n', 'c.txt': 'c\n', q_name: 'q\nq2\n'},
+                       {'b.txt': 'b\n', 'a.txt': None, q_name: 'q\nq2\nq3\n'}):
+            for _name, _text in _files.items():
+                if _text is None:
+                    os.remove(os.path.join(repo_path, _name))
+                else:
+                    with open(os.path.join(repo_path, _name), 'w', encoding='utf-8') as f:
+                        f.write(_text)
+            FCMMTools.run_sys_cmd_list(['git add -A', 'git commit -q -m "c%d"' % (
+                len(commit_list))], cwd=repo_path)
+            commit_list.append(FCMMTools.run_sys_cmd_with_output(
+                'git rev-parse HEAD', cwd=repo_path)[1].strip())
+        c0, c1, c2 = commit_list
+
+        def is_ancestor(ancestor, commit):
+            return FCMMTools.run_sys_cmd_with_output(
+                'git merge-base --is-ancestor %s %s' % (ancestor, commit), cwd=repo_path)[0] == 0
+
+        diff_info, source = FCMMDiffCache.get(repo_path, cache_path, c0, c1, is_ancestor)
+        self.assertEqual(source, 'computed', '直接计算')
+        self.assertDictEqual(diff_info['files'], {
+            'b.txt': ['M', 1, 0], 'c.txt': ['A', 1, 0], q_name: ['M', 1, 0]
+        }, '文件差异统计')
+        self.assertEqual(FCMMDiffCache.get(repo_path, cache_path, c0, c1, is_ancestor)[1],
+                         'cached', '使用缓存')
+        FCMMDiffCache.get(repo_path, cache_path, c1, c2, is_ancestor)
+
+        diff_info, source = FCMMDiffCache.get(repo_path, cache_path, c0, c2, is_ancestor)
+        self.assertEqual(source, 'composed', '复用相邻范围')
+        self.assertEqual([_commit[3] for _commit in diff_info['commits']], ['c2', 'c1'],
+                         '提交摘要从新到旧')
+        self.assertDictEqual(diff_info['files'], {
+            'a.txt': ['D', 0, 1], 'c.txt': ['A', 1, 0], q_name: ['M', 2, 0]
+        }, '两个范围都修改且已改回的文件不在结果中')
+        self.assertIn((c0, c2, 2), FCMMDiffCache.cached_pairs(cache_path), '缓存文件名包含提交数')
+        self.assertDictEqual(
+            FCMMDiffCache.get(repo_path, cache_path, c0, c2, is_ancestor, refresh=True)[0],
+            diff_info, '合并结果与直接计算一致')
+
+        # 零长度的范围不缓存，已存在的零长度缓存也不会被当作相邻范围复用（否则无限递归）
+        diff_info, source = FCMMDiffCache.get(repo_path, cache_path, c1, c1, is_ancestor)
+        self.assertEqual((source, diff_info['commits'], diff_info['files']), ('computed', [], {}),
+                         '零长度范围直接计算')
+        self.assertNotIn((c1, c1, 0), FCMMDiffCache.cached_pairs(cache_path), '零长度范围不缓存')
+        FCMMDiffCache.save(cache_path, {'from': c1, 'to': c1, 'commits': [], 'files': {}})
+        self.assertEqual(FCMMDiffCache.get(repo_path, cache_path, c1, c2, is_ancestor)[1],
+                         'cached', '忽略零长度的缓存范围')
+        os.remove(FCMMDiffCache.get_cache_file(cache_path, c1, c2, 1))
+        self.assertEqual(FCMMDiffCache.get(repo_path, cache_path, c1, c2, is_ancestor)[1],
+                         'computed', '忽略零长度的缓存范围')
+
+    def test_large_file(self):
+        """
+        FCMMLargeFile
+        """
+        repo_path = os.path.realpath(TEST_PATH + 'large_repo')
+        store_path = os.path.realpath(TEST_PATH + 'lfs-store')
+        os.makedirs(repo_path + '/sub')
+        FCMMTools.run_sys_cmd('git init -q -b master', cwd=repo_path)
+        with open(repo_path + '/small.txt', 'w', encoding='utf-8') as f:
+            f.write('small')
+        with open(repo_path + '/large.txt', 'w', encoding='utf-8') as f:
+            f.write('text\n' * 1000)
+        with open(repo_path + '/sub/large.bin', 'wb') as f:
+            f.write(b'\0\1' * 2000)
+
+        scan_res = FCMMLargeFile.scan(repo_path, 0.002, workers=2)
+        self.assertEqual((scan_res['files'], scan_res['small'][0]), (3, 1), '扫描文件数')
+        self.assertListEqual(scan_res['large_text'], [('large.txt', 5000)], '大文本文件')
+        self.assertListEqual(scan_res['large_binary'], [('sub/large.bin', 4000)], '大二进制文件')
+        self.assertIn('1 large binary', FCMMLargeFile.get_report(scan_res, 'lfs'), '大小报告')
+
+        res = FCMMLargeFile.stage_pointers(repo_path, store_path, ['sub/large.bin'], workers=2)
+        self.assertEqual(res[0], 0, '以指针提交')
+        res = FCMMTools.run_sys_cmd_with_output('git show :sub/large.bin', cwd=repo_path)
+        oid, size = FCMMLargeFile.parse_pointer(res[1])
+        self.assertEqual(size, 4000, '指针登记的文件大小')
+        with open(FCMMLargeFile.get_object_file(store_path, oid), 'rb') as f:
+            self.assertEqual(f.read(), b'\0\1' * 2000, '本地存储的文件内容')
+        FCMMTools.run_sys_cmd('git add -A', cwd=repo_path)
+        res = FCMMTools.run_sys_cmd_with_output('git show :sub/large.bin', cwd=repo_path)
+        self.assertEqual(FCMMLargeFile.parse_pointer(res[1]), (oid, size), '工作目录的原文件不再提交')
+        for _oid in ('../../../../etc/passwd', oid[0:63], oid.upper()):
+            self.assertIsNone(FCMMLargeFile.parse_pointer(FCMMLargeFile.get_pointer(_oid, size)),
+                              'oid必须是64位十六进制')
+
+        with open(repo_path + '/sub/large.bin', 'w', encoding='utf-8') as f:
+            f.write(FCMMLargeFile.get_pointer(oid, size))
+        res = FCMMLargeFile.restore(repo_path, store_path, ['sub/large.bin'])
+        self.assertEqual(res, [0, []], '从本地存储恢复')
+        with open(repo_path + '/sub/large.bin', 'rb') as f:
+            self.assertEqual(f.read(), b'\0\1' * 2000, '恢复的文件内容')
+
+
+    def test_shared_store(self):
+        """
+        FCMMSharedStore
+        """
+        repo_path = os.path.realpath(TEST_PATH + 'store_repo')
+        store_root = os.path.realpath(TEST_PATH + 'store')
+        lock_path = os.path.realpath(TEST_PATH + 'locks')
+        for _key in ('GIT_AUTHOR_NAME', 'GIT_COMMITTER_NAME'):
+            os.environ[_key] = 'fcmm4git'
+        for _key in ('GIT_AUTHOR_EMAIL', 'GIT_COMMITTER_EMAIL'):
+            os.environ[_key] = 'fcmm4git@test'
+        os.makedirs(repo_path)
+        FCMMTools.run_sys_cmd_list([
+            'git init -q -b master', 'git commit -q --allow-empty -m "c0"',
+            'git commit -q --allow-empty -m "c1"', 'git gc -q --prune=now'
+        ], cwd=repo_path)
+        c1 = FCMMTools.run_sys_cmd_with_output('git rev-parse HEAD', cwd=repo_path)[1].strip()
+
+        res = FCMMSharedStore.attach(store_root, 'https://test/store.git', repo_path, lock_path)
+        self.assertEqual(res[0], 0, '加入共享库')
+        store_path = FCMMSharedStore.get_store_path(store_root, 'https://test/store.git')
+
+        # c1只被本地reflog引用，共享库gc后仍需可用
+        FCMMTools.run_sys_cmd('git reset -q --hard HEAD~1', cwd=repo_path)
+        res = FCMMSharedStore.gc(store_path, lock_path, prune_expire='now')
+        self.assertEqual(res[0], 0, '共享库gc')
+        self.assertEqual(
+            FCMMTools.run_sys_cmd('git cat-file -e %s' % (c1), cwd=repo_path)[0], 0,
+            'reflog引用的提交未被清除')
+
+        # 默认不删除不可达对象：本地仓库fetch期间依赖的共享库对象在引用同步前不可达
+        FCMMTools.run_sys_cmd_list(['git reflog expire --expire=now --all', 'git gc -q --prune=now'],
+                                   cwd=repo_path)
+        res = FCMMSharedStore.gc(store_path, lock_path, cruft=True)
+        self.assertEqual(res[0], 0, '共享库gc（cruft）')
+        self.assertEqual(FCMMTools.run_sys_cmd('git cat-file -e %s' % (c1), cwd=store_path)[0], 0,
+                         '默认保留不可达对象')
+
+
+    def test_sparse_checkout(self):
+        """
+        FCMMGitTools稀疏检出状态
+        """
+        repo_path = os.path.realpath(TEST_PATH + 'sparse_repo')
+        for _key in ('GIT_AUTHOR_NAME', 'GIT_COMMITTER_NAME'):
+            os.environ[_key] = 'fcmm4git'
+        for _key in ('GIT_AUTHOR_EMAIL', 'GIT_COMMITTER_EMAIL'):
+            os.environ[_key] = 'fcmm4git@test'
+        os.makedirs(repo_path)
+        FCMMTools.run_sys_cmd('git init -q -b master', cwd=repo_path)
+        repo_info = FCMMGitTools.get_repo_info(repo_path)
+        fcmm_config = {'sparse_checkout': {'lb-cfg': ['config/**']}}
+
+        sparse_state = FCMMGitTools.get_sparse_checkout_state(repo_info, fcmm_config)
+        self.assertEqual(sparse_state, '', '未启用稀疏检出')
+        self.assertListEqual(
+            FCMMGitTools.get_sparse_checkout_cmds(fcmm_config, 'tb-dev-a', sparse_state),
+            [[], ''], '没有配置的分支类型不执行disable')
+
+        # 用户自己设置的稀疏检出不做修改
+        FCMMTools.run_sys_cmd('git sparse-checkout set --no-cone "docs/**"', cwd=repo_path)
+        sparse_state = FCMMGitTools.get_sparse_checkout_state(repo_info, fcmm_config)
+        self.assertEqual(sparse_state, 'user', '用户设置的稀疏检出')
+        self.assertListEqual(
+            FCMMGitTools.get_sparse_checkout_cmds(fcmm_config, 'lb-cfg-a', sparse_state),
+            [[], 'user'], '不覆盖用户的稀疏检出')
+        FCMMGitTools.save_sparse_checkout_state(repo_info, fcmm_config, sparse_state)
+        self.assertEqual(FCMMGitTools.get_sparse_checkout_state(repo_info, fcmm_config), 'user',
+                         '不登记用户的稀疏检出')
+
+        # fcmm应用的稀疏检出，切换到没有配置的分支类型时关闭
+        FCMMTools.run_sys_cmd('git sparse-checkout disable', cwd=repo_path)
+        for _name in ('.fcmm4git', 'config/a.txt', 'src/b.txt'):
+            os.makedirs(os.path.dirname(os.path.join(repo_path, _name)), exist_ok=True)
+            with open(os.path.join(repo_path, _name), 'w', encoding='utf-8') as f:
+                f.write(_name)
+        FCMMTools.run_sys_cmd_list(['git add -A', 'git commit -q -m "c0"'], cwd=repo_path)
+        cmd_list, new_state = FCMMGitTools.get_sparse_checkout_cmds(fcmm_config, 'lb-cfg-a', '')
+        self.assertEqual(new_state, 'fcmm', '应用稀疏检出配置')
+        FCMMTools.run_sys_cmd_list(cmd_list, cwd=repo_path)
+        self.assertListEqual(
+            [os.path.exists(os.path.join(repo_path, _name))
+             for _name in ('.fcmm4git', 'config/a.txt', 'src/b.txt')],
+            [True, True, False], '只检出配置的文件及根目录的.fcmm4git')
+        FCMMGitTools.save_sparse_checkout_state(repo_info, fcmm_config, '')
+        sparse_state = FCMMGitTools.get_sparse_checkout_state(repo_info, fcmm_config)
+        self.assertEqual(sparse_state, 'fcmm', '登记fcmm应用的稀疏检出')
+        self.assertListEqual(
+            FCMMGitTools.get_sparse_checkout_cmds(fcmm_config, 'master', sparse_state),
+            [['git sparse-checkout disable'], ''], '关闭fcmm应用的稀疏检出')
+
+
+    def test_backup_repo_delta(self):
+        """
+        FCMMGitTools.backup_repo_delta
+        """
+        origin_path = os.path.realpath(TEST_PATH + 'delta_origin')
+        repo_path = os.path.realpath(TEST_PATH + 'delta_repo')
+        save_path = os.path.realpath(TEST_PATH + 'delta_backup')
+        temp_path = os.path.realpath(TEST_PATH + 'delta_temp')
+        for _key in ('GIT_AUTHOR_NAME', 'GIT_COMMITTER_NAME'):
+            os.environ[_key] = 'fcmm4git'
+        for _key in ('GIT_AUTHOR_EMAIL', 'GIT_COMMITTER_EMAIL'):
+            os.environ[_key] = 'fcmm4git@test'
+        for _path in (origin_path, save_path, temp_path):
+            os.makedirs(_path)
+        FCMMTools.run_sys_cmd_list(['git init -q -b master', 'git commit -q --allow-empty -m "c0"'],
+                                   cwd=origin_path)
+
+        # 没有远程跟踪分支，不能增量备份
+        res = FCMMGitTools.backup_repo_delta(
+            FCMMGitTools.get_repo_info(origin_path), save_path, 'origin.delta.tar', temp_path)
+        self.assertEqual(res[0], 1, '没有远程跟踪分支时返回失败')
+        self.assertListEqual(os.listdir(save_path), [], '不生成备份文件')
+
+        FCMMTools.run_sys_cmd('git clone -q "%s" "%s"' % (origin_path, repo_path))
+        FCMMTools.run_sys_cmd('git commit -q --allow-empty -m "local"', cwd=repo_path)
+        with open(repo_path + '/new.txt', 'w', encoding='utf-8') as f:
+            f.write('new')
+        res = FCMMGitTools.backup_repo_delta(
+            FCMMGitTools.get_repo_info(repo_path), save_path, 'repo.delta.tar', temp_path)
+        self.assertEqual(res[0], 0, '增量备份')
+        with tarfile.open(os.path.join(save_path, 'repo.delta.tar'), 'r:gz') as tar:
+            self.assertListEqual(sorted(tar.getnames()),
+                                 ['files/new.txt', 'local-refs.bundle', 'manifest.json'], '备份内容')
+            tar.extract('local-refs.bundle', path=temp_path)
+        res = FCMMTools.run_sys_cmd_with_output(
+            'git bundle list-heads "%s"' % (os.path.join(temp_path, 'local-refs.bundle')), cwd=repo_path)
+        self.assertIn('HEAD', [_line.split(' ')[-1] for _line in res[1].splitlines()], 'bundle包括HEAD')
+        os.remove(os.path.join(temp_path, 'local-refs.bundle'))
+        self.assertListEqual(os.listdir(save_path), ['repo.delta.tar'], '中间文件不写入备份目录')
+        self.assertListEqual(os.listdir(temp_path), [], '删除临时工作目录')
+
+        # 没有仅在本地存在的提交，不生成bundle
+        clean_path = os.path.realpath(TEST_PATH + 'delta_clean')
+        FCMMTools.run_sys_cmd('git clone -q "%s" "%s"' % (origin_path, clean_path))
+        res = FCMMGitTools.backup_repo_delta(
+            FCMMGitTools.get_repo_info(clean_path), save_path, 'clean.delta.tar', temp_path)
+        self.assertEqual(res[0], 0, '没有本地提交的增量备份')
+        with tarfile.open(os.path.join(save_path, 'clean.delta.tar'), 'r:gz') as tar:
+            self.assertListEqual(tar.getnames(), ['manifest.json'], '没有本地提交时不生成bundle')
+        os.remove(os.path.join(save_path, 'clean.delta.tar'))
+
+        # 分离HEAD时获取当前分支出现异常，返回失败
+        FCMMTools.run_sys_cmd('git checkout -q --detach', cwd=repo_path)
+        RepoSession.get(repo_path).invalidate()
+        res = FCMMGitTools.backup_repo_delta(
+            FCMMGitTools.get_repo_info(repo_path), save_path, 'detach.delta.tar', temp_path)
+        self.assertEqual(res[0], 1, '出现异常时返回失败')
+        self.assertListEqual(os.listdir(save_path), ['repo.delta.tar'], '不保留未完成的备份文件')
+        self.assertListEqual(os.listdir(temp_path), [], '出现异常时删除临时工作目录')
+
+
+    def test_base_tags(self):
+        """
+        FCMMGitTools.get_base_tags
+        """
+        repo_path = os.path.realpath(TEST_PATH + 'tag_repo')
+        for _key in ('GIT_AUTHOR_NAME', 'GIT_COMMITTER_NAME'):
+            os.environ[_key] = 'fcmm4git'
+        for _key in ('GIT_AUTHOR_EMAIL', 'GIT_COMMITTER_EMAIL'):
+            os.environ[_key] = 'fcmm4git@test'
+        os.makedirs(repo_path)
+        FCMMTools.run_sys_cmd_list([
+            'git init -q -b master', 'git commit -q --allow-empty -m "c0"', 'git tag v0.0.1',
+            'git commit -q --allow-empty -m "c1"', 'git branch tb-req-a',
+            'git tag -a v0.0.2 -m "v0.0.2"', 'git checkout -q --orphan tb-dev-bare',
+            'git commit -q --allow-empty -m "bare"', 'git checkout -q master'
+        ], cwd=repo_path)
+        repo_info = FCMMGitTools.get_repo_info(repo_path)
+        ref_list = ['refs/heads/master', 'refs/heads/tb-req-a']
+        self.assertDictEqual(FCMMGitTools.get_base_tags(repo_info, ref_list), {
+            'refs/heads/master': 'v0.0.2', 'refs/heads/tb-req-a': 'v0.0.2'
+        }, '一次获取全部引用的标签')
+        self.assertDictEqual(
+            FCMMGitTools.get_base_tags(repo_info, ref_list + ['refs/heads/tb-dev-bare']), {
+                'refs/heads/master': 'v0.0.2', 'refs/heads/tb-req-a': 'v0.0.2',
+                'refs/heads/tb-dev-bare': ''
+            }, '有引用没有标签时逐个获取')
+
+
+    def test_mirror_cache_evict(self):
+        """
+        FCMMMirrorCache.evict
+        """
+        cache_path = os.path.realpath(TEST_PATH + 'mirrors')
+        lock_path = os.path.realpath(TEST_PATH + 'locks')
+        for _name, _text in (('old', '{"url": "a", "size": 10, "last_used": 1}'),
+                             ('broken', '{"url": "b", "si'),
+                             ('new', '{"url": "c", "size": 10, "last_used": 2}')):
+            os.makedirs(os.path.join(cache_path, _name))
+            with open(os.path.join(cache_path, _name, 'fcmm-cache.json'), 'w', encoding='utf-8') as f:
+                f.write(_text)
+        evicted = FCMMMirrorCache.evict(cache_path, lock_path, max_count=1)
+        self.assertListEqual([os.path.basename(_path) for _path in evicted], ['old'],
+                             '跳过信息文件损坏的镜像，按最后使用时间淘汰')
+        self.assertListEqual(sorted(os.listdir(cache_path)), ['broken', 'new'], '保留的镜像')
+
 
 if __name__ == '__main__':
     # 当程序自己独立运行时执行的操作